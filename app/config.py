@@ -30,7 +30,43 @@ class Settings(BaseSettings):
     default_cols: int = 30
     default_rows: int = 30
     max_image_size: int = 10 * 1024 * 1024  # 10MB
-    allowed_image_types: list[str] = ["image/png", "image/jpeg", "image/webp"]
+    upload_chunk_size: int = 256 * 1024  # Đọc upload theo chunk 256KB
+    upload_body_overhead: int = 64 * 1024  # Phần multipart ngoài file trong body
+    allowed_image_types: list[str] = ["image/png", "image/jpeg", "image/webp", "image/gif"]
+    max_image_pixels: int = 40_000_000  # Số pixel tối đa đọc từ header (chặn decompression bomb)
+    max_grid_cells: int = 1_000_000  # cols x rows tối đa của lưới đầu ra
+
+    # Conversion Worker Pool Settings
+    converter_workers: Optional[int] = None  # None = số CPU, 0 = chạy bằng thread
+    converter_max_queue: int = 64  # Số ảnh tối đa đang chờ/đang xử lý
+    converter_max_tasks_per_child: Optional[int] = 200  # Tái tạo worker sau N ảnh
+    max_batch_files: int = 200  # Số file tối đa mỗi request /image/convert/batch
+    max_variants: int = 32  # Số variant tối đa mỗi request /image/convert/variants
+    stream_band_rows: int = 32  # Số hàng lưới mỗi dải của /image/convert/stream
+    max_frames: int = 300  # Số frame tối đa của ảnh động (/image/convert/frames)
+    frame_batch: int = 8  # Số frame mỗi lượt decode trong worker
+
+    # Job Queue Settings (/jobs, trạng thái lưu trong collection imports)
+    job_workers: int = 2  # Số job chạy đồng thời
+    job_max_queue: int = 100  # Số job tối đa đang chờ
+    job_max_queued_bytes: int = 512 * 1024 * 1024  # Tổng bytes ảnh của các job chưa xong
+    job_item_concurrency: Optional[int] = None  # Item song song mỗi job, None = số worker
+    job_progress_batch: int = 20  # Ghi tiến độ + kết quả sau mỗi N item
+    job_progress_interval: float = 2.0  # hoặc sau N giây, tuỳ cái nào đến trước
+    job_results_collection: str = "import_results"
+
+    # Conversion Result Cache Settings
+    conversion_cache_max_bytes: int = 64 * 1024 * 1024  # LRU trong process
+    conversion_cache_persistent: bool = False  # Lưu thêm vào MongoDB
+    conversion_cache_collection: str = "conversion_cache"
+
+    # Compiled Palette Settings
+    palette_lut_bits: int = 6  # Số bit mỗi kênh của bảng tra RGB -> palette
+    palette_cache_size: int = 32  # Số palette đã biên dịch giữ trong LRU
+    palette_registry_ttl: float = 60.0  # Giây giữ palette đọc từ MongoDB trong RAM
+    palette_index_threshold: int = 32  # Palette nhiều màu hơn thì dùng lưới ứng viên
+    majority_block_size: int = 4  # Cạnh khối lượng tử hoá của downsample=majority
+    dither_strength: Optional[float] = None  # Biên độ Bayer (RGB), None = theo palette
 
     # Default Palette
     default_palette: dict[int, str] = {
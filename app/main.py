@@ -2,13 +2,47 @@
 Main FastAPI Application
 """
 
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from app.config import settings
-from app.modules.image_converter import router as image_router
-from app.modules.database import router as database_router, close_database_connection
+from app.modules.image_converter import (
+    router as image_router,
+    conversion_executor,
+    BodySizeLimitMiddleware,
+)
+from app.modules.database import (
+    router as database_router,
+    close_database_connection,
+    database_service,
+)
+from app.modules.jobs import router as jobs_router, job_manager
+
+
+async def prepare_database():
+    """
+    Đối chiếu index và ghi nameSort cho các history cũ
+
+    Chạy nền từ lifespan để MongoDB chậm/không kết nối được không chặn startup.
+    """
+    try:
+        report = await database_service.ensure_indexes()
+        created = sum(len(r["created"]) + len(r["rebuilt"]) for r in report.values())
+        print(f"🗂️  Indexes reconciled: {created} created/rebuilt")
+        for collection, result in report.items():
+            for name, error in result["failed"].items():
+                print(f"⚠️  Index {collection}.{name} failed: {error}")
+    except Exception as e:
+        print(f"⚠️  Index reconciliation failed: {e}")
+
+    try:
+        updated = await database_service.backfill_history_name_sort()
+        print(f"🔤 History nameSort backfilled: {updated}")
+    except Exception as e:
+        print(f"⚠️  History nameSort backfill failed: {e}")
 
 
 @asynccontextmanager
@@ -23,10 +57,24 @@ async def lifespan(app: FastAPI):
     print(f"🗄️  MongoDB: {settings.mongodb_uri}")
     print(f"💾 Database: {settings.mongodb_database}")
 
+    conversion_executor.start()
+    mode = "processes" if conversion_executor.uses_processes else "threads"
+    print(f"⚙️  Converter pool: {conversion_executor.workers} {mode}")
+
+    job_manager.start()
+    print(f"📋 Job workers: {job_manager.workers}")
+
+    prepare_task = asyncio.create_task(prepare_database())
+
     yield
 
     # Shutdown
     print("🛑 Shutting down...")
+    prepare_task.cancel()
+    await job_manager.shutdown()
+    print("✅ Job workers stopped")
+    conversion_executor.shutdown()
+    print("✅ Converter pool stopped")
     await close_database_connection()
     print("✅ Database connection closed")
 
@@ -48,9 +96,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Giới hạn body của các route upload trước khi multipart parser đọc hết
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={
+        "/image/convert": settings.max_image_size + settings.upload_body_overhead,
+        "/image/convert/variants": settings.max_image_size + settings.upload_body_overhead,
+        "/image/convert/stream": settings.max_image_size + settings.upload_body_overhead,
+        "/image/convert/frames": settings.max_image_size + settings.upload_body_overhead,
+        "/image/convert/level": settings.max_image_size + settings.upload_body_overhead,
+        "/image/convert/batch": settings.max_batch_files
+        * (settings.max_image_size + settings.upload_body_overhead),
+        "/jobs/convert": settings.max_batch_files
+        * (settings.max_image_size + settings.upload_body_overhead),
+    },
+)
+
 # Include routers
 app.include_router(image_router)
 app.include_router(database_router)
+app.include_router(jobs_router)
 
 
 @app.get("/")
@@ -63,6 +128,7 @@ async def root():
         "endpoints": {
             "image_converter": "/image",
             "database": "/db",
+            "jobs": "/jobs",
             "docs": "/docs",
             "health": "/healthz",
         },
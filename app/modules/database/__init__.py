@@ -4,6 +4,7 @@ Quản lý MongoDB operations
 """
 from .routes import router
 from .connection import get_database, close_database_connection
+from .service import database_service
 
-__all__ = ["router", "get_database", "close_database_connection"]
+__all__ = ["router", "get_database", "close_database_connection", "database_service"]
 
@@ -0,0 +1,189 @@
+"""
+Database Indexes
+Khai báo index của các collection, đối chiếu lúc startup và kiểm tra query plan
+"""
+from typing import Any
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config import settings
+
+# Index của từng collection. Mỗi index: {"keys": [(field, hướng)], option của
+# create_index (unique, partialFilterExpression...)}; tên sinh từ keys như
+# MongoDB ("updatedAt_1__id_1") nên khớp index đã tạo tay trước đây
+INDEXES: dict[str, list[dict[str, Any]]] = {
+    # List sort theo (field, _id) cùng chiều: một index phục vụ cả asc/desc và keyset cursor
+    "images": [
+        {"keys": [("created_at", 1), ("_id", 1)]},
+        {"keys": [("updated_at", 1), ("_id", 1)]},
+        {"keys": [("name", 1), ("_id", 1)]},
+    ],
+    "histories": [
+        # update/rename/delete lọc theo value.id; history cũ có thể thiếu id
+        {
+            "keys": [("value.id", 1)],
+            "unique": True,
+            "partialFilterExpression": {"value.id": {"$type": "string"}},
+        },
+        {"keys": [("updatedAt", 1), ("_id", 1)]},
+        {"keys": [("nameSort", 1), ("_id", 1)]},
+        {"keys": [("value.name", 1)]},
+    ],
+    "imports": [
+        {"keys": [("started_at", 1), ("_id", 1)]},
+    ],
+    "palettes": [
+        {"keys": [("created_at", 1)]},
+    ],
+    settings.job_results_collection: [
+        {"keys": [("import_id", 1), ("index", 1)]},
+    ],
+}
+
+# Field list_images được sort (mỗi field có index ở trên)
+IMAGE_SORT_FIELDS = ("created_at", "updated_at", "name")
+
+# Các option so sánh khi đối chiếu index đã có với khai báo
+_COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+# Dạng query của các service (filter, sort) để kiểm tra bằng explain()
+QUERY_SHAPES: list[dict[str, Any]] = [
+    {"name": "list_images", "collection": "images",
+     "sort": [("created_at", -1), ("_id", -1)]},
+    {"name": "list_histories", "collection": "histories",
+     "sort": [("updatedAt", -1), ("_id", -1)]},
+    {"name": "list_histories:name", "collection": "histories",
+     "sort": [("nameSort", 1), ("_id", 1)]},
+    {"name": "update_history", "collection": "histories", "filter": {"value.id": "?"}},
+    {"name": "list_imports", "collection": "imports",
+     "sort": [("started_at", -1), ("_id", -1)]},
+    {"name": "list_palettes", "collection": "palettes", "sort": [("created_at", -1)]},
+    {"name": "job_results", "collection": settings.job_results_collection,
+     "filter": {"import_id": "?"}, "sort": [("index", 1)]},
+]
+
+
+def index_name(keys: list[tuple[str, int]]) -> str:
+    """Tên index theo quy ước của MongoDB: field_hướng nối bằng "_" """
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def _matches(existing: dict, keys: list[tuple[str, int]], options: dict) -> bool:
+    """Index đã có có đúng keys và option như khai báo không"""
+    existing_keys = [
+        (field, direction if isinstance(direction, str) else int(direction))
+        for field, direction in existing["key"]
+    ]
+    if existing_keys != keys:
+        return False
+    return all(existing.get(option) == options.get(option) for option in _COMPARED_OPTIONS)
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> dict[str, dict]:
+    """
+    Đối chiếu index trong MongoDB với INDEXES (idempotent)
+
+    - Index chưa có: tạo mới
+    - Index cùng tên nhưng khác keys/option: xoá rồi tạo lại
+    - Index có sẵn nhưng không khai báo: giữ nguyên, chỉ báo trong "extra"
+    Lỗi của từng index (vd. dữ liệu trùng với index unique) được ghi vào
+    "failed", không dừng các index khác.
+
+    Args:
+        db: Database
+
+    Returns:
+        Báo cáo theo collection {"created", "rebuilt", "unchanged", "extra", "failed"}
+    """
+    report = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        result = {"created": [], "rebuilt": [], "unchanged": [], "extra": [], "failed": {}}
+
+        declared = set()
+        for index in indexes:
+            keys = index["keys"]
+            options = {k: v for k, v in index.items() if k != "keys"}
+            name = index_name(keys)
+            declared.add(name)
+
+            try:
+                if name in existing:
+                    if _matches(existing[name], keys, options):
+                        result["unchanged"].append(name)
+                        continue
+                    await collection.drop_index(name)
+                    await collection.create_index(keys, name=name, **options)
+                    result["rebuilt"].append(name)
+                else:
+                    await collection.create_index(keys, name=name, **options)
+                    result["created"].append(name)
+            except Exception as e:
+                result["failed"][name] = str(e)
+
+        result["extra"] = [name for name in existing if name not in declared and name != "_id_"]
+        report[collection_name] = result
+    return report
+
+
+def summarize_plan(explain: dict) -> dict:
+    """
+    Rút gọn kết quả explain(): chuỗi stage của winning plan và index dùng
+
+    Args:
+        explain: Kết quả cursor.explain()
+
+    Returns:
+        Dictionary {"stages": ["LIMIT", "FETCH", "IXSCAN"], "indexes": [...],
+        "collscan": bool, "docs_examined": int | None}
+    """
+    winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+    # MongoDB 7+ (engine SBE) bọc plan trong "queryPlan"
+    plan = winning.get("queryPlan", winning)
+
+    stages, indexes = [], []
+    pending = [plan]
+    while pending:
+        node = pending.pop(0)
+        if not node:
+            continue
+        stages.append(node.get("stage"))
+        if node.get("indexName"):
+            indexes.append(node["indexName"])
+        pending.extend(node.get("inputStages", []))
+        if node.get("inputStage"):
+            pending.append(node["inputStage"])
+
+    return {
+        "stages": stages,
+        "indexes": indexes,
+        "collscan": "COLLSCAN" in stages,
+        "docs_examined": explain.get("executionStats", {}).get("totalDocsExamined"),
+    }
+
+
+async def explain_queries(db: AsyncIOMotorDatabase) -> dict[str, dict]:
+    """
+    Chạy explain() cho từng dạng query trong QUERY_SHAPES
+
+    Args:
+        db: Database
+
+    Returns:
+        {tên query: {"collection", "filter", "sort", "plan" (summarize_plan)
+        hoặc "error"}}
+    """
+    report = {}
+    for shape in QUERY_SHAPES:
+        query = shape.get("filter", {})
+        entry = {"collection": shape["collection"], "filter": query, "sort": shape.get("sort")}
+        try:
+            cursor = db[shape["collection"]].find(query).limit(10)
+            if shape.get("sort"):
+                cursor = cursor.sort(shape["sort"])
+            entry["plan"] = summarize_plan(await cursor.explain())
+        except Exception as e:
+            entry["error"] = str(e)
+        report[shape["name"]] = entry
+    return report
@@ -291,3 +291,21 @@ class ImportCreateRequest(BaseModel):
     source: str
     total_items: int = 0
     metadata: Optional[dict[str, Any]] = None
+
+
+class PaletteCreateRequest(BaseModel):
+    """Request model cho tạo palette"""
+
+    name: str
+    colors: dict[int, str] = Field(
+        ..., description="Bảng màu {index: hex_color}, thứ tự quyết định màu ưu tiên khi hoà"
+    )
+    description: Optional[str] = None
+
+
+class PaletteUpdateRequest(BaseModel):
+    """Request model cho update palette"""
+
+    name: Optional[str] = None
+    colors: Optional[dict[int, str]] = None
+    description: Optional[str] = None
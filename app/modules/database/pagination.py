@@ -0,0 +1,154 @@
+"""
+Keyset Pagination
+Cursor token cho phân trang theo khóa sort + _id thay cho skip
+"""
+import base64
+import json
+from typing import Any, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+SortSpec = list[tuple[str, int]]
+
+
+def sort_spec(field: str, direction: int) -> SortSpec:
+    """
+    Sort theo field, _id cùng chiều để thứ tự ổn định (cần cho keyset)
+
+    Args:
+        field: Field sort chính
+        direction: 1 (asc) hoặc -1 (desc)
+
+    Returns:
+        [(field, direction), ("_id", direction)]
+    """
+    return [(field, direction), ("_id", direction)]
+
+
+def encode_cursor(doc: dict, sort: SortSpec) -> str:
+    """
+    Cursor token (base64url của JSON) trỏ tới ngay sau doc theo sort
+
+    Token chứa sort (field, chiều) và giá trị khóa sort + _id của doc.
+
+    Args:
+        doc: Document cuối của trang hiện tại (_id dạng string hoặc ObjectId)
+        sort: Sort của query
+
+    Returns:
+        Cursor token
+    """
+    (field, direction), _ = sort
+    payload = {"f": field, "d": direction, "v": doc.get(field), "id": str(doc["_id"])}
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, sort: SortSpec) -> dict[str, Any]:
+    """
+    Đổi cursor token thành filter lấy các document đứng sau nó
+
+    Args:
+        token: Cursor token từ next_cursor
+        sort: Sort của query hiện tại (phải trùng sort lúc tạo token)
+
+    Returns:
+        Filter MongoDB (range query trên index (field, _id))
+
+    Raises:
+        ValueError: Nếu token hỏng hoặc không khớp sort
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        value, last_id = payload["v"], ObjectId(payload["id"])
+        cursor_sort = (payload["f"], payload["d"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise ValueError("cursor không hợp lệ")
+
+    (field, direction), _ = sort
+    if cursor_sort != (field, direction):
+        raise ValueError("cursor không khớp sort_by/sort_order hiện tại")
+
+    op = "$gt" if direction == 1 else "$lt"
+    if value is None:
+        # null đứng trước mọi giá trị khác khi sort (field thiếu cũng là null)
+        after = [{field: None, "_id": {op: last_id}}]
+        if direction == 1:
+            after.append({field: {"$ne": None}})
+        return {"$or": after}
+
+    after = [{field: {op: value}}, {field: value, "_id": {op: last_id}}]
+    if direction == -1:
+        # $lt không so được với null nên thêm riêng các document null (đứng cuối)
+        after.append({field: None})
+    return {"$or": after}
+
+
+def next_cursor(docs: list[dict], limit: int, sort: SortSpec) -> Optional[str]:
+    """
+    Cursor cho trang sau (None nếu trang hiện tại chưa đầy, tức là đã hết)
+
+    Args:
+        docs: Các document của trang hiện tại
+        limit: Số document tối đa mỗi trang
+        sort: Sort của query
+
+    Returns:
+        Cursor token hoặc None
+    """
+    if not docs or len(docs) < limit:
+        return None
+    return encode_cursor(docs[-1], sort)
+
+
+def merge_filters(query: dict, cursor_filter: Optional[dict]) -> dict:
+    """Ghép filter của cursor vào query (dùng $and để không đè $or khác)"""
+    if not cursor_filter:
+        return query
+    if not query:
+        return cursor_filter
+    return {"$and": [query, cursor_filter]}
+
+
+def facet_pipeline(
+    query: dict,
+    sort: SortSpec,
+    skip: int,
+    limit: int,
+    projection: Optional[dict] = None,
+    cursor_filter: Optional[dict] = None,
+) -> list[dict]:
+    """
+    Pipeline lấy một trang và tổng số trong một aggregate ($facet)
+
+    $match của query đứng trước $facet nên vẫn dùng index; total đếm theo query
+    (không tính cursor) như count_documents. $sort trong $facet không dùng được
+    index (sort trong RAM) nên projection được áp trước $facet để sort document
+    nhỏ; projection luôn phải có field sort. Kết quả $facet là một document nên
+    cả trang phải dưới 16MB.
+
+    Args:
+        query: Filter của list
+        sort: Sort của query
+        skip: Số document bỏ qua
+        limit: Số document tối đa của trang
+        projection: Projection của các item (optional)
+        cursor_filter: Filter của cursor (optional, chỉ áp cho items)
+
+    Returns:
+        Pipeline trả về [{"items": [...], "total": [{"count": n}]}]
+    """
+    page = [{"$match": cursor_filter}] if cursor_filter else []
+    page.append({"$sort": dict(sort)})
+    if skip:
+        page.append({"$skip": skip})
+    page.append({"$limit": limit})
+
+    pipeline = [{"$match": query}]
+    if projection:
+        pipeline.append({"$project": projection})
+    return pipeline + [
+        {"$facet": {"items": page, "total": [{"$count": "count"}]}},
+    ]
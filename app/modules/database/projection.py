@@ -0,0 +1,97 @@
+"""
+List Projection
+Projection cho các list endpoint: view=summary hoặc danh sách fields tuỳ chọn
+"""
+import re
+from typing import Optional
+
+LIST_VIEWS = ("full", "summary")
+
+# Đường dẫn field dạng a.b.c, không cho toán tử ($...) hay ký tự lạ
+FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*$")
+
+# Field của view=summary: đủ cho màn hình danh sách, bỏ matrix/board nặng
+IMAGE_SUMMARY_FIELDS = (
+    "name", "url", "cols", "rows", "palette", "metadata", "created_at", "updated_at",
+)
+HISTORY_SUMMARY_FIELDS = (
+    "key",
+    "value.id",
+    "value.name",
+    "value.createdAt",
+    "value.updatedAt",
+    "value.level.id",
+    "value.level.config",
+    "value.level.difficultyScore",
+    "value.level.solvable",
+    "value.level.timestamp",
+    "updatedAt",
+    "timestamp",
+)
+
+
+def parse_fields(value: Optional[str]) -> Optional[list[str]]:
+    """
+    Parse query param fields dạng "name,cols,value.level.config"
+
+    Args:
+        value: Chuỗi các field cách nhau bởi dấu phẩy (None/rỗng = không chọn)
+
+    Returns:
+        Danh sách field hoặc None
+
+    Raises:
+        ValueError: Nếu có field không hợp lệ
+    """
+    if value is None or not value.strip():
+        return None
+
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    for field in fields:
+        if not FIELD_PATTERN.match(field):
+            raise ValueError(f"fields không hợp lệ: {field}")
+    return fields
+
+
+def list_projection(
+    view: str,
+    fields: Optional[list[str]],
+    summary_fields: tuple[str, ...],
+    sort: list[tuple[str, int]],
+) -> Optional[dict]:
+    """
+    Projection MongoDB cho một list query
+
+    fields (nếu có) được ưu tiên hơn view. Field sort luôn được giữ để tạo
+    next_cursor; _id luôn có.
+
+    Args:
+        view: "full" (cả document) hoặc "summary"
+        fields: Field client chọn (optional)
+        summary_fields: Field của view=summary cho collection này
+        sort: Sort của query
+
+    Returns:
+        Projection dạng inclusion hoặc None (lấy cả document)
+
+    Raises:
+        ValueError: Nếu view không hợp lệ
+    """
+    if view not in LIST_VIEWS:
+        raise ValueError(f"view phải là một trong {', '.join(LIST_VIEWS)}")
+
+    if fields:
+        selected = list(fields)
+    elif view == "summary":
+        selected = list(summary_fields)
+    else:
+        return None
+
+    selected.extend(field for field, _ in sort if field != "_id")
+
+    # MongoDB báo lỗi path collision nếu chọn cả "value" lẫn "value.name"
+    projection = {}
+    for field in sorted(set(selected)):
+        if not any(field.startswith(parent + ".") for parent in projection):
+            projection[field] = 1
+    return projection
@@ -7,7 +7,12 @@ from fastapi import APIRouter, HTTPException, Query
 from typing import Optional
 
 from app.utils.helpers import format_response
-from .service import database_service
+from app.modules.image_converter.registry import palette_registry
+from app.modules.image_converter.utils import parse_palette
+from .indexes import IMAGE_SORT_FIELDS
+from .pagination import next_cursor, sort_spec
+from .projection import parse_fields
+from .service import IMPORT_SORT, database_service
 from .models import (
     HistoryLevelModel,
     ImageCreateRequest,
@@ -16,11 +21,38 @@ from .models import (
     HistoryUpdateRequest,
     HistoryItemCreateRequest,
     ImportCreateRequest,
+    PaletteCreateRequest,
+    PaletteUpdateRequest,
 )
 
 router = APIRouter(prefix="/api", tags=["Database"])
 
 
+def page_info(page: dict, skip: int, limit: int, cursor: Optional[str], sort) -> dict:
+    """
+    Block pagination của list response
+
+    Args:
+        page: Kết quả list_*_page ({"items", "total", "estimated", "has_more"})
+        skip: Số documents bỏ qua
+        limit: Số documents tối đa
+        cursor: Cursor của request (optional)
+        sort: Sort của query (tạo next_cursor)
+
+    Returns:
+        Dictionary {skip, limit, total, total_estimated, has_more, cursor, next_cursor}
+    """
+    return {
+        "skip": skip,
+        "limit": limit,
+        "total": page["total"],
+        "total_estimated": page["estimated"],
+        "has_more": page["has_more"],
+        "cursor": cursor,
+        "next_cursor": next_cursor(page["items"], limit, sort) if page["has_more"] else None,
+    }
+
+
 # ==================== IMAGES ENDPOINTS ====================
 
 
@@ -69,32 +101,53 @@ async def get_image(image_id: str):
 async def list_images(
     skip: int = Query(0, ge=0, description="Số documents bỏ qua"),
     limit: int = Query(10, ge=1, le=100, description="Số documents tối đa"),
-    sort_by: str = Query("created_at", description="Field để sort"),
+    sort_by: str = Query(
+        "created_at", description="Field để sort: created_at, updated_at hoặc name"
+    ),
     sort_order: int = Query(-1, ge=-1, le=1, description="1 (asc) hoặc -1 (desc)"),
+    cursor: Optional[str] = Query(None, description="next_cursor của trang trước"),
+    view: str = Query("full", description="full hoặc summary (không có matrix)"),
+    fields: Optional[str] = Query(None, description="Chỉ lấy các field, vd. name,cols,rows"),
+    include_total: bool = Query(True, description="False: bỏ total (infinite scroll)"),
 ):
     """
     Lấy danh sách images với phân trang
 
+    - **sort_by**: created_at, updated_at hoặc name (các field có index)
+    - **cursor**: next_cursor của trang trước (keyset, thay cho skip ở trang sâu)
+    - **view**: summary bỏ matrix; lấy matrix qua GET /images/{image_id}
+    - **fields**: Danh sách field cách nhau bởi dấu phẩy (ưu tiên hơn view)
+    - **include_total**: total là số ước lượng (estimated_document_count);
+      False thì không đếm, has_more vẫn đúng
+
     Returns:
         List of images
     """
+    if sort_by not in IMAGE_SORT_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"sort_by must be one of {', '.join(IMAGE_SORT_FIELDS)}",
+        )
+
     try:
-        items = await database_service.list_images(skip, limit, sort_by, sort_order)
-        total = await database_service.count_images()
+        page = await database_service.list_images_page(
+            skip, limit, sort_by, sort_order, cursor, view, parse_fields(fields),
+            include_total,
+        )
+        items = page["items"]
 
         return format_response(
             success=True,
             message=f"Retrieved {len(items)} images",
             data={
                 "items": items,
-                "pagination": {
-                    "skip": skip,
-                    "limit": limit,
-                    "total": total,
-                    "has_more": skip + limit < total,
-                },
+                "pagination": page_info(
+                    page, skip, limit, cursor, sort_spec(sort_by, sort_order)
+                ),
             },
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -170,6 +223,10 @@ async def list_histories(
     limit: int = Query(10, ge=1, le=100),
     sort_by: str = Query("updatedAt", description="Sort field: 'name' or 'updatedAt'"),
     sort_order: str = Query("desc", description="Sort order: 'asc' or 'desc'"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    view: str = Query("full", description="'full' or 'summary' (no board/containers)"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    include_total: bool = Query(True, description="False skips the total count"),
 ):
     """
     Lấy danh sách histories với sorting và search
@@ -177,6 +234,10 @@ async def list_histories(
     - **search**: Tìm kiếm theo name (case-insensitive)
     - **sort_by**: Field để sort ('name' hoặc 'updatedAt')
     - **sort_order**: Thứ tự sort ('asc' hoặc 'desc')
+    - **cursor**: next_cursor của trang trước (keyset, thay cho skip ở trang sâu)
+    - **view**: summary chỉ lấy tên, config, timestamps; board lấy qua GET /histories/{id}
+    - **fields**: Danh sách field cách nhau bởi dấu phẩy (ưu tiên hơn view)
+    - **include_total**: False thì không đếm total (infinite scroll), has_more vẫn đúng
     """
     try:
         # Validate sort parameters
@@ -189,10 +250,11 @@ async def list_histories(
                 status_code=400, detail="sort_order must be 'asc' or 'desc'"
             )
 
-        items = await database_service.list_histories(
-            collection, document_id, skip, limit, sort_by, sort_order, search
+        page = await database_service.list_histories_page(
+            collection, document_id, skip, limit, sort_by, sort_order, search, cursor,
+            view, parse_fields(fields), include_total,
         )
-        total = await database_service.count_histories(collection, document_id, search)
+        items = page["items"]
 
         message = f"Retrieved {len(items)} histories"
         if search:
@@ -203,12 +265,10 @@ async def list_histories(
             message=message,
             data={
                 "items": items,
-                "pagination": {
-                    "skip": skip,
-                    "limit": limit,
-                    "total": total,
-                    "has_more": skip + limit < total,
-                },
+                "pagination": page_info(
+                    page, skip, limit, cursor,
+                    database_service.history_sort(sort_by, sort_order),
+                ),
                 "sort": {
                     "by": sort_by,
                     "order": sort_order,
@@ -218,10 +278,33 @@ async def list_histories(
         )
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/histories/{history_id}")
+async def get_history(history_id: str):
+    """
+    Lấy history theo ID (cả board/containers, khác view=summary của danh sách)
+
+    Args:
+        history_id: ID (value.id, như PUT/DELETE) của history; _id vẫn dùng được
+
+    Returns:
+        History document
+    """
+    result = await database_service.get_history(history_id)
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="History not found")
+
+    return format_response(
+        success=True, message="History retrieved successfully", data=result
+    )
+
+
 @router.delete("/histories/{history_id}")
 async def delete_history(history_id: str):
     """Xóa history"""
@@ -337,15 +420,187 @@ async def update_import_status(
 
 @router.get("/imports")
 async def list_imports(
-    skip: int = Query(0, ge=0), limit: int = Query(10, ge=1, le=100)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor của trang trước"),
 ):
-    """Lấy danh sách imports"""
+    """
+    Lấy danh sách imports, mới nhất trước
+
+    - **cursor**: next_cursor của trang trước (keyset, thay cho skip ở trang sâu)
+    """
     try:
-        items = await database_service.list_imports(skip, limit)
+        page = await database_service.list_imports_page(skip, limit, cursor)
+        items = page["items"]
         return format_response(
             success=True,
             message=f"Retrieved {len(items)} imports",
-            data={"items": items},
+            data={
+                "items": items,
+                "pagination": {
+                    "skip": skip,
+                    "limit": limit,
+                    "has_more": page["has_more"],
+                    "cursor": cursor,
+                    "next_cursor": (
+                        next_cursor(items, limit, IMPORT_SORT) if page["has_more"] else None
+                    ),
+                },
+            },
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ==================== PALETTES ENDPOINTS ====================
+
+
+@router.post("/palettes")
+async def create_palette(data: PaletteCreateRequest):
+    """
+    Tạo palette đặt tên, dùng qua palette_id của /image/convert
+
+    Args:
+        data: PaletteCreateRequest
+
+    Returns:
+        Created palette document
+    """
+    try:
+        parse_palette(data.colors)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        result = await database_service.create_palette(data)
+        return format_response(
+            success=True, message="Palette created successfully", data=result
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/palettes")
+async def list_palettes(
+    skip: int = Query(0, ge=0, description="Số documents bỏ qua"),
+    limit: int = Query(10, ge=1, le=100, description="Số documents tối đa"),
+):
+    """
+    Lấy danh sách palettes
+
+    Returns:
+        List of palettes
+    """
+    items = await database_service.list_palettes(skip, limit)
+    return format_response(
+        success=True, message=f"Retrieved {len(items)} palettes", data=items
+    )
+
+
+@router.get("/palettes/{palette_id}")
+async def get_palette(palette_id: str):
+    """
+    Lấy palette theo ID
+
+    Args:
+        palette_id: ID của palette
+
+    Returns:
+        Palette document
+    """
+    result = await database_service.get_palette(palette_id)
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="Palette not found")
+
+    return format_response(
+        success=True, message="Palette retrieved successfully", data=result
+    )
+
+
+@router.put("/palettes/{palette_id}")
+async def update_palette(palette_id: str, data: PaletteUpdateRequest):
+    """
+    Cập nhật palette (bản đã cache của palette được bỏ ngay)
+
+    Args:
+        palette_id: ID của palette
+        data: PaletteUpdateRequest
+
+    Returns:
+        Updated palette document
+    """
+    if data.colors is not None:
+        try:
+            parse_palette(data.colors)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    result = await database_service.update_palette(palette_id, data)
+    palette_registry.invalidate(palette_id)
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="Palette not found")
+
+    return format_response(
+        success=True, message="Palette updated successfully", data=result
+    )
+
+
+@router.delete("/palettes/{palette_id}")
+async def delete_palette(palette_id: str):
+    """
+    Xóa palette
+
+    Args:
+        palette_id: ID của palette
+
+    Returns:
+        Success message
+    """
+    success = await database_service.delete_palette(palette_id)
+    palette_registry.invalidate(palette_id)
+
+    if not success:
+        raise HTTPException(status_code=404, detail="Palette not found")
+
+    return format_response(success=True, message="Palette deleted successfully")
+
+
+# ==================== DIAGNOSTICS ENDPOINTS ====================
+
+
+@router.post("/diagnostics/indexes")
+async def ensure_indexes():
+    """
+    Đối chiếu lại index với khai báo (như lúc startup) và trả báo cáo
+
+    Mỗi collection có created/rebuilt/unchanged, extra (index không khai
+    báo, được giữ nguyên) và failed (vd. dữ liệu trùng với index unique).
+    """
+    try:
+        report = await database_service.ensure_indexes()
+        return format_response(
+            success=True, message="Indexes reconciled", data=report
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/diagnostics/query-plans")
+async def get_query_plans():
+    """
+    Winning plan (explain) của từng dạng query mà service dùng
+
+    Mỗi query trả chuỗi stage (vd. LIMIT → FETCH → IXSCAN), index được
+    chọn và collscan=true nếu phải quét cả collection.
+    """
+    try:
+        plans = await database_service.explain_queries()
+        return format_response(
+            success=True, message=f"Explained {len(plans)} queries", data=plans
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
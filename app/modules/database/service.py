@@ -2,18 +2,29 @@
 Database Service
 Business logic cho MongoDB operations
 """
-
+import asyncio
 from typing import Optional, Any
 from datetime import datetime
 from bson import ObjectId
+from pymongo import UpdateOne
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.utils.helpers import (
     validate_object_id,
     get_current_timestamp,
-    sort_histories_by_name,
+    history_name_sort_key,
+    matrix_color_counts,
 )
 from .connection import get_database
+from .indexes import IMAGE_SORT_FIELDS, ensure_indexes, explain_queries
+from .pagination import (
+    SortSpec,
+    decode_cursor,
+    facet_pipeline,
+    merge_filters,
+    sort_spec,
+)
+from .projection import HISTORY_SUMMARY_FIELDS, IMAGE_SUMMARY_FIELDS, list_projection
 from .models import (
     HistoryLevelModel,
     ImageCreateRequest,
@@ -22,9 +33,26 @@ from .models import (
     HistoryUpdateRequest,
     HistoryItemCreateRequest,
     ImportCreateRequest,
+    PaletteCreateRequest,
+    PaletteUpdateRequest,
 )
 
 
+def color_stats(matrix: list[list[int]]) -> dict:
+    """
+    Thống kê màu của matrix lưu vào metadata (danh sách không cần đọc matrix)
+
+    Returns:
+        Dictionary {"counts": {index: số ô}, "color_count": số màu}
+    """
+    counts = matrix_color_counts(matrix)
+    return {"counts": counts, "color_count": len(counts)}
+
+
+# Sort của list_imports (mới nhất trước)
+IMPORT_SORT = sort_spec("started_at", -1)
+
+
 class DatabaseService:
     """Service xử lý các operations với MongoDB"""
 
@@ -33,6 +61,7 @@ class DatabaseService:
         self.images = self.db.images
         self.histories = self.db.histories
         self.imports = self.db.imports
+        self.palettes = self.db.palettes
 
     # ==================== IMAGES OPERATIONS ====================
 
@@ -47,6 +76,7 @@ class DatabaseService:
             Dictionary chứa inserted_id và document
         """
         doc = data.model_dump()
+        doc["metadata"] = {**(doc.get("metadata") or {}), **color_stats(data.matrix)}
         doc["created_at"] = get_current_timestamp()
         doc["updated_at"] = get_current_timestamp()
 
@@ -79,20 +109,39 @@ class DatabaseService:
         limit: int = 10,
         sort_by: str = "created_at",
         sort_order: int = -1,
+        cursor: Optional[str] = None,
+        view: str = "full",
+        fields: Optional[list[str]] = None,
     ) -> list[dict]:
         """
         Lấy danh sách images
 
         Args:
-            skip: Số documents bỏ qua
+            skip: Số documents bỏ qua (bỏ qua khi có cursor)
             limit: Số documents tối đa
-            sort_by: Field để sort
+            sort_by: Field để sort (một trong IMAGE_SORT_FIELDS, đều có index)
             sort_order: 1 (ascending) hoặc -1 (descending)
+            cursor: Cursor token (next_cursor của trang trước, optional)
+            view: "full" (cả document) hoặc "summary" (không có matrix)
+            fields: Chỉ lấy các field này (optional, ưu tiên hơn view)
 
         Returns:
             List of dictionaries
+
+        Raises:
+            ValueError: Nếu sort_by không nằm trong IMAGE_SORT_FIELDS, cursor
+                hoặc view sai
         """
-        cursor = self.images.find().sort(sort_by, sort_order).skip(skip).limit(limit)
+        if sort_by not in IMAGE_SORT_FIELDS:
+            raise ValueError(f"sort_by phải là một trong {', '.join(IMAGE_SORT_FIELDS)}")
+
+        sort = sort_spec(sort_by, sort_order)
+        projection = list_projection(view, fields, IMAGE_SUMMARY_FIELDS, sort)
+        query = {}
+        if cursor:
+            query, skip = decode_cursor(cursor, sort), 0
+
+        cursor = self.images.find(query, projection).sort(sort).skip(skip).limit(limit)
         docs = await cursor.to_list(length=limit)
 
         for doc in docs:
@@ -100,6 +149,48 @@ class DatabaseService:
 
         return docs
 
+    async def list_images_page(
+        self,
+        skip: int = 0,
+        limit: int = 100,
+        sort_by: str = "created_at",
+        sort_order: int = -1,
+        cursor: Optional[str] = None,
+        view: str = "full",
+        fields: Optional[list[str]] = None,
+        include_total: bool = True,
+    ) -> dict:
+        """
+        Một trang images kèm tổng số
+
+        Trang lấy limit + 1 document: document thừa cho biết còn trang sau.
+        List images không có filter nên total là estimated_document_count
+        (metadata của collection, không quét), chạy song song với query trang.
+
+        Args:
+            Như list_images, thêm:
+            include_total: Có tính tổng số không (False cho infinite scroll)
+
+        Returns:
+            Dictionary {"items", "total" (None nếu include_total=False),
+            "estimated", "has_more"}
+
+        Raises:
+            ValueError: Nếu sort_by, cursor hoặc view sai
+        """
+        page = self.list_images(skip, limit + 1, sort_by, sort_order, cursor, view, fields)
+        if include_total:
+            docs, total = await asyncio.gather(page, self.images.estimated_document_count())
+        else:
+            docs, total = await page, None
+
+        return {
+            "items": docs[:limit],
+            "total": total,
+            "estimated": include_total,
+            "has_more": len(docs) > limit,
+        }
+
     async def update_image(
         self, image_id: str, data: ImageUpdateRequest
     ) -> Optional[dict]:
@@ -122,6 +213,26 @@ class DatabaseService:
         if not update_data:
             return await self.get_image(image_id)
 
+        if "matrix" in update_data or "metadata" in update_data:
+            # counts/color_count do server tính: matrix đổi thì tính lại, chỉ
+            # metadata đổi thì giữ giá trị cũ
+            current = await self.images.find_one(
+                {"_id": ObjectId(image_id)}, {"metadata": 1}
+            )
+            if current is None:
+                return None
+            current_metadata = current.get("metadata") or {}
+            if "matrix" in update_data:
+                stats = color_stats(data.matrix)
+            else:
+                stats = {
+                    k: current_metadata[k]
+                    for k in ("counts", "color_count")
+                    if k in current_metadata
+                }
+            metadata = update_data.get("metadata", current_metadata)
+            update_data["metadata"] = {**metadata, **stats}
+
         update_data["updated_at"] = get_current_timestamp()
 
         result = await self.images.update_one(
@@ -169,6 +280,7 @@ class DatabaseService:
         """Tạo history record"""
         doc = data.model_dump()
         doc["timestamp"] = get_current_timestamp()
+        doc["nameSort"] = history_name_sort_key(doc["value"].get("name"))
 
         result = await self.histories.insert_one(doc)
         doc["_id"] = str(result.inserted_id)
@@ -184,6 +296,9 @@ class DatabaseService:
         sort_by: str = "updatedAt",
         sort_order: str = "desc",
         search: Optional[str] = None,
+        cursor: Optional[str] = None,
+        view: str = "full",
+        fields: Optional[list[str]] = None,
     ) -> list[dict]:
         """
         Lấy danh sách histories với sorting và search
@@ -191,83 +306,177 @@ class DatabaseService:
         Args:
             collection: Filter theo collection (optional)
             document_id: Filter theo document_id (optional)
-            skip: Số records bỏ qua
+            skip: Số records bỏ qua (bỏ qua khi có cursor)
             limit: Số records tối đa
-            sort_by: Field để sort ('name' hoặc 'updatedAt')
+            sort_by: Field để sort ('name' hoặc 'updatedAt'); name sort số
+                theo giá trị ("4" < "41"), số trước text như sort_histories_by_name
             sort_order: Thứ tự sort ('asc' hoặc 'desc')
             search: Tìm kiếm theo name (case-insensitive)
+            cursor: Cursor token (next_cursor của trang trước, optional)
+            view: "full" (cả document) hoặc "summary" (tên, config, timestamps;
+                không có board/containers)
+            fields: Chỉ lấy các field này (optional, ưu tiên hơn view)
 
         Returns:
-            List of history documents
+            List of history documents (chỉ một trang)
+
+        Raises:
+            ValueError: Nếu cursor/view không hợp lệ hoặc cursor không khớp sort
         """
-        query = {}
-        if collection:
-            query["collection"] = collection
-        if document_id:
-            query["document_id"] = document_id
+        query = self.history_filter(collection, document_id, search)
 
-        # Add search filter
-        if search:
-            # Case-insensitive regex search on value.name
-            query["value.name"] = {"$regex": search, "$options": "i"}
+        # Sort, skip, limit đều chạy trong MongoDB: name sort theo nameSort
+        # (khóa dạng string đã mã hoá thứ tự số, có index), _id để phân trang ổn định
+        sort = self.history_sort(sort_by, sort_order)
+        projection = list_projection(view, fields, HISTORY_SUMMARY_FIELDS, sort)
+        if cursor:
+            query, skip = merge_filters(query, decode_cursor(cursor, sort)), 0
 
-        # Nếu sort by name hoặc có search, cần fetch tất cả rồi sort ở application level
-        # vì name có thể là số dạng string ("4", "41", "51")
-        if sort_by == "name" or search:
-            # Fetch tất cả documents matching query
-            cursor = self.histories.find(query)
-            all_docs = await cursor.to_list(length=None)
+        cursor = (
+            self.histories.find(query, projection).sort(sort).skip(skip).limit(limit)
+        )
+        docs = await cursor.to_list(length=limit)
 
-            # Convert ObjectId to string
-            for doc in all_docs:
-                doc["_id"] = str(doc["_id"])
+        for doc in docs:
+            doc["_id"] = str(doc["_id"])
 
-            # Sort by name với numeric comparison
-            if sort_by == "name":
-                sorted_docs = sort_histories_by_name(all_docs, sort_order)
-            else:
-                # Sort by updatedAt
-                sorted_docs = sorted(
-                    all_docs,
-                    key=lambda x: x.get("updatedAt", ""),
-                    reverse=(sort_order == "desc"),
-                )
+        return docs
 
-            # Apply pagination
-            paginated_docs = sorted_docs[skip : skip + limit]
+    async def list_histories_page(
+        self,
+        collection: Optional[str] = None,
+        document_id: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+        sort_by: str = "updatedAt",
+        sort_order: str = "desc",
+        search: Optional[str] = None,
+        cursor: Optional[str] = None,
+        view: str = "full",
+        fields: Optional[list[str]] = None,
+        include_total: bool = True,
+    ) -> dict:
+        """
+        Một trang histories kèm tổng số, ít round-trip nhất có thể
+
+        Trang lấy limit + 1 document: document thừa cho biết còn trang sau.
+        - include_total=False: chỉ query trang (infinite scroll)
+        - Không có filter: total = estimated_document_count (metadata, không
+          quét collection), chạy song song với query trang
+        - Có search và có projection (view/fields): một aggregate $facet trả cả
+          trang lẫn total, regex search (không dùng được index) chỉ quét một lần
+        - Còn lại (filter collection/document_id không search, hoặc view=full):
+          query trang và count_documents chạy song song; cả hai dùng index, còn
+          $sort trong $facet thì không (trang full còn có thể vượt 16MB)
 
-            return paginated_docs
-        else:
-            # Sort by updatedAt - có thể dùng MongoDB sort
-            sort_direction = 1 if sort_order == "asc" else -1
-
-            cursor = (
-                self.histories.find(query)
-                .sort("updatedAt", sort_direction)
-                .skip(skip)
-                .limit(limit)
-            )
-            docs = await cursor.to_list(length=limit)
+        Args:
+            Như list_histories, thêm:
+            include_total: Có tính tổng số không
+
+        Returns:
+            Dictionary {"items", "total" (None nếu include_total=False),
+            "estimated" (total là ước lượng), "has_more"}
 
+        Raises:
+            ValueError: Nếu cursor/view không hợp lệ hoặc cursor không khớp sort
+        """
+        query = self.history_filter(collection, document_id, search)
+        sort = self.history_sort(sort_by, sort_order)
+        projection = list_projection(view, fields, HISTORY_SUMMARY_FIELDS, sort)
+
+        if include_total and search and projection:
+            cursor_filter = decode_cursor(cursor, sort) if cursor else None
+            pipeline = facet_pipeline(
+                query, sort, 0 if cursor else skip, limit + 1, projection, cursor_filter
+            )
+            result = await self.histories.aggregate(pipeline).to_list(length=1)
+            docs = result[0]["items"] if result else []
+            totals = result[0]["total"] if result else []
             for doc in docs:
                 doc["_id"] = str(doc["_id"])
+            return {
+                "items": docs[:limit],
+                "total": totals[0]["count"] if totals else 0,
+                "estimated": False,
+                "has_more": len(docs) > limit,
+            }
+
+        page = self.list_histories(
+            collection, document_id, skip, limit + 1, sort_by, sort_order, search, cursor,
+            view, fields,
+        )
+        if not include_total:
+            docs, total = await page, None
+        elif query:
+            docs, total = await asyncio.gather(page, self.histories.count_documents(query))
+        else:
+            docs, total = await asyncio.gather(
+                page, self.histories.estimated_document_count()
+            )
+
+        return {
+            "items": docs[:limit],
+            "total": total,
+            "estimated": include_total and not query,
+            "has_more": len(docs) > limit,
+        }
+
+    def history_filter(
+        self,
+        collection: Optional[str] = None,
+        document_id: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> dict:
+        """
+        Filter của list_histories/count_histories
+
+        Args:
+            collection: Filter theo collection (optional)
+            document_id: Filter theo document_id (optional)
+            search: Tìm kiếm theo name, case-insensitive (optional)
+
+        Returns:
+            Query filter ({} nếu không lọc gì)
+        """
+        query = {}
+        if collection:
+            query["collection"] = collection
+        if document_id:
+            query["document_id"] = document_id
+        if search:
+            query["value.name"] = {"$regex": search, "$options": "i"}
+        return query
+
+    def history_sort(self, sort_by: str = "updatedAt", sort_order: str = "desc") -> SortSpec:
+        """
+        Sort của list_histories: name dùng nameSort, kèm _id cùng chiều
+
+        Args:
+            sort_by: 'name' hoặc 'updatedAt'
+            sort_order: 'asc' hoặc 'desc'
 
-            return docs
+        Returns:
+            Sort spec cho find().sort() và cursor token
+        """
+        field = "nameSort" if sort_by == "name" else "updatedAt"
+        return sort_spec(field, 1 if sort_order == "asc" else -1)
 
     async def get_history(self, history_id: str) -> Optional[dict]:
         """
         Lấy history theo ID
 
+        ID là value.id như PUT/DELETE /histories/{history_id}; chỉ khi không có
+        history nào mang value.id đó và ID là ObjectId hợp lệ mới tìm theo _id.
+
         Args:
-            history_id: History ID
+            history_id: History ID (value.id, hoặc _id)
 
         Returns:
             History document hoặc None
         """
-        if not validate_object_id(history_id):
-            return None
-
-        doc = await self.histories.find_one({"_id": ObjectId(history_id)})
+        doc = await self.histories.find_one({"value.id": history_id})
+        if doc is None and validate_object_id(history_id):
+            doc = await self.histories.find_one({"_id": ObjectId(history_id)})
         if doc:
             doc["_id"] = str(doc["_id"])
         return doc
@@ -287,7 +496,7 @@ class DatabaseService:
         """
         current_time = get_current_timestamp()
 
-        # Update value.level với data mới
+        # Update value.level với data mới (value.name không đổi nên nameSort giữ nguyên)
         update_data = {
             "value.level": data.model_dump(),
             "value.updatedAt": current_time,
@@ -319,6 +528,7 @@ class DatabaseService:
             {
                 "$set": {
                     "value.name": name,
+                    "nameSort": history_name_sort_key(name),
                     "value.updatedAt": get_current_timestamp(),
                     "updatedAt": get_current_timestamp(),
                 }
@@ -346,7 +556,17 @@ class DatabaseService:
 
     async def create_history_item(self, data: HistoryItemCreateRequest) -> dict:
         """
-        Tạo history item với auto-generation cho missing fields
+        Tạo history item với auto-generation cho missing fields (xem insert_history_item)
+        """
+        return await self.insert_history_item(data.model_dump())
+
+    async def insert_history_item(self, doc: dict) -> dict:
+        """
+        Lưu history item đã có dạng dict (đã validate hoặc do server dựng),
+        auto-generate các field còn thiếu
+
+        Dùng trực tiếp khi board do server dựng (vd. /image/convert/level) để
+        không phải validate Pydantic từng ô của board.
 
         Auto-generates:
         - value.id (nếu không có)
@@ -357,11 +577,17 @@ class DatabaseService:
         - value.createdAt (nếu không có)
         - value.updatedAt (nếu không có)
         - timestamp (root level)
+        - nameSort (root level, khóa sort theo value.name)
+
+        Args:
+            doc: Document {"key", "value": HistoryValueModel dạng dict}
+
+        Returns:
+            Document đã lưu (có _id)
         """
         import uuid
         from datetime import datetime
 
-        doc = data.model_dump()
         current_time = get_current_timestamp()
 
         # Auto-generate value.id (base ID cho tất cả)
@@ -404,6 +630,9 @@ class DatabaseService:
         # Add root timestamp
         doc["timestamp"] = current_time
 
+        # Khóa sort theo name cho list_histories (sort ngay trong MongoDB)
+        doc["nameSort"] = history_name_sort_key(doc["value"].get("name"))
+
         # Insert to MongoDB
         result = await self.histories.insert_one(doc)
         doc["_id"] = str(result.inserted_id)
@@ -427,16 +656,64 @@ class DatabaseService:
         Returns:
             Số lượng documents
         """
-        query = {}
-        if collection:
-            query["collection"] = collection
-        if document_id:
-            query["document_id"] = document_id
-        if search:
-            query["value.name"] = {"$regex": search, "$options": "i"}
-
+        query = self.history_filter(collection, document_id, search)
         return await self.histories.count_documents(query)
 
+    # ==================== INDEXES ====================
+
+    async def ensure_indexes(self) -> dict[str, dict]:
+        """
+        Đối chiếu index của mọi collection với khai báo trong indexes.INDEXES
+
+        Returns:
+            Báo cáo theo collection (xem indexes.ensure_indexes)
+        """
+        return await ensure_indexes(self.db)
+
+    async def explain_queries(self) -> dict[str, dict]:
+        """
+        Winning plan (explain) của các dạng query mà service dùng
+
+        Returns:
+            Báo cáo theo query (xem indexes.explain_queries)
+        """
+        return await explain_queries(self.db)
+
+    async def backfill_history_name_sort(self, batch_size: int = 500) -> int:
+        """
+        Ghi nameSort cho các history cũ chưa có
+
+        Chạy lúc startup; history tạo/đổi tên sau đó đã có nameSort sẵn.
+
+        Args:
+            batch_size: Số update mỗi lần bulk_write
+
+        Returns:
+            Số history đã được ghi nameSort
+        """
+        updated = 0
+        operations = []
+        cursor = self.histories.find(
+            {"nameSort": {"$exists": False}}, {"value.name": 1}
+        )
+        async for doc in cursor:
+            name = (doc.get("value") or {}).get("name")
+            operations.append(
+                UpdateOne(
+                    {"_id": doc["_id"]},
+                    {"$set": {"nameSort": history_name_sort_key(name)}},
+                )
+            )
+            if len(operations) >= batch_size:
+                await self.histories.bulk_write(operations, ordered=False)
+                updated += len(operations)
+                operations = []
+
+        if operations:
+            await self.histories.bulk_write(operations, ordered=False)
+            updated += len(operations)
+        return updated
+
     # ==================== IMPORTS OPERATIONS ====================
 
     async def create_import(self, data: ImportCreateRequest) -> dict:
@@ -492,9 +769,25 @@ class DatabaseService:
 
         return await self.get_import(import_id)
 
-    async def list_imports(self, skip: int = 0, limit: int = 10) -> list[dict]:
-        """Lấy danh sách imports"""
-        cursor = self.imports.find().sort("started_at", -1).skip(skip).limit(limit)
+    async def list_imports(
+        self, skip: int = 0, limit: int = 10, cursor: Optional[str] = None
+    ) -> list[dict]:
+        """
+        Lấy danh sách imports, mới nhất trước
+
+        Args:
+            skip: Số documents bỏ qua (bỏ qua khi có cursor)
+            limit: Số documents tối đa
+            cursor: Cursor token (next_cursor của trang trước, optional)
+
+        Raises:
+            ValueError: Nếu cursor không hợp lệ
+        """
+        query = {}
+        if cursor:
+            query, skip = decode_cursor(cursor, IMPORT_SORT), 0
+
+        cursor = self.imports.find(query).sort(IMPORT_SORT).skip(skip).limit(limit)
         docs = await cursor.to_list(length=limit)
 
         for doc in docs:
@@ -502,6 +795,126 @@ class DatabaseService:
 
         return docs
 
+    async def list_imports_page(
+        self, skip: int = 0, limit: int = 10, cursor: Optional[str] = None
+    ) -> dict:
+        """
+        Một trang imports, lấy limit + 1 document: document thừa cho biết còn trang sau
+
+        Args:
+            Như list_imports
+
+        Returns:
+            Dictionary {"items", "has_more"}
+
+        Raises:
+            ValueError: Nếu cursor không hợp lệ
+        """
+        docs = await self.list_imports(skip, limit + 1, cursor)
+        return {"items": docs[:limit], "has_more": len(docs) > limit}
+
+
+    # ==================== PALETTES OPERATIONS ====================
+
+    async def create_palette(self, data: PaletteCreateRequest) -> dict:
+        """
+        Tạo palette
+
+        Args:
+            data: PaletteCreateRequest
+
+        Returns:
+            Palette document vừa tạo
+        """
+        doc = data.model_dump()
+        # BSON chỉ nhận key string, thứ tự màu được giữ nguyên
+        doc["colors"] = {str(k): v for k, v in data.colors.items()}
+        doc["created_at"] = get_current_timestamp()
+        doc["updated_at"] = doc["created_at"]
+
+        result = await self.palettes.insert_one(doc)
+        doc["_id"] = str(result.inserted_id)
+
+        return doc
+
+    async def get_palette(self, palette_id: str) -> Optional[dict]:
+        """
+        Lấy palette theo ID
+
+        Args:
+            palette_id: ID của palette
+
+        Returns:
+            Dictionary hoặc None nếu không tìm thấy
+        """
+        if not validate_object_id(palette_id):
+            return None
+
+        doc = await self.palettes.find_one({"_id": ObjectId(palette_id)})
+        if doc:
+            doc["_id"] = str(doc["_id"])
+        return doc
+
+    async def list_palettes(self, skip: int = 0, limit: int = 10) -> list[dict]:
+        """Lấy danh sách palettes, mới nhất trước"""
+        cursor = self.palettes.find().sort("created_at", -1).skip(skip).limit(limit)
+        docs = await cursor.to_list(length=limit)
+
+        for doc in docs:
+            doc["_id"] = str(doc["_id"])
+
+        return docs
+
+    async def update_palette(
+        self, palette_id: str, data: PaletteUpdateRequest
+    ) -> Optional[dict]:
+        """
+        Cập nhật palette
+
+        Args:
+            palette_id: ID của palette
+            data: PaletteUpdateRequest
+
+        Returns:
+            Dictionary hoặc None nếu không tìm thấy
+        """
+        if not validate_object_id(palette_id):
+            return None
+
+        update_data = {k: v for k, v in data.model_dump().items() if v is not None}
+        if "colors" in update_data:
+            update_data["colors"] = {str(k): v for k, v in data.colors.items()}
+
+        if not update_data:
+            return await self.get_palette(palette_id)
+
+        update_data["updated_at"] = get_current_timestamp()
+
+        result = await self.palettes.update_one(
+            {"_id": ObjectId(palette_id)}, {"$set": update_data}
+        )
+
+        if result.matched_count == 0:
+            return None
+
+        return await self.get_palette(palette_id)
+
+    async def delete_palette(self, palette_id: str) -> bool:
+        """
+        Xóa palette
+
+        Args:
+            palette_id: ID của palette
+
+        Returns:
+            True nếu xóa thành công, False nếu không
+        """
+        if not validate_object_id(palette_id):
+            return False
+
+        result = await self.palettes.delete_one({"_id": ObjectId(palette_id)})
+        return result.deleted_count > 0
+
 
 # Singleton instance
 database_service = DatabaseService()
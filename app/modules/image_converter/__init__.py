@@ -3,6 +3,8 @@ Image Converter Module
 Chuyển đổi ảnh thành pixel art với palette
 """
 from .routes import router
+from .executor import conversion_executor
+from .upload import BodySizeLimitMiddleware
 
-__all__ = ["router"]
+__all__ = ["router", "conversion_executor", "BodySizeLimitMiddleware"]
 
@@ -0,0 +1,227 @@
+"""
+Conversion Cache
+Cache kết quả chuyển đổi theo nội dung ảnh + tham số chuyển đổi
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional
+
+from app.config import settings
+from app.utils.helpers import get_current_timestamp
+
+# Tăng khi thuật toán chuyển đổi thay đổi để bỏ qua kết quả cũ trong MongoDB
+CACHE_SCHEMA_VERSION = 2
+
+# Settings làm thay đổi kết quả chuyển đổi (không phải tham số request), nằm
+# trong cache key để đổi cấu hình không trả lại matrix cũ từ MongoDB
+OUTPUT_SETTINGS = ("dither_strength", "majority_block_size")
+
+# Map trong meta có key là index màu (int); JSON chỉ có key string
+INDEX_KEYED_META = ("palette", "counts")
+
+
+def estimate_result_size(result: dict) -> int:
+    """
+    Ước lượng bộ nhớ (bytes) của kết quả {"meta", "matrix"} trong Python
+
+    Mỗi hàng là một list (~56 bytes) chứa con trỏ 8 bytes tới int nhỏ (được
+    CPython cache nên không tính thêm), cộng phần meta cố định. Kết quả
+    packed ({"meta", "data"}) tính theo độ dài chuỗi base64.
+    """
+    if "data" in result:
+        return 1024 + len(result["data"])
+    matrix = result.get("matrix") or []
+    cols = len(matrix[0]) if matrix else 0
+    return 1024 + len(matrix) * (56 + 8 * cols)
+
+
+def output_settings() -> dict:
+    """Giá trị hiện tại của OUTPUT_SETTINGS (phần "settings" của cache key)"""
+    return {name: getattr(settings, name) for name in OUTPUT_SETTINGS}
+
+
+def restore_index_keys(result: dict) -> dict:
+    """
+    Đưa key của meta.palette / meta.counts về int sau khi đọc từ JSON
+
+    Kết quả lấy từ MongoDB có cùng dạng với kết quả trong RAM (key int), dù
+    tầng nào trả về.
+
+    Args:
+        result: Kết quả vừa parse từ JSON (được sửa tại chỗ)
+
+    Returns:
+        Chính result
+    """
+    meta = result.get("meta") or {}
+    for field in INDEX_KEYED_META:
+        if isinstance(meta.get(field), dict):
+            meta[field] = {int(k): v for k, v in meta[field].items()}
+    return result
+
+
+class ConversionCache:
+    """
+    Cache 2 tầng cho kết quả chuyển đổi
+
+    - Tầng 1: LRU trong process, giới hạn theo tổng bộ nhớ ước lượng
+    - Tầng 2 (tuỳ chọn): collection MongoDB, _id là cache key
+
+    Kết quả trả về dùng chung giữa các request, caller không được sửa đổi.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        persistent: Optional[bool] = None,
+        collection_name: Optional[str] = None,
+    ):
+        self.max_bytes = (
+            settings.conversion_cache_max_bytes if max_bytes is None else max_bytes
+        )
+        self.persistent = (
+            settings.conversion_cache_persistent if persistent is None else persistent
+        )
+        self.collection_name = collection_name or settings.conversion_cache_collection
+
+        self._entries: "OrderedDict[str, tuple[dict, int]]" = OrderedDict()
+        self._bytes = 0
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(
+        content_digest: str, cols: int, rows: int, palette_key: str, **options
+    ) -> str:
+        """
+        Tạo cache key từ hash nội dung ảnh, các tham số chuyển đổi và các
+        settings ảnh hưởng kết quả (OUTPUT_SETTINGS)
+
+        Args:
+            content_digest: sha256 của bytes ảnh
+            cols: Số cột
+            rows: Số hàng
+            palette_key: Hash của palette (palette_hash)
+            **options: Các tham số khác ảnh hưởng kết quả (mode, ...)
+
+        Returns:
+            Chuỗi hex sha256
+        """
+        parts = {
+            "v": CACHE_SCHEMA_VERSION,
+            "image": content_digest,
+            "cols": cols,
+            "rows": rows,
+            "palette": palette_key,
+            "settings": output_settings(),
+            **options,
+        }
+        canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _collection(self):
+        from app.modules.database.connection import get_database
+
+        return get_database()[self.collection_name]
+
+    def _remember(self, key: str, result: dict):
+        size = estimate_result_size(result)
+        if size > self.max_bytes:
+            return
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+
+        self._entries[key] = (result, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+
+    async def get(self, key: str) -> Optional[dict]:
+        """
+        Lấy kết quả đã cache
+
+        Args:
+            key: Cache key từ make_key
+
+        Returns:
+            Kết quả {"meta", "matrix"} hoặc None nếu chưa có
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return entry[0]
+
+        if self.persistent:
+            try:
+                doc = await self._collection().find_one({"_id": key})
+            except Exception as e:
+                print(f"⚠️  Conversion cache read failed: {e}")
+                doc = None
+            if doc is not None:
+                result = restore_index_keys(json.loads(doc["result"]))
+                self._remember(key, result)
+                self.persistent_hits += 1
+                return result
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, result: dict):
+        """
+        Lưu kết quả vào cache (và MongoDB nếu bật persistent)
+
+        Args:
+            key: Cache key từ make_key
+            result: Kết quả {"meta", "matrix"}
+        """
+        self._remember(key, result)
+
+        if self.persistent:
+            # Lưu dạng JSON string vì palette/counts dùng key int (BSON chỉ nhận
+            # key string); get() đưa key về int khi đọc lại
+            doc = {
+                "result": json.dumps(result, separators=(",", ":")),
+                "created_at": get_current_timestamp(),
+            }
+            try:
+                await self._collection().replace_one({"_id": key}, doc, upsert=True)
+            except Exception as e:
+                print(f"⚠️  Conversion cache write failed: {e}")
+
+    def clear(self):
+        """Xoá tầng cache trong process và reset bộ đếm"""
+        self._entries.clear()
+        self._bytes = 0
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Thống kê hit/miss của cache
+
+        Returns:
+            Dictionary chứa bộ đếm và dung lượng
+        """
+        lookups = self.memory_hits + self.persistent_hits + self.misses
+        hits = self.memory_hits + self.persistent_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "persistent": self.persistent,
+        }
+
+
+# Singleton instance
+conversion_cache = ConversionCache()
@@ -0,0 +1,195 @@
+"""
+Color Space
+Chuyển sRGB -> CIELAB (D65) và khoảng cách màu cảm nhận ΔE76 / ΔE2000 (vectorized)
+"""
+import numpy as np
+
+from .utils import DISTANCE_CHUNK_ELEMENTS
+
+# rgb: bình phương khoảng cách RGB, lab: ΔE76 (Euclid trong Lab), de2000: CIEDE2000
+COLOR_METRICS = ("rgb", "lab", "de2000")
+
+# Ma trận sRGB tuyến tính -> XYZ và điểm trắng D65
+_RGB_TO_XYZ = np.array(
+    [
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ]
+)
+_WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+# Bảng gamma 256 giá trị: tra trực tiếp thay vì tính lũy thừa cho từng pixel
+_channel = np.arange(256) / 255.0
+_SRGB_TO_LINEAR = np.where(
+    _channel <= 0.04045, _channel / 12.92, ((_channel + 0.055) / 1.055) ** 2.4
+)
+
+_EPSILON = (6 / 29) ** 3
+_POW25_7 = 25.0 ** 7
+
+
+def srgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """
+    Chuyển màu sRGB (0-255) sang CIELAB D65
+
+    Args:
+        rgb: Array shape (..., 3), giá trị 0-255 (số thực được chấp nhận)
+
+    Returns:
+        Array float64 shape (..., 3) chứa (L, a, b)
+    """
+    rgb = np.asarray(rgb)
+    if np.issubdtype(rgb.dtype, np.integer):
+        linear = _SRGB_TO_LINEAR[rgb.astype(np.intp)]
+    else:
+        channel = rgb / 255.0
+        linear = np.where(
+            channel <= 0.04045, channel / 12.92, ((channel + 0.055) / 1.055) ** 2.4
+        )
+    xyz = (linear @ _RGB_TO_XYZ.T) / _WHITE_D65
+
+    f = np.where(xyz > _EPSILON, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    fx, fy, fz = f[..., 0], f[..., 1], f[..., 2]
+    return np.stack((116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)), axis=-1)
+
+
+def delta_e76(lab1: np.ndarray, lab2: np.ndarray) -> np.ndarray:
+    """
+    ΔE76: khoảng cách Euclid trong Lab (hỗ trợ broadcast)
+
+    Args:
+        lab1: Array shape (..., 3)
+        lab2: Array shape (..., 3)
+
+    Returns:
+        Array khoảng cách
+    """
+    diff = np.asarray(lab1) - np.asarray(lab2)
+    return np.sqrt(np.einsum("...c,...c->...", diff, diff))
+
+
+def _de2000_chroma_hue(lab1: np.ndarray, lab2: np.ndarray) -> tuple[np.ndarray, ...]:
+    """Chroma C' và hue h' (độ) của cặp màu sau khi hiệu chỉnh trục a theo G"""
+    a1, b1 = lab1[..., 1], lab1[..., 2]
+    a2, b2 = lab2[..., 1], lab2[..., 2]
+
+    c_bar7 = ((np.hypot(a1, b1) + np.hypot(a2, b2)) / 2) ** 7
+    g = 0.5 * (1 - np.sqrt(c_bar7 / (c_bar7 + _POW25_7)))
+    a1p = (1 + g) * a1
+    a2p = (1 + g) * a2
+    return (
+        np.hypot(a1p, b1),
+        np.hypot(a2p, b2),
+        np.degrees(np.arctan2(b1, a1p)) % 360,
+        np.degrees(np.arctan2(b2, a2p)) % 360,
+    )
+
+
+def delta_e2000(lab1: np.ndarray, lab2: np.ndarray) -> np.ndarray:
+    """
+    ΔE2000 (CIEDE2000, kL = kC = kH = 1) theo Sharma et al. 2005 (hỗ trợ broadcast)
+
+    Args:
+        lab1: Array shape (..., 3)
+        lab2: Array shape (..., 3)
+
+    Returns:
+        Array khoảng cách
+    """
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    L1, L2 = lab1[..., 0], lab2[..., 0]
+    c1p, c2p, h1p, h2p = _de2000_chroma_hue(lab1, lab2)
+
+    chroma_zero = (c1p * c2p) == 0
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180, dhp - 360, np.where(dhp < -180, dhp + 360, dhp))
+    dhp = np.where(chroma_zero, 0.0, dhp)
+
+    d_lp = L2 - L1
+    d_cp = c2p - c1p
+    d_hp = 2 * np.sqrt(c1p * c2p) * np.sin(np.radians(dhp / 2))
+
+    l_bar = (L1 + L2) / 2
+    c_bar_p = (c1p + c2p) / 2
+    h_sum = h1p + h2p
+    h_bar = np.where(
+        chroma_zero,
+        h_sum,
+        np.where(
+            np.abs(h1p - h2p) <= 180,
+            h_sum / 2,
+            np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2),
+        ),
+    )
+
+    t = (
+        1
+        - 0.17 * np.cos(np.radians(h_bar - 30))
+        + 0.24 * np.cos(np.radians(2 * h_bar))
+        + 0.32 * np.cos(np.radians(3 * h_bar + 6))
+        - 0.20 * np.cos(np.radians(4 * h_bar - 63))
+    )
+    d_theta = 30 * np.exp(-(((h_bar - 275) / 25) ** 2))
+    c_bar_p7 = c_bar_p ** 7
+    r_c = 2 * np.sqrt(c_bar_p7 / (c_bar_p7 + _POW25_7))
+    s_l = 1 + 0.015 * (l_bar - 50) ** 2 / np.sqrt(20 + (l_bar - 50) ** 2)
+    s_c = 1 + 0.045 * c_bar_p
+    s_h = 1 + 0.015 * c_bar_p * t
+    r_t = -np.sin(np.radians(2 * d_theta)) * r_c
+
+    term_l = d_lp / s_l
+    term_c = d_cp / s_c
+    term_h = d_hp / s_h
+    return np.sqrt(
+        np.maximum(term_l ** 2 + term_c ** 2 + term_h ** 2 + r_t * term_c * term_h, 0)
+    )
+
+
+def color_distances(lab: np.ndarray, lab_colors: np.ndarray, metric: str) -> np.ndarray:
+    """
+    Ma trận khoảng cách giữa các màu và palette theo metric cảm nhận
+
+    Args:
+        lab: Array shape (N, 3)
+        lab_colors: Array shape (P, 3)
+        metric: "lab" hoặc "de2000"
+
+    Returns:
+        Array shape (N, P)
+    """
+    if metric == "lab":
+        return delta_e76(lab[:, None, :], lab_colors[None, :, :])
+    if metric == "de2000":
+        return delta_e2000(lab[:, None, :], lab_colors[None, :, :])
+    raise ValueError(f"metric phải là một trong {', '.join(COLOR_METRICS)}")
+
+
+def nearest_lab_positions(
+    lab: np.ndarray, lab_colors: np.ndarray, metric: str
+) -> np.ndarray:
+    """
+    Tìm vị trí màu palette gần nhất theo ΔE (vectorized, chia chunk)
+
+    Khi bằng nhau thì lấy màu đứng trước trong palette, như bản RGB.
+
+    Args:
+        lab: Array shape (N, 3) màu Lab cần tra
+        lab_colors: Array shape (P, 3) màu Lab của palette
+        metric: "lab" hoặc "de2000"
+
+    Returns:
+        Array shape (N,) chứa vị trí (0..P-1)
+    """
+    if len(lab_colors) == 0:
+        raise ValueError("Palette rỗng")
+
+    lab = np.asarray(lab, dtype=np.float64).reshape(-1, 3)
+    positions = np.empty(len(lab), dtype=np.intp)
+    chunk = max(1, DISTANCE_CHUNK_ELEMENTS // len(lab_colors))
+    for start in range(0, len(lab), chunk):
+        distances = color_distances(lab[start:start + chunk], lab_colors, metric)
+        positions[start:start + chunk] = np.argmin(distances, axis=1)
+
+    return positions
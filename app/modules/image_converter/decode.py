@@ -0,0 +1,298 @@
+"""
+Image Decoding
+Decode ảnh ở độ phân giải nhỏ nhất đủ dùng cho lưới đầu ra (kể cả ảnh động)
+"""
+from io import BytesIO
+from typing import BinaryIO, Iterator, Optional, Union
+
+from PIL import Image
+
+from app.config import settings
+from .preflight import check_pixels
+
+DOWNSAMPLE_MODES = ("nearest", "box", "majority")
+
+
+def open_image(image_data: Union[bytes, BinaryIO]) -> Image.Image:
+    """
+    Mở ảnh (chỉ đọc header, chưa decode pixel)
+
+    Args:
+        image_data: Dữ liệu ảnh (bytes hoặc file object đọc được)
+
+    Returns:
+        PIL Image chưa load
+
+    Raises:
+        ValueError: Nếu không nhận dạng được ảnh
+        ImageTooLargeError: Nếu ảnh vượt settings.max_image_pixels
+    """
+    # File object (vd. SpooledTemporaryFile của upload) được đọc trực tiếp
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        image_data = BytesIO(image_data)
+
+    try:
+        img = Image.open(image_data)
+    except Exception as e:
+        raise ValueError(f"Không đọc được ảnh: {e}")
+
+    # Kích thước có ngay từ header, từ chối trước khi cấp phát bộ nhớ decode
+    check_pixels(*img.size)
+    return img
+
+
+def majority_block(source_size: tuple[int, int], cols: int, rows: int) -> int:
+    """
+    Cạnh khối cho chế độ majority: tối đa settings.majority_block_size nhưng
+    không vượt quá số pixel nguồn mỗi ô (ảnh nhỏ thì khối nhỏ lại, tối thiểu 1)
+    """
+    width, height = source_size
+    return max(1, min(settings.majority_block_size, width // cols, height // rows))
+
+
+def _resample(
+    img: Image.Image, size: tuple[int, int], downsample: str
+) -> tuple[Image.Image, bool]:
+    """
+    Thu nhỏ ảnh về size theo chế độ downsample
+
+    Returns:
+        Tuple (ảnh, có phải chuyển RGB trên ảnh gốc trước khi resize không)
+    """
+    if downsample == "nearest":
+        try:
+            return img.resize(size, Image.NEAREST), False
+        except ValueError:
+            # Mode không resize trực tiếp được, chuyển RGB trên ảnh gốc
+            return img.convert("RGB").resize(size, Image.NEAREST), True
+
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    return img.resize(size, Image.BOX), False
+
+
+def decode_to_grid(
+    image_data: Union[bytes, BinaryIO],
+    cols: int,
+    rows: int,
+    downsample: str = "nearest",
+) -> tuple[Image.Image, dict]:
+    """
+    Decode ảnh và thu nhỏ về kích thước lưới (RGB)
+
+    - JPEG: dùng Image.draft để decoder giảm tỉ lệ ngay trong DCT
+      (1/2, 1/4, 1/8) miễn ảnh vẫn >= kích thước cần
+    - nearest: resize NEAREST ngay trên mode gốc (P, L, RGBA...), chỉ chuyển
+      sang RGB trên ảnh đã thu nhỏ
+    - box: trung bình vùng (Image.BOX), chuyển RGB trước nếu mode là P/RGBA
+      vì không thể lấy trung bình index của palette ảnh
+    - majority: như box nhưng về lưới trung gian (cols x block, rows x block);
+      caller lượng tử hoá rồi bầu màu theo khối (info["block"])
+
+    Args:
+        image_data: Dữ liệu ảnh
+        cols: Số cột
+        rows: Số hàng
+        downsample: nearest, box hoặc majority
+
+    Returns:
+        Tuple (ảnh RGB, thông tin decode cho meta)
+
+    Raises:
+        ValueError: Nếu không đọc được ảnh
+    """
+    img = open_image(image_data)
+    source_size = img.size
+    path = "full"
+    block = majority_block(source_size, cols, rows) if downsample == "majority" else 1
+    size = (cols * block, rows * block)
+
+    try:
+        if img.format == "JPEG":
+            img.draft("RGB", size)
+            if img.size != source_size:
+                path = "jpeg_draft"
+        decoded_size = img.size
+
+        img, converted_first = _resample(img, size, downsample)
+        if converted_first:
+            path = "convert_first"
+
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+    except Exception as e:
+        raise ValueError(f"Không đọc được ảnh: {e}")
+
+    info = {
+        "path": path,
+        "source_size": list(source_size),
+        "decoded_size": list(decoded_size),
+    }
+    if downsample == "majority":
+        info["block"] = block
+    return img, info
+
+
+class ImagePyramid:
+    """
+    Decode ảnh một lần và dựng kim tự tháp độ phân giải cho nhiều lưới
+
+    Ảnh được decode (JPEG: draft theo lưới lớn nhất) rồi chuyển RGB một lần;
+    mỗi tầng kế tiếp là Image.reduce(2) của tầng trước, dừng khi tầng sau nhỏ
+    hơn lưới nhỏ nhất cần dùng. Mỗi lưới lấy mẫu từ tầng nhỏ nhất vẫn đủ lớn.
+    """
+
+    def __init__(
+        self,
+        image_data: Union[bytes, BinaryIO],
+        targets: list[tuple[int, int, str]],
+    ):
+        """
+        Args:
+            image_data: Dữ liệu ảnh
+            targets: Danh sách (cols, rows, downsample) sẽ được lấy mẫu
+
+        Raises:
+            ValueError: Nếu không đọc được ảnh
+        """
+        img = open_image(image_data)
+        self.source_size = img.size
+        self.path = "full"
+
+        sizes = [self.target_size(*target) for target in targets]
+        max_width = max(size[0] for size in sizes)
+        max_height = max(size[1] for size in sizes)
+        min_width = min(size[0] for size in sizes)
+        min_height = min(size[1] for size in sizes)
+
+        try:
+            if img.format == "JPEG":
+                img.draft("RGB", (max_width, max_height))
+                if img.size != self.source_size:
+                    self.path = "jpeg_draft"
+            self.decoded_size = img.size
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+
+            self.levels = [img]
+            while img.width // 2 >= min_width and img.height // 2 >= min_height:
+                img = img.reduce(2)
+                self.levels.append(img)
+        except Exception as e:
+            raise ValueError(f"Không đọc được ảnh: {e}")
+
+    def target_size(self, cols: int, rows: int, downsample: str) -> tuple[int, int]:
+        """Kích thước cần lấy mẫu (majority cần lưới trung gian gấp block lần)"""
+        block = majority_block(self.source_size, cols, rows) if downsample == "majority" else 1
+        return cols * block, rows * block
+
+    def resample(
+        self, cols: int, rows: int, downsample: str = "nearest"
+    ) -> tuple[Image.Image, dict]:
+        """
+        Lấy mẫu ảnh RGB cho một lưới từ tầng phù hợp
+
+        Args:
+            cols: Số cột
+            rows: Số hàng
+            downsample: nearest, box hoặc majority
+
+        Returns:
+            Tuple (ảnh RGB, thông tin decode cho meta) giống decode_to_grid
+        """
+        size = self.target_size(cols, rows, downsample)
+
+        # Tầng nhỏ nhất vẫn >= size (tầng 0 nếu ảnh nhỏ hơn lưới)
+        level = 0
+        for index, candidate in enumerate(self.levels):
+            if candidate.width >= size[0] and candidate.height >= size[1]:
+                level = index
+
+        img, _ = _resample(self.levels[level], size, downsample)
+        info = {
+            "path": self.path,
+            "source_size": list(self.source_size),
+            "decoded_size": list(self.decoded_size),
+            "level": level,
+            "level_size": list(self.levels[level].size),
+        }
+        if downsample == "majority":
+            info["block"] = size[0] // cols
+        return img, info
+
+
+class FrameSequence:
+    """
+    Ảnh nhiều frame (GIF/WebP động), decode lười từng frame khi duyệt
+
+    Chỉ frame đang duyệt được giữ trong bộ nhớ. Pillow tự áp dụng disposal và
+    ghép frame với frame trước khi seek, nên mỗi frame là ảnh hoàn chỉnh.
+    Ảnh tĩnh được coi là ảnh động một frame.
+    """
+
+    def __init__(
+        self,
+        image_data: Union[bytes, BinaryIO],
+        cols: int,
+        rows: int,
+        downsample: str = "nearest",
+    ):
+        """
+        Args:
+            image_data: Dữ liệu ảnh
+            cols: Số cột
+            rows: Số hàng
+            downsample: nearest, box hoặc majority
+
+        Raises:
+            ValueError: Nếu không đọc được ảnh
+        """
+        self.img = open_image(image_data)
+        self.source_size = self.img.size
+        try:
+            self.frame_count = getattr(self.img, "n_frames", 1)
+        except Exception as e:
+            raise ValueError(f"Không đọc được ảnh: {e}")
+        self.loop = self.img.info.get("loop")
+        self.block = majority_block(self.source_size, cols, rows) if downsample == "majority" else 1
+        self.size = (cols * self.block, rows * self.block)
+        self.downsample = downsample
+
+    @property
+    def info(self) -> dict:
+        """Thông tin decode cho meta (giống decode_to_grid, thêm số frame)"""
+        info = {
+            "path": "frames",
+            "source_size": list(self.source_size),
+            "decoded_size": list(self.source_size),
+            "frame_count": self.frame_count,
+            "loop": self.loop,
+        }
+        if self.downsample == "majority":
+            info["block"] = self.block
+        return info
+
+    def frames(
+        self, start: int = 0, limit: Optional[int] = None
+    ) -> Iterator[tuple[int, Image.Image, int]]:
+        """
+        Duyệt các frame [start, start + limit), thu nhỏ về lưới (RGB)
+
+        Yields:
+            Tuple (index frame, ảnh RGB đã thu nhỏ, thời lượng frame ms)
+
+        Raises:
+            ValueError: Nếu decode frame lỗi
+        """
+        stop = self.frame_count if limit is None else min(self.frame_count, start + limit)
+        for index in range(start, stop):
+            try:
+                self.img.seek(index)
+                frame, _ = _resample(self.img, self.size, self.downsample)
+                # WebP chỉ có duration sau khi frame được load (trong resize)
+                duration = int(self.img.info.get("duration") or 0)
+                if frame.mode != "RGB":
+                    frame = frame.convert("RGB")
+            except Exception as e:
+                raise ValueError(f"Không đọc được frame {index}: {e}")
+            yield index, frame, duration
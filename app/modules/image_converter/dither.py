@@ -0,0 +1,145 @@
+"""
+Dithering
+Dither ảnh đã thu nhỏ trước khi tra palette (ordered Bayer, Floyd-Steinberg)
+"""
+from typing import Optional
+
+import numpy as np
+
+from .palette import CompiledPalette
+
+DITHER_MODES = ("none", "bayer", "floyd-steinberg")
+
+
+def bayer_matrix(size: int = 8) -> np.ndarray:
+    """
+    Ma trận ngưỡng Bayer (size là lũy thừa của 2), chuẩn hoá về khoảng (-0.5, 0.5)
+
+    Args:
+        size: Kích thước ma trận
+
+    Returns:
+        Array float64 shape (size, size)
+    """
+    matrix = np.zeros((1, 1), dtype=np.int64)
+    while matrix.shape[0] < size:
+        matrix = np.block([
+            [4 * matrix, 4 * matrix + 2],
+            [4 * matrix + 3, 4 * matrix + 1],
+        ])
+    return (matrix + 0.5) / matrix.size - 0.5
+
+
+_BAYER_8 = bayer_matrix(8)
+
+
+def palette_spread(colors: np.ndarray) -> float:
+    """
+    Biên độ dither mặc định: trung vị khoảng cách tới màu palette gần nhất, quy
+    về một kênh (chia sqrt(3)). Palette thưa cần nhiễu mạnh, palette dày thì nhẹ.
+
+    Args:
+        colors: Array shape (P, 3)
+
+    Returns:
+        Biên độ theo đơn vị RGB
+    """
+    if len(colors) < 2:
+        return 0.0
+    diff = colors[:, None, :].astype(np.float64) - colors[None, :, :]
+    distances = np.sqrt((diff ** 2).sum(axis=-1))
+    np.fill_diagonal(distances, np.inf)
+    return float(np.median(distances.min(axis=1)) / np.sqrt(3))
+
+
+def ordered_dither(pixels: np.ndarray, strength: float, y0: int = 0) -> np.ndarray:
+    """
+    Cộng ngưỡng Bayer 8x8 (lặp theo ô) vào ảnh, vectorized trên toàn ảnh
+
+    Kết quả vẫn là ảnh RGB uint8 nên tra palette bằng LUT như bình thường.
+
+    Args:
+        pixels: Array uint8 shape (H, W, 3)
+        strength: Biên độ nhiễu theo đơn vị RGB (khoảng cách giữa các màu palette)
+        y0: Hàng đầu tiên của pixels trong ảnh gốc (khi xử lý theo dải hàng)
+
+    Returns:
+        Array uint8 shape (H, W, 3)
+    """
+    height, width = pixels.shape[:2]
+    threshold = _BAYER_8[np.ix_((np.arange(height) + y0) % 8, np.arange(width) % 8)]
+    dithered = pixels.astype(np.float32) + threshold[:, :, None] * strength
+    return np.clip(np.rint(dithered), 0, 255).astype(np.uint8)
+
+
+def floyd_steinberg_positions(pixels: np.ndarray, compiled: CompiledPalette) -> np.ndarray:
+    """
+    Floyd-Steinberg cho cả ảnh (xem floyd_steinberg_band)
+
+    Args:
+        pixels: Array uint8 shape (H, W, 3)
+        compiled: CompiledPalette dùng để tra màu gần nhất
+
+    Returns:
+        Array shape (H, W) chứa vị trí trong palette
+    """
+    return floyd_steinberg_band(pixels, compiled)[0]
+
+
+def floyd_steinberg_band(
+    pixels: np.ndarray,
+    compiled: CompiledPalette,
+    carry: Optional[np.ndarray] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Floyd-Steinberg xử lý theo đường chéo (wavefront), vectorized trong mỗi bước
+
+    Pixel (y, x) chỉ phụ thuộc (y, x-1) và (y-1, x-1..x+1), nên mọi pixel cùng
+    t = 2y + x độc lập với nhau: 2H + W bước thay vì H x W bước như vòng lặp
+    từng pixel, kết quả giống hệt thứ tự quét raster.
+
+    Ảnh có thể xử lý theo từng dải hàng: sai số hàng cuối khuếch tán xuống
+    được trả về (carry) và cộng vào hàng đầu của dải sau, kết quả giống hệt
+    xử lý cả ảnh một lần.
+
+    Args:
+        pixels: Array uint8 shape (H, W, 3)
+        compiled: CompiledPalette dùng để tra màu gần nhất
+        carry: Sai số từ dải trước cho hàng đầu, shape (W, 3) (optional)
+
+    Returns:
+        Tuple (vị trí trong palette shape (H, W), sai số cho hàng kế tiếp shape (W, 3))
+    """
+    height, width = pixels.shape[:2]
+    # Thêm một hàng để nhận sai số khuếch tán xuống dưới dải
+    work = np.zeros((height + 1, width, 3), dtype=np.float64)
+    work[:height] = pixels
+    if carry is not None:
+        work[0] += carry
+    positions = np.empty((height, width), dtype=np.intp)
+    colors = compiled.colors.astype(np.float64)
+
+    for t in range(2 * (height - 1) + width):
+        y_start = max(0, -(-(t - width + 1) // 2))
+        y_stop = min(height - 1, t // 2)
+        if y_start > y_stop:
+            continue
+        ys = np.arange(y_start, y_stop + 1)
+        xs = t - 2 * ys
+
+        values = np.clip(work[ys, xs], 0, 255)
+        found = compiled.positions(np.rint(values).astype(np.uint8))
+        positions[ys, xs] = found
+        error = values - colors[found]
+
+        right = xs + 1 < width
+        work[ys[right], xs[right] + 1] += error[right] * (7 / 16)
+
+        ys_b, xs_b = ys + 1, xs
+        left = xs_b > 0
+        work[ys_b[left], xs_b[left] - 1] += error[left] * (3 / 16)
+        work[ys_b, xs_b] += error * (5 / 16)
+        right = xs_b + 1 < width
+        work[ys_b[right], xs_b[right] + 1] += error[right] * (1 / 16)
+
+    return positions, work[height]
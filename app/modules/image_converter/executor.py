@@ -0,0 +1,139 @@
+"""
+Conversion Executor
+Chạy chuyển đổi ảnh (CPU-bound) ngoài event loop bằng process pool
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Optional
+
+from app.config import settings
+
+
+class ConverterBusyError(RuntimeError):
+    """Hàng đợi chuyển đổi đã đầy"""
+
+
+class ConversionExecutor:
+    """
+    Process pool dùng chung cho các tác vụ chuyển đổi ảnh
+
+    - workers > 0: chạy trong process pool (song song trên nhiều core)
+    - workers = 0: chạy trong thread pool (dev/tests, không fork process)
+
+    Số tác vụ đang chờ + đang chạy bị giới hạn bởi max_queue, vượt quá thì
+    từ chối ngay (ConverterBusyError) thay vì để request dồn ứ.
+
+    Worker được tái tạo sau khoảng max_tasks_per_child ảnh để giải phóng bộ nhớ
+    phân mảnh của Pillow/numpy. Không dùng tham số max_tasks_per_child của
+    ProcessPoolExecutor vì trên Python 3.11 pool bị treo khi thay worker; thay
+    vào đó cả pool được thay mới sau workers * max_tasks_per_child tác vụ, pool
+    cũ chạy nốt các tác vụ đang dở rồi tự dừng.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_tasks_per_child: Optional[int] = None,
+    ):
+        if workers is None:
+            workers = settings.converter_workers
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if max_queue is None:
+            max_queue = settings.converter_max_queue
+        if max_tasks_per_child is None:
+            max_tasks_per_child = settings.converter_max_tasks_per_child
+
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._submitted = 0
+
+    @property
+    def uses_processes(self) -> bool:
+        """True nếu tác vụ chạy ở process khác (tham số phải pickle được)"""
+        return self.workers > 0
+
+    @property
+    def pending(self) -> int:
+        """Số tác vụ đang chờ hoặc đang chạy"""
+        return self._pending
+
+    def start(self):
+        """Khởi tạo pool (gọi nhiều lần không sao)"""
+        if self._executor is not None:
+            return
+
+        if self.uses_processes:
+            # 'spawn' tránh fork một process đang có thread (event loop, motor)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            self._executor = ThreadPoolExecutor(thread_name_prefix="image-convert")
+        self._submitted = 0
+
+    def _recycle_if_needed(self):
+        """Thay pool mới khi pool hiện tại đã chạy đủ số tác vụ"""
+        if not (self.uses_processes and self.max_tasks_per_child):
+            return
+        if self._submitted < self.workers * self.max_tasks_per_child:
+            return
+
+        old = self._executor
+        self._executor = None
+        self.start()
+        if old is not None:
+            old.shutdown(wait=False)
+
+    def shutdown(self):
+        """Dừng pool, huỷ các tác vụ chưa chạy"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Chạy fn(*args, **kwargs) trong pool và chờ kết quả
+
+        Args:
+            fn: Hàm top-level (pickle được khi dùng process pool)
+
+        Returns:
+            Kết quả của fn
+
+        Raises:
+            ConverterBusyError: Nếu hàng đợi đã đầy
+        """
+        if self._pending >= self.max_queue:
+            raise ConverterBusyError(
+                f"Hệ thống đang bận ({self._pending} ảnh đang xử lý), thử lại sau"
+            )
+
+        self.start()
+        self._recycle_if_needed()
+        self._submitted += 1
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, partial(fn, *args, **kwargs)
+            )
+        except BrokenProcessPool:
+            # Worker chết (OOM, segfault...) -> tạo lại pool cho request sau
+            self._executor = None
+            raise RuntimeError("Worker xử lý ảnh bị dừng đột ngột")
+        finally:
+            self._pending -= 1
+
+
+# Singleton instance
+conversion_executor = ConversionExecutor()
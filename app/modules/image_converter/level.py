@@ -0,0 +1,126 @@
+"""
+Level Builder
+Dựng level (board CellModel + config) từ matrix index của ảnh đã chuyển đổi
+
+Level có dạng HistoryLevelModel nhưng được dựng trực tiếp bằng dict, không
+validate Pydantic từng ô: board lớn có hàng nghìn ô giống hệt nhau.
+"""
+from typing import Optional
+
+import numpy as np
+
+LEVEL_DIFFICULTIES = ("Easy", "Medium", "Hard")
+
+# generationMode của level dựng từ ảnh (frontend dùng symmetric/random)
+IMAGE_GENERATION_MODE = "image"
+
+
+def build_board(matrix: np.ndarray) -> list[list[dict]]:
+    """
+    Dựng board CellModel từ matrix index bằng một phép tra bảng
+
+    Mỗi index màu có một cell {"type": "block", "color": "<index>", "element": None}
+    dựng sẵn; các ô cùng màu dùng chung object cell đó (chỉ đọc, serialize
+    JSON/BSON như các dict riêng). Bảng tra đánh theo thứ tự của np.unique
+    nên index âm hay rất lớn (palette cho phép mọi key int) vẫn đúng.
+
+    Args:
+        matrix: Array index màu shape (rows, cols)
+
+    Returns:
+        Board 2D các cell dict
+    """
+    matrix = np.asarray(matrix)
+    if matrix.size == 0:
+        return [[] for _ in range(matrix.shape[0])]
+
+    uniq, inverse = np.unique(matrix, return_inverse=True)
+    cells = np.empty(len(uniq), dtype=object)
+    for position, idx in enumerate(uniq.tolist()):
+        cells[position] = {"type": "block", "color": str(idx), "element": None}
+    return cells[inverse.reshape(matrix.shape)].tolist()
+
+
+def build_level(
+    matrix: np.ndarray,
+    counts: dict[int, int],
+    palette: dict[int, str],
+    name: str,
+    difficulty: str = "Medium",
+) -> dict:
+    """
+    Dựng level dạng HistoryLevelModel từ kết quả chuyển đổi
+
+    Level chưa có container/pipe/element và chưa được kiểm tra giải được
+    (solvable=False, difficultyScore=0); id và timestamp được sinh khi lưu.
+
+    Args:
+        matrix: Array index màu shape (rows, cols)
+        counts: {index: số ô} của các màu có trong ảnh (meta.counts)
+        palette: Palette đã dùng để chuyển đổi
+        name: Tên level
+        difficulty: Easy, Medium hoặc Hard
+
+    Returns:
+        Dictionary level (board, config, containers, ...)
+
+    Raises:
+        ValueError: Nếu difficulty không hợp lệ
+    """
+    if difficulty not in LEVEL_DIFFICULTIES:
+        raise ValueError(f"difficulty phải là một trong {', '.join(LEVEL_DIFFICULTIES)}")
+
+    matrix = np.asarray(matrix)
+    rows, cols = matrix.shape
+    palette_by_index = {int(k): v for k, v in palette.items()}
+    color_ids = [str(idx) for idx in sorted(counts)]
+
+    config = {
+        "name": name,
+        "width": cols,
+        "height": rows,
+        "blockCount": int(sum(counts.values())),
+        "colorCount": len(color_ids),
+        "selectedColors": color_ids,
+        "colorMapping": {idx: palette_by_index[int(idx)] for idx in color_ids},
+        "generationMode": IMAGE_GENERATION_MODE,
+        "elements": {},
+        "difficulty": difficulty,
+        "pipeCount": 0,
+        "pipeBlockCounts": [],
+        "iceCounts": [],
+        "bombCounts": [],
+        "id": None,
+        "status": "pending",
+        "createdAt": None,
+        "updatedAt": None,
+    }
+
+    return {
+        "board": build_board(matrix),
+        "config": config,
+        "containers": [],
+        "difficultyScore": 0,
+        "id": None,
+        "lockInfo": None,
+        "solvable": False,
+        "timestamp": None,
+        "pipeInfo": [],
+    }
+
+
+def level_history_doc(level: dict, name: Optional[str] = None) -> dict:
+    """
+    Bọc level thành document history ({"key": "history", "value": {...}})
+
+    Args:
+        level: Level từ build_level
+        name: Tên history (mặc định tên level)
+
+    Returns:
+        Document cho database_service.insert_history_item
+    """
+    return {
+        "key": "history",
+        "value": {"name": name or level["config"]["name"], "level": level},
+    }
@@ -0,0 +1,180 @@
+"""
+Matrix Packing
+Định dạng gọn cho matrix index: base64 của buffer uint8/4-bit, tuỳ chọn RLE
+
+Layout (row-major, meta.encoding mô tả đầy đủ):
+- bits = 4: mỗi byte chứa 2 ô, nibble cao là ô đứng trước; số ô lẻ thì
+  nibble thấp của byte cuối là 0
+- bits = 8: mỗi ô 1 byte
+- bits = 16: mỗi ô 2 byte little-endian
+- rle = true: chuỗi các run [value][length], value rộng value_bytes byte
+  (little-endian), length là số nguyên không dấu dạng ULEB128
+
+Ảnh động gửi frame sau dạng delta so với frame trước (diff_matrix): danh
+sách [y, x, index] của các ô thay đổi.
+"""
+import base64
+
+import numpy as np
+
+MATRIX_FORMATS = ("json", "packed")
+
+
+def _bits_for(values: np.ndarray) -> int:
+    """Số bit nhỏ nhất (4/8/16) chứa được mọi index"""
+    if values.size and values.min() < 0:
+        raise ValueError("Index màu âm không đóng gói được")
+    max_value = int(values.max()) if values.size else 0
+    if max_value <= 0xF:
+        return 4
+    if max_value <= 0xFF:
+        return 8
+    if max_value <= 0xFFFF:
+        return 16
+    raise ValueError("Index màu vượt quá 65535 không đóng gói được")
+
+
+def _encode_uleb128(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Mã hoá ULEB128 vectorized
+
+    Returns:
+        Tuple (bytes shape (N, W), mask shape (N, W) các byte hợp lệ)
+    """
+    values = values.astype(np.uint64)
+    width = 1
+    while width < 10 and (values >> np.uint64(7 * width)).any():
+        width += 1
+
+    shifts = np.arange(width, dtype=np.uint64) * np.uint64(7)
+    groups = (values[:, None] >> shifts) & np.uint64(0x7F)
+    # Số byte thực sự cần cho từng giá trị
+    used = np.maximum(1, ((values[:, None] >> shifts) > 0).sum(axis=1))
+    mask = np.arange(width)[None, :] < used[:, None]
+    continuation = np.arange(width)[None, :] < (used[:, None] - 1)
+    encoded = (groups | (continuation.astype(np.uint64) << np.uint64(7))).astype(np.uint8)
+    return encoded, mask
+
+
+def pack_matrix(matrix: np.ndarray, rle: bool = False) -> tuple[dict, str]:
+    """
+    Đóng gói matrix index thành chuỗi base64
+
+    Args:
+        matrix: Array 2D (rows, cols) chứa palette index
+        rle: Có nén run-length hay không
+
+    Returns:
+        Tuple (encoding metadata, dữ liệu base64)
+    """
+    flat = np.asarray(matrix).ravel()
+    bits = _bits_for(flat)
+    encoding = {"format": "packed", "order": "row-major", "bits": bits, "rle": rle}
+
+    if rle:
+        value_bytes = 1 if bits <= 8 else 2
+        if flat.size:
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(flat)) + 1))
+            lengths = np.diff(np.concatenate((starts, [flat.size])))
+            values = flat[starts].astype("<u2").view(np.uint8).reshape(-1, 2)
+            values = values[:, :value_bytes]
+            lengths_bytes, lengths_mask = _encode_uleb128(lengths)
+            runs = np.concatenate((values, lengths_bytes), axis=1)
+            mask = np.concatenate(
+                (np.ones(values.shape, dtype=bool), lengths_mask), axis=1
+            )
+            payload = runs[mask].tobytes()
+        else:
+            payload = b""
+        encoding.update(value_bytes=value_bytes, length="uleb128")
+    elif bits == 4:
+        nibbles = flat.astype(np.uint8)
+        if nibbles.size % 2:
+            nibbles = np.append(nibbles, np.uint8(0))
+        payload = ((nibbles[0::2] << 4) | nibbles[1::2]).tobytes()
+    elif bits == 8:
+        payload = flat.astype(np.uint8).tobytes()
+    else:
+        payload = flat.astype("<u2").tobytes()
+
+    return encoding, base64.b64encode(payload).decode("ascii")
+
+
+def unpack_matrix(data: str, encoding: dict, cols: int, rows: int) -> np.ndarray:
+    """
+    Giải nén dữ liệu từ pack_matrix (dùng cho tests và client Python)
+
+    Args:
+        data: Chuỗi base64
+        encoding: meta.encoding
+        cols: Số cột
+        rows: Số hàng
+
+    Returns:
+        Array 2D (rows, cols)
+    """
+    raw = np.frombuffer(base64.b64decode(data), dtype=np.uint8)
+    count = cols * rows
+
+    if encoding.get("rle"):
+        value_bytes = encoding["value_bytes"]
+        values, lengths = [], []
+        pos = 0
+        while pos < raw.size:
+            value = int(raw[pos])
+            if value_bytes == 2:
+                value |= int(raw[pos + 1]) << 8
+            pos += value_bytes
+            length, shift = 0, 0
+            while True:
+                byte = int(raw[pos])
+                pos += 1
+                length |= (byte & 0x7F) << shift
+                shift += 7
+                if byte < 0x80:
+                    break
+            values.append(value)
+            lengths.append(length)
+        flat = np.repeat(np.array(values, dtype=np.int64), lengths)
+    elif encoding["bits"] == 4:
+        flat = np.empty(raw.size * 2, dtype=np.int64)
+        flat[0::2] = raw >> 4
+        flat[1::2] = raw & 0x0F
+    elif encoding["bits"] == 8:
+        flat = raw.astype(np.int64)
+    else:
+        flat = raw.view("<u2").astype(np.int64)
+
+    return flat[:count].reshape(rows, cols)
+
+
+def diff_matrix(previous: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """
+    Các ô khác nhau giữa hai matrix cùng kích thước (delta giữa hai frame)
+
+    Args:
+        previous: Matrix frame trước (rows, cols)
+        current: Matrix frame hiện tại (rows, cols)
+
+    Returns:
+        Array int (N, 3), mỗi dòng là [y, x, index mới], theo thứ tự row-major
+    """
+    ys, xs = np.nonzero(previous != current)
+    return np.stack([ys, xs, current[ys, xs]], axis=1)
+
+
+def apply_diff(matrix: np.ndarray, changes) -> np.ndarray:
+    """
+    Áp dụng delta từ diff_matrix lên matrix frame trước (dùng cho tests và client Python)
+
+    Args:
+        matrix: Matrix frame trước (rows, cols)
+        changes: Danh sách [y, x, index]
+
+    Returns:
+        Matrix frame mới (bản sao)
+    """
+    result = np.array(matrix, copy=True)
+    changes = np.asarray(changes, dtype=np.int64).reshape(-1, 3)
+    result[changes[:, 0], changes[:, 1]] = changes[:, 2]
+    return result
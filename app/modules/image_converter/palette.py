@@ -0,0 +1,408 @@
+"""
+Compiled Palette
+Palette đã biên dịch sẵn: RGB arrays + bảng tra cứu (LUT) RGB -> vị trí trong palette
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from app.config import settings
+from .colorspace import (
+    COLOR_METRICS,
+    delta_e76,
+    nearest_lab_positions,
+    srgb_to_lab,
+)
+from .utils import (
+    build_palette_rgb,
+    nearest_palette_positions,
+    palette_to_arrays,
+)
+
+# Giá trị trong LUT cho các ô có nhiều hơn một màu có thể là gần nhất
+AMBIGUOUS = -1
+
+# Số ứng viên tối đa lưu cho mỗi ô (nhiều hơn thì tính với cả palette)
+MAX_CELL_CANDIDATES = 16
+
+# Sai số làm tròn số thực cho phép khi so cận khoảng cách của ô trong Lab
+_LAB_BOUND_EPSILON = 1e-9
+
+
+def palette_hash(palette: dict[int, str]) -> str:
+    """
+    Hash ổn định của palette (phụ thuộc thứ tự vì thứ tự quyết định tie-break)
+
+    Args:
+        palette: Dictionary {index: hex_color}
+
+    Returns:
+        Chuỗi hex sha1
+    """
+    canonical = "|".join(f"{int(k)}={v}" for k, v in palette.items())
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class CompiledPalette:
+    """
+    Palette đã biên dịch, dùng lại được giữa các request
+
+    LUT chia không gian RGB thành khối 2^bits ô mỗi kênh. Ô nào chỉ có đúng
+    một màu palette có thể là gần nhất thì lưu thẳng vị trí màu đó; các ô còn
+    lại (AMBIGUOUS) được tính chính xác lại cho từng pixel, nên kết quả luôn
+    giống hệt nearest_palette_positions.
+
+    Ô mơ hồ có thể kèm danh sách màu ứng viên (lưới đều trên RGB, mỗi ô một
+    danh sách): pixel trong ô chỉ so với các ứng viên thay vì cả palette. Lưới
+    này luôn bật cho metric lab và bật cho metric rgb khi palette có hơn
+    settings.palette_index_threshold màu.
+
+    Với metric lab LUT vẫn đánh index theo RGB nên chi phí mỗi request như
+    metric rgb; chỉ pixel rơi vào ô mơ hồ mới chuyển sang Lab để tính ΔE.
+    ΔE2000 không phải metric (không có bất đẳng thức tam giác, có bước nhảy
+    theo hue) nên không có cận chứng minh được cho từng ô: de2000 không dùng
+    LUT mà tính chính xác với cả palette cho từng màu khác nhau của ảnh.
+    """
+
+    def __init__(
+        self, palette: dict[int, str], lut_bits: Optional[int] = None, metric: str = "rgb"
+    ):
+        if not palette:
+            raise ValueError("Palette rỗng")
+        if lut_bits is None:
+            lut_bits = settings.palette_lut_bits
+        if not 1 <= lut_bits <= 8:
+            raise ValueError("lut_bits phải trong khoảng 1-8")
+        if metric not in COLOR_METRICS:
+            raise ValueError(f"metric phải là một trong {', '.join(COLOR_METRICS)}")
+
+        self.palette = {int(k): v for k, v in palette.items()}
+        self.key = palette_hash(palette)
+        self.keys, self.colors = palette_to_arrays(build_palette_rgb(palette))
+        self.metric = metric
+        self.lab_colors = srgb_to_lab(self.colors) if metric != "rgb" else None
+        self.lut_bits = lut_bits
+        # Danh sách ứng viên theo ô (None nếu không dùng lưới ứng viên)
+        self.cell_slots: Optional[np.ndarray] = None
+        self.cell_candidates: Optional[np.ndarray] = None
+        self.use_index = metric != "rgb" or len(self.colors) > settings.palette_index_threshold
+        self.lut: Optional[np.ndarray] = None
+        if metric == "rgb":
+            self.lut = self._build_lut()
+        elif metric == "lab":
+            self.lut = self._build_lab_lut()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def count_map(self, counts: np.ndarray) -> dict[int, int]:
+        """
+        Đổi số ô theo vị trí palette (np.bincount) thành {index: số ô}
+
+        Args:
+            counts: Array shape (P,)
+
+        Returns:
+            Dictionary các màu có trong ảnh, theo index tăng dần
+        """
+        used = np.flatnonzero(counts)
+        order = np.argsort(self.keys[used], kind="stable")
+        return {
+            int(self.keys[i]): int(counts[i]) for i in used[order]
+        }
+
+    def __reduce__(self):
+        # Khi gửi sang worker process chỉ pickle palette (vài trăm bytes) thay vì
+        # cả LUT; worker lấy lại từ LRU của nó nên mỗi worker biên dịch một lần
+        return (get_compiled_palette, (self.palette, self.lut_bits, self.metric))
+
+    def _build_lut(self) -> np.ndarray:
+        """
+        Tạo LUT với loại trừ chính xác theo khoảng cách tới từng ô
+
+        Với mỗi ô (hình hộp trong RGB) và mỗi màu p: dmin_p là khoảng cách nhỏ
+        nhất, dmax_p là khoảng cách lớn nhất từ màu p tới ô. Màu gần nhất của
+        mọi điểm trong ô phải thoả dmin_p <= min(dmax); nếu chỉ một màu thoả
+        (kể cả trường hợp hoà) thì ô đó không mơ hồ.
+        """
+        n = 1 << self.lut_bits
+        step = 256 // n
+        low = np.arange(n, dtype=np.int32)[:, None] * step
+        high = low + step - 1
+
+        # Khoảng cách bình phương theo từng kênh, shape (3, n, P)
+        dmin = np.empty((3, n, len(self.colors)), dtype=np.int32)
+        dmax = np.empty_like(dmin)
+        for channel in range(3):
+            values = self.colors[:, channel][None, :]
+            below = np.maximum(low - values, 0)
+            above = np.maximum(values - high, 0)
+            dmin[channel] = (below + above) ** 2
+            dmax[channel] = np.maximum(np.abs(values - low), np.abs(values - high)) ** 2
+
+        lut = np.empty((n, n, n), dtype=np.int16)
+        index = _CellIndexBuilder(n) if self.use_index else None
+        for r in range(n):
+            # Xử lý từng lát R để giới hạn bộ nhớ (n x n x P)
+            cell_min = dmin[0, r][None, None, :] + dmin[1][:, None, :] + dmin[2][None, :, :]
+            cell_max = dmax[0, r][None, None, :] + dmax[1][:, None, :] + dmax[2][None, :, :]
+            bound = cell_max.min(axis=-1, keepdims=True)
+            candidates = (cell_min <= bound).reshape(n * n, -1)
+
+            if index is not None:
+                lut[r] = index.add_slice(r, candidates).reshape(n, n)
+            else:
+                lut[r] = np.where(
+                    candidates.sum(axis=-1) == 1,
+                    np.argmax(candidates, axis=-1),
+                    AMBIGUOUS,
+                ).reshape(n, n)
+
+        if index is not None:
+            self.cell_slots, self.cell_candidates = index.finish()
+        return lut.reshape(-1)
+
+    def _build_lab_lut(self) -> np.ndarray:
+        """
+        Tạo LUT cho metric lab (ΔE76), kèm danh sách màu ứng viên cho từng ô
+
+        sRGB -> XYZ -> f(X), f(Y), f(Z) đồng biến theo từng kênh R, G, B (ma
+        trận XYZ không có hệ số âm) nên với mỗi ô, f(X), f(Y), f(Z) nằm giữa giá
+        trị tại đỉnh thấp và đỉnh cao của ô. Từ đó L, a, b của mọi điểm trong ô
+        nằm trong một hộp Lab, và loại trừ dmin/dmax như _build_lut là chính xác
+        vì ΔE76 là khoảng cách Euclid trong Lab.
+        """
+        n = 1 << self.lut_bits
+        step = 256 // n
+        low = np.arange(n) * step
+        high = low + step - 1
+
+        def f_grid(r_value, axis):
+            grid = np.empty((n, n, 3), dtype=np.intp)
+            grid[..., 0] = r_value
+            grid[..., 1] = axis[:, None]
+            grid[..., 2] = axis[None, :]
+            lab = srgb_to_lab(grid).reshape(-1, 3)
+            fy = (lab[:, 0] + 16) / 116
+            return lab[:, 1] / 500 + fy, fy, fy - lab[:, 2] / 200
+
+        lut = np.empty((n, n, n), dtype=np.int16)
+        index = _CellIndexBuilder(n)
+        colors = self.lab_colors[None, :, :]
+
+        for r in range(n):
+            fx_lo, fy_lo, fz_lo = f_grid(low[r], low)
+            fx_hi, fy_hi, fz_hi = f_grid(high[r], high)
+            box_lo = np.stack(
+                (116 * fy_lo - 16, 500 * (fx_lo - fy_hi), 200 * (fy_lo - fz_hi)), axis=-1
+            )[:, None, :]
+            box_hi = np.stack(
+                (116 * fy_hi - 16, 500 * (fx_hi - fy_lo), 200 * (fy_hi - fz_lo)), axis=-1
+            )[:, None, :]
+
+            gap = np.maximum(box_lo - colors, 0) + np.maximum(colors - box_hi, 0)
+            dmin = np.einsum("npc,npc->np", gap, gap)
+            far = np.maximum(np.abs(colors - box_lo), np.abs(colors - box_hi))
+            dmax = np.einsum("npc,npc->np", far, far)
+
+            bound = dmax.min(axis=1, keepdims=True) * (1 + _LAB_BOUND_EPSILON)
+            candidates = dmin <= bound + _LAB_BOUND_EPSILON
+            lut[r] = index.add_slice(r, candidates).reshape(n, n)
+
+        self.cell_slots, self.cell_candidates = index.finish()
+        return lut.reshape(-1)
+
+    def _candidate_positions(self, pixels: np.ndarray, slots: np.ndarray) -> np.ndarray:
+        """So khoảng cách của từng pixel với danh sách ứng viên của ô chứa nó"""
+        candidates = self.cell_candidates[slots].astype(np.intp)
+        if self.metric == "rgb":
+            diff = pixels.astype(np.int32)[:, None, :] - self.colors[candidates]
+            distances = np.einsum("nkc,nkc->nk", diff, diff)
+        else:
+            distances = delta_e76(srgb_to_lab(pixels)[:, None, :], self.lab_colors[candidates])
+        best = np.argmin(distances, axis=1)
+        return candidates[np.arange(len(candidates)), best]
+
+    def _exact_positions(self, pixels: np.ndarray) -> np.ndarray:
+        """
+        Tính chính xác vị trí màu gần nhất theo metric (ô AMBIGUOUS và de2000)
+
+        Metric cảm nhận chỉ tính một lần cho mỗi màu khác nhau trong pixels.
+        """
+        if self.metric == "rgb":
+            return nearest_palette_positions(pixels, self.colors)
+
+        codes = (
+            (pixels[:, 0].astype(np.int32) << 16)
+            | (pixels[:, 1].astype(np.int32) << 8)
+            | pixels[:, 2]
+        )
+        unique, inverse = np.unique(codes, return_inverse=True)
+        colors = np.stack(((unique >> 16) & 255, (unique >> 8) & 255, unique & 255), axis=-1)
+        found = nearest_lab_positions(srgb_to_lab(colors), self.lab_colors, self.metric)
+        return found[inverse.reshape(-1)]
+
+    def positions(self, pixels: np.ndarray) -> np.ndarray:
+        """
+        Tra vị trí màu gần nhất trong palette cho từng pixel
+
+        Args:
+            pixels: Array uint8 shape (..., 3)
+
+        Returns:
+            Array shape (N,) chứa vị trí (0..P-1)
+        """
+        pixels = np.asarray(pixels, dtype=np.uint8).reshape(-1, 3)
+        if self.lut is None:
+            return self._exact_positions(pixels)
+
+        shift = 8 - self.lut_bits
+        cells = pixels >> shift
+        cell_index = (
+            (cells[:, 0].astype(np.intp) << (2 * self.lut_bits))
+            | (cells[:, 1].astype(np.intp) << self.lut_bits)
+            | cells[:, 2]
+        )
+
+        positions = self.lut[cell_index].astype(np.intp)
+        ambiguous = positions == AMBIGUOUS
+        if ambiguous.any() and self.cell_slots is not None:
+            slots = np.full(len(positions), AMBIGUOUS, dtype=np.int32)
+            slots[ambiguous] = self.cell_slots[cell_index[ambiguous]]
+            listed = slots >= 0
+            if listed.any():
+                positions[listed] = self._candidate_positions(pixels[listed], slots[listed])
+                ambiguous &= ~listed
+        if ambiguous.any():
+            positions[ambiguous] = self._exact_positions(pixels[ambiguous])
+
+        return positions
+
+    def quantize(self, pixels: np.ndarray) -> np.ndarray:
+        """
+        Chuyển pixels sang index của palette (key trong dict palette)
+
+        Args:
+            pixels: Array uint8 shape (..., 3)
+
+        Returns:
+            Array shape (N,) chứa palette index
+        """
+        return self.keys[self.positions(pixels)]
+
+
+class _CellIndexBuilder:
+    """
+    Gom danh sách ứng viên của các ô mơ hồ khi dựng LUT theo từng lát R
+
+    Mỗi ô có 2..MAX_CELL_CANDIDATES ứng viên được cấp một slot, bảng ứng viên
+    có chiều rộng bằng số ứng viên lớn nhất thực tế.
+    """
+
+    def __init__(self, n: int):
+        self.n = n
+        self.slots = np.full((n, n * n), AMBIGUOUS, dtype=np.int32)
+        self.tables: list[np.ndarray] = []
+        self.count = 0
+        self.width = 1
+
+    def add_slice(self, r: int, candidates: np.ndarray) -> np.ndarray:
+        """
+        Ghi nhận ứng viên của một lát R
+
+        Args:
+            r: Chỉ số lát
+            candidates: Array bool shape (n * n, P)
+
+        Returns:
+            Giá trị LUT của lát, shape (n * n,)
+        """
+        counts = candidates.sum(axis=1)
+        row = np.where(counts == 1, np.argmax(candidates, axis=1), AMBIGUOUS)
+
+        listed = np.flatnonzero((counts > 1) & (counts <= MAX_CELL_CANDIDATES))
+        if len(listed):
+            # Ứng viên theo thứ tự palette, phần đệm lặp lại ứng viên đầu
+            # (không đổi kết quả argmin kể cả khi hoà)
+            order = np.argsort(~candidates[listed], axis=1, kind="stable")
+            order = order[:, :MAX_CELL_CANDIDATES]
+            padded = np.where(
+                np.arange(order.shape[1])[None, :] < counts[listed][:, None],
+                order,
+                order[:, :1],
+            )
+            if padded.shape[1] < MAX_CELL_CANDIDATES:
+                missing = MAX_CELL_CANDIDATES - padded.shape[1]
+                filler = np.repeat(padded[:, :1], missing, axis=1)
+                padded = np.concatenate((padded, filler), axis=1)
+            self.tables.append(padded.astype(np.int16))
+            self.slots[r, listed] = self.count + np.arange(len(listed))
+            self.count += len(listed)
+            self.width = max(self.width, int(counts[listed].max()))
+
+        return row
+
+    def finish(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            Tuple (slot của từng ô, bảng ứng viên shape (S, width))
+        """
+        if self.tables:
+            table = np.concatenate(self.tables)[:, :self.width]
+        else:
+            table = np.empty((0, 1), dtype=np.int16)
+        return self.slots.reshape(-1), np.ascontiguousarray(table)
+
+
+_cache: "OrderedDict[tuple[str, int, str], CompiledPalette]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_compiled_palette(
+    palette: Optional[dict[int, str]] = None,
+    lut_bits: Optional[int] = None,
+    metric: str = "rgb",
+) -> CompiledPalette:
+    """
+    Lấy CompiledPalette từ LRU cache (biên dịch nếu chưa có)
+
+    Args:
+        palette: Palette (mặc định settings.default_palette)
+        lut_bits: Số bit mỗi kênh của LUT (mặc định settings.palette_lut_bits)
+        metric: Cách đo khoảng cách màu (rgb, lab, de2000)
+
+    Returns:
+        CompiledPalette dùng chung giữa các request
+    """
+    if palette is None:
+        palette = settings.default_palette
+    if lut_bits is None:
+        lut_bits = settings.palette_lut_bits
+
+    cache_key = (palette_hash(palette), lut_bits, metric)
+
+    with _cache_lock:
+        compiled = _cache.get(cache_key)
+        if compiled is not None:
+            _cache.move_to_end(cache_key)
+            return compiled
+
+    # Biên dịch ngoài lock, request song song cùng palette có thể biên dịch trùng
+    compiled = CompiledPalette(palette, lut_bits, metric)
+
+    with _cache_lock:
+        _cache[cache_key] = compiled
+        _cache.move_to_end(cache_key)
+        while len(_cache) > settings.palette_cache_size:
+            _cache.popitem(last=False)
+
+    return compiled
+
+
+def clear_palette_cache():
+    """Xoá toàn bộ palette đã biên dịch"""
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,116 @@
+"""
+Preflight
+Kiểm tra ảnh trước khi decode: định dạng theo magic bytes, kích thước từ header,
+ngân sách số pixel và số ô lưới
+"""
+from typing import BinaryIO, Optional
+
+from PIL import Image
+
+from app.config import settings
+from .upload import UploadTooLargeError
+
+# (chữ ký, offset, MIME type). WebP là container RIFF: "RIFF" ở 0, "WEBP" ở 8
+MAGIC_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", 0, "image/png"),
+    (b"\xff\xd8\xff", 0, "image/jpeg"),
+    (b"WEBP", 8, "image/webp"),
+    (b"GIF87a", 0, "image/gif"),
+    (b"GIF89a", 0, "image/gif"),
+)
+
+# Pillow tự cảnh báo khi ảnh vượt MAX_IMAGE_PIXELS và báo lỗi khi vượt gấp
+# đôi; đặt theo cùng ngân sách để mọi đường mở ảnh đều được chặn
+Image.MAX_IMAGE_PIXELS = settings.max_image_pixels
+
+
+class ImageTooLargeError(UploadTooLargeError):
+    """Ảnh có quá nhiều pixel (nghi decompression bomb)"""
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    Nhận dạng định dạng ảnh từ các byte đầu file
+
+    Args:
+        head: Ít nhất 12 byte đầu của file
+
+    Returns:
+        MIME type hoặc None nếu không nhận ra
+    """
+    for signature, offset, content_type in MAGIC_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if content_type == "image/webp" and not head.startswith(b"RIFF"):
+                continue
+            return content_type
+    return None
+
+
+def check_grid(cols: int, rows: int):
+    """
+    Kiểm tra kích thước lưới đầu ra trước khi cấp phát gì
+
+    Raises:
+        ValueError: Nếu cols/rows < 1 hoặc cols x rows vượt settings.max_grid_cells
+    """
+    if cols < 1 or rows < 1:
+        raise ValueError("cols và rows phải >= 1")
+    if cols * rows > settings.max_grid_cells:
+        raise ValueError(
+            f"Lưới {cols}x{rows} vượt quá {settings.max_grid_cells} ô cho phép"
+        )
+
+
+def check_pixels(width: int, height: int):
+    """
+    Kiểm tra số pixel của ảnh (đọc từ header) theo settings.max_image_pixels
+
+    Raises:
+        ImageTooLargeError: Nếu ảnh có quá nhiều pixel
+    """
+    if width * height > settings.max_image_pixels:
+        raise ImageTooLargeError(
+            f"Ảnh {width}x{height} vượt quá {settings.max_image_pixels} pixel cho phép"
+        )
+
+
+def preflight_image(source: BinaryIO) -> dict:
+    """
+    Kiểm tra file ảnh chỉ bằng magic bytes và header, không decode pixel
+
+    File được seek về đầu sau khi kiểm tra.
+
+    Args:
+        source: File object đọc được, seek được
+
+    Returns:
+        Dictionary {"content_type", "width", "height"}
+
+    Raises:
+        ValueError: Nếu không phải ảnh được hỗ trợ hoặc header lỗi
+        ImageTooLargeError: Nếu ảnh vượt ngân sách pixel
+    """
+    head = source.read(16)
+    source.seek(0)
+    if not head:
+        raise ValueError("File rỗng")
+
+    content_type = sniff_image_type(head)
+    if content_type not in settings.allowed_image_types:
+        raise ValueError(
+            f"Nội dung file không phải ảnh được hỗ trợ "
+            f"({', '.join(settings.allowed_image_types)})"
+        )
+
+    try:
+        with Image.open(source) as img:
+            width, height = img.size
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    except Exception as e:
+        raise ValueError(f"Header ảnh không hợp lệ: {e}")
+    finally:
+        source.seek(0)
+
+    check_pixels(width, height)
+    return {"content_type": content_type, "width": width, "height": height}
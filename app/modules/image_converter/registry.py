@@ -0,0 +1,145 @@
+"""
+Palette Registry
+Palette đặt tên lưu trong MongoDB (collection palettes), giữ sẵn trong RAM
+"""
+import time
+from typing import Optional
+
+from app.config import settings
+from .palette import palette_hash
+from .utils import parse_palette, parse_palette_override
+
+
+class PaletteNotFoundError(LookupError):
+    """Không có palette với id đã cho"""
+
+
+class PaletteRegistry:
+    """
+    Cache trong process của palette theo id và palette con theo index
+
+    Mỗi entry giữ palette đã chuẩn hoá kèm palette_hash (key của cache kết
+    quả và của LRU CompiledPalette trong worker), nên request dùng palette
+    có sẵn chỉ tốn một lần tra dict. CompiledPalette (LUT, màu RGB/Lab) được
+    biên dịch một lần trong mỗi worker theo hash đó.
+
+    Entry theo id bị xoá ngay khi palette được sửa/xoá qua API của process
+    này; process khác (nhiều instance) nhận thay đổi sau tối đa ttl giây.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = settings.palette_registry_ttl if ttl is None else ttl
+        self._by_id: dict[str, tuple[dict[int, str], str, float]] = {}
+        self._subsets: dict[tuple[str, str], tuple[dict[int, str], str]] = {}
+        self._default: Optional[tuple[dict[int, str], str]] = None
+
+    async def _load(self, palette_id: str) -> tuple[dict[int, str], str]:
+        from app.modules.database.service import database_service
+
+        doc = await database_service.get_palette(palette_id)
+        if doc is None:
+            raise PaletteNotFoundError(f"Không tìm thấy palette {palette_id}")
+
+        palette = parse_palette(doc["colors"])
+        entry = (palette, palette_hash(palette))
+        self._by_id[palette_id] = (*entry, time.monotonic())
+        return entry
+
+    async def get(self, palette_id: str) -> tuple[dict[int, str], str]:
+        """
+        Lấy palette theo id (đọc MongoDB nếu chưa có hoặc đã quá ttl)
+
+        Args:
+            palette_id: ID của palette
+
+        Returns:
+            Tuple (palette {index: hex_color}, palette_hash)
+
+        Raises:
+            PaletteNotFoundError: Nếu không có palette
+        """
+        entry = self._by_id.get(palette_id)
+        if entry is not None and time.monotonic() - entry[2] < self.ttl:
+            return entry[0], entry[1]
+        return await self._load(palette_id)
+
+    def subset(
+        self, palette_override: str, base: dict[int, str], base_key: str
+    ) -> tuple[dict[int, str], str]:
+        """
+        Palette con theo danh sách index (palette_override), cache theo chuỗi gốc
+
+        Args:
+            palette_override: "1,2,3" hoặc "[1,2,3]"
+            base: Palette gốc
+            base_key: palette_hash của palette gốc
+
+        Returns:
+            Tuple (palette con, palette_hash)
+
+        Raises:
+            ValueError: Nếu palette_override không hợp lệ
+        """
+        cache_key = (base_key, palette_override)
+        entry = self._subsets.get(cache_key)
+        if entry is None:
+            palette = parse_palette_override(palette_override, base)
+            entry = (palette, palette_hash(palette))
+            if len(self._subsets) >= settings.palette_cache_size * 4:
+                self._subsets.clear()
+            self._subsets[cache_key] = entry
+        return entry
+
+    async def resolve(
+        self,
+        palette_id: Optional[str] = None,
+        palette_override: Optional[str] = None,
+    ) -> tuple[dict[int, str], str]:
+        """
+        Palette cho một request: palette_id (mặc định palette mặc định), sau đó
+        lọc theo palette_override nếu có
+
+        Args:
+            palette_id: ID palette trong MongoDB (optional)
+            palette_override: Danh sách index màu giữ lại (optional)
+
+        Returns:
+            Tuple (palette, palette_hash)
+
+        Raises:
+            PaletteNotFoundError: Nếu palette_id không tồn tại
+            ValueError: Nếu palette_override không hợp lệ
+        """
+        if palette_id:
+            palette, key = await self.get(palette_id)
+        else:
+            palette, key = self.default()
+
+        if palette_override and palette_override.strip():
+            palette, key = self.subset(palette_override, palette, key)
+        return palette, key
+
+    def default(self) -> tuple[dict[int, str], str]:
+        """Palette mặc định và hash của nó (tính một lần)"""
+        if self._default is None:
+            palette = settings.default_palette
+            self._default = (palette, palette_hash(palette))
+        return self._default
+
+    def invalidate(self, palette_id: Optional[str] = None):
+        """
+        Bỏ palette khỏi cache (gọi khi palette bị sửa/xoá)
+
+        Args:
+            palette_id: ID palette, None để xoá toàn bộ
+        """
+        # Palette con được cache theo hash của palette gốc nên palette đã đổi
+        # không bao giờ trùng key cũ, chỉ cần bỏ entry theo id
+        if palette_id is None:
+            self._by_id.clear()
+        else:
+            self._by_id.pop(palette_id, None)
+
+
+# Singleton instance
+palette_registry = PaletteRegistry()
@@ -2,12 +2,196 @@
 Image Converter Routes
 API endpoints cho chuyển đổi ảnh
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import asyncio
+import json
+import time
+from typing import BinaryIO, Optional, Union
 
-from .service import image_converter_service
+import numpy as np
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.modules.database.service import database_service
+from .cache import conversion_cache
+from .colorspace import COLOR_METRICS
+from .decode import DOWNSAMPLE_MODES
+from .dither import DITHER_MODES
+from .executor import ConverterBusyError, conversion_executor
+from .level import LEVEL_DIFFICULTIES, level_history_doc
+from .packing import MATRIX_FORMATS, diff_matrix
+from .palette import palette_hash
+from .preflight import check_grid, preflight_image
+from .registry import PaletteNotFoundError, palette_registry
+from .service import (
+    convert_image_task,
+    convert_level_task,
+    convert_variants_task,
+    decode_grid_task,
+    image_converter_service,
+    quantize_band_task,
+    quantize_frames_task,
+    timed_convert_image_task,
+)
+from .upload import UploadTooLargeError, read_upload
+from .utils import parse_palette
 
 router = APIRouter(prefix="/image", tags=["Image Converter"])
 
+# Media type để client chọn định dạng packed qua header Accept
+PACKED_MEDIA_TYPE = "application/vnd.mirai-matrix.packed+json"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Chờ trước khi thử lại khi hàng đợi của worker pool đầy (giữa stream)
+_BUSY_RETRY_SECONDS = 0.25
+
+
+def resolve_matrix_format(request: Request, matrix_format: Optional[str]) -> str:
+    """
+    Chọn định dạng matrix: query param format, sau đó header Accept
+    
+    Args:
+        request: Request hiện tại
+        matrix_format: Giá trị query param format (None nếu không truyền)
+    
+    Returns:
+        "json" hoặc "packed"
+    
+    Raises:
+        HTTPException: Nếu format không hợp lệ
+    """
+    if matrix_format is None:
+        accept = request.headers.get("accept", "")
+        return "packed" if PACKED_MEDIA_TYPE in accept else "json"
+    
+    if matrix_format not in MATRIX_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"format phải là một trong {', '.join(MATRIX_FORMATS)}",
+        )
+    return matrix_format
+
+
+def validate_choice(name: str, value: str, choices: tuple[str, ...]) -> str:
+    """
+    Kiểm tra tham số chỉ nhận một số giá trị cố định (metric, dither...)
+    
+    Raises:
+        HTTPException: Nếu giá trị không hợp lệ
+    """
+    if value not in choices:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{name} phải là một trong {', '.join(choices)}",
+        )
+    return value
+
+
+async def resolve_palette(
+    palette_id: Optional[str], palette_override: Optional[str]
+) -> tuple[dict[int, str], str]:
+    """
+    Palette của request từ registry (palette_id, palette_override)
+    
+    Args:
+        palette_id: ID palette trong MongoDB (optional, mặc định palette mặc định)
+        palette_override: Danh sách index màu giữ lại, ví dụ "1,2,3" (optional)
+    
+    Returns:
+        Tuple (palette, palette_hash)
+    
+    Raises:
+        HTTPException: 404 nếu palette_id không tồn tại, 400 nếu override sai
+    """
+    try:
+        return await palette_registry.resolve(palette_id, palette_override)
+    except PaletteNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def resolve_shared_palette(
+    palette: Optional[str], palette_id: Optional[str], palette_override: Optional[str]
+) -> dict[int, str]:
+    """
+    Palette dùng chung của batch/variants: JSON truyền thẳng hoặc qua registry
+    
+    Args:
+        palette: Palette dạng JSON {"1": "#ff0000", ...} (optional)
+        palette_id: ID palette trong MongoDB (optional)
+        palette_override: Danh sách index màu giữ lại, ví dụ "1,2,3" (optional)
+    
+    Returns:
+        Palette dùng chung (mặc định palette mặc định)
+    
+    Raises:
+        HTTPException: 400 nếu truyền cả palette lẫn palette_id/palette_override
+            hoặc tham số sai, 404 nếu palette_id không tồn tại
+    """
+    if palette is None:
+        shared_palette, _ = await resolve_palette(palette_id, palette_override)
+        return shared_palette
+    
+    if palette_id is not None or palette_override is not None:
+        raise HTTPException(
+            status_code=400,
+            detail="Chỉ truyền palette hoặc palette_id/palette_override, không cả hai",
+        )
+    try:
+        return parse_palette(palette) or image_converter_service.default_palette
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def read_image_upload(file: UploadFile) -> tuple[BinaryIO, str]:
+    """
+    Đọc file upload và kiểm tra preflight (magic bytes, header, ngân sách pixel)
+    
+    Định dạng lấy theo nội dung file, không tin content_type client gửi.
+    
+    Args:
+        file: File ảnh upload
+    
+    Returns:
+        Tuple (file object đã seek về 0, sha256 nội dung)
+    
+    Raises:
+        UploadTooLargeError: Nếu file vượt quá max_image_size hoặc ảnh vượt
+            max_image_pixels (ImageTooLargeError)
+        ValueError: Nếu file không phải ảnh hợp lệ
+    """
+    source, size, digest = await read_upload(file, settings.max_image_size)
+    
+    info = preflight_image(source)
+    is_valid, error_msg = image_converter_service.validate_file(info["content_type"], size)
+    if not is_valid:
+        raise ValueError(error_msg)
+    return source, digest
+
+
+async def open_upload(file: UploadFile) -> tuple[Union[bytes, BinaryIO], str]:
+    """
+    Đọc và validate file upload, trả về dữ liệu để đưa vào worker pool
+    
+    Args:
+        file: File ảnh upload
+    
+    Returns:
+        Tuple (dữ liệu ảnh, sha256 nội dung). Dữ liệu là bytes nếu chạy bằng
+        process pool (cần pickle), ngược lại là file object spool để decoder
+        đọc trực tiếp
+    
+    Raises:
+        UploadTooLargeError: Nếu file hoặc số pixel vượt giới hạn
+        ValueError: Nếu file không hợp lệ
+    """
+    source, digest = await read_image_upload(file)
+    
+    if conversion_executor.uses_processes:
+        return source.read(), digest
+    return source, digest
+
 
 @router.get("/palette")
 async def get_palette():
@@ -22,9 +206,20 @@ async def get_palette():
 
 @router.post("/convert")
 async def convert_image(
-    file: UploadFile = File(..., description="Ảnh đầu vào (png/jpg/webp)"),
+    request: Request,
+    response: Response,
+    file: UploadFile = File(..., description="Ảnh đầu vào (png/jpg/webp/gif)"),
     cols: int = 30,
     rows: int = 30,
+    format: Optional[str] = None,
+    rle: bool = False,
+    metric: str = "rgb",
+    dither: str = "none",
+    downsample: str = "nearest",
+    palette_id: Optional[str] = Form(None, description="ID palette đã lưu (/api/palettes)"),
+    palette_override: Optional[str] = Form(
+        None, description="Chỉ dùng các index màu này, ví dụ 1,2,3 hoặc [1,2,3]"
+    ),
 ):
     """
     Chuyển đổi ảnh thành pixel art matrix
@@ -33,31 +228,806 @@ async def convert_image(
         file: File ảnh upload
         cols: Số cột (mặc định 30)
         rows: Số hàng (mặc định 30)
+        palette_id: Palette đã lưu trong MongoDB (optional, mặc định palette mặc định)
+        palette_override: Chỉ giữ các index màu này của palette (optional)
+        format: "json" (mặc định) hoặc "packed" (base64, xem meta.encoding);
+            không truyền thì theo header Accept
+        rle: Nén run-length cho định dạng packed
+        metric: Khoảng cách màu: rgb (mặc định), lab (ΔE76) hoặc de2000
+        dither: none (mặc định), bayer hoặc floyd-steinberg
+        downsample: nearest (mặc định), box (trung bình vùng) hoặc majority
     
     Returns:
-        Dictionary chứa matrix và metadata
+        Dictionary chứa matrix (hoặc data nếu packed) và metadata
+        (header X-Cache: HIT/MISS)
     
     Raises:
         HTTPException: Nếu file không hợp lệ hoặc xử lý lỗi
     """
-    # Đọc dữ liệu file
-    data = await file.read()
+    matrix_format = resolve_matrix_format(request, format)
+    options = {
+        "matrix_format": matrix_format,
+        "rle": rle and matrix_format == "packed",
+        "metric": validate_choice("metric", metric, COLOR_METRICS),
+        "dither": validate_choice("dither", dither, DITHER_MODES),
+        "downsample": validate_choice("downsample", downsample, DOWNSAMPLE_MODES),
+    }
+    try:
+        check_grid(cols, rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    palette, palette_key = await resolve_palette(palette_id, palette_override)
+    
+    # Đọc file theo chunk và validate
+    try:
+        source, digest = await open_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Validate file
-    is_valid, error_msg = image_converter_service.validate_file(
-        file.content_type,
-        len(data)
+    # Ảnh + tham số đã chuyển đổi trước đó thì trả luôn, không decode lại
+    cache_key = conversion_cache.make_key(
+        digest, cols, rows, palette_key, mode="index", **options
     )
+    cached = await conversion_cache.get(cache_key)
+    if cached is not None:
+        response.headers["X-Cache"] = "HIT"
+        return cached
     
-    if not is_valid:
-        raise HTTPException(status_code=400, detail=error_msg)
+    # Chuyển đổi ảnh trong worker pool, event loop vẫn phục vụ request khác
+    try:
+        result = await conversion_executor.run(
+            convert_image_task, source, cols, rows, palette, **options
+        )
+    except ConverterBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi xử lý ảnh: {e}")
+    
+    await conversion_cache.put(cache_key, result)
+    response.headers["X-Cache"] = "MISS"
+    return result
+
+
+async def run_when_free(fn, *args, **kwargs):
+    """
+    conversion_executor.run nhưng chờ đến lượt thay vì báo bận
+
+    Dùng khi response đã bắt đầu gửi (không còn trả 503 được nữa).
+    """
+    while True:
+        try:
+            return await conversion_executor.run(fn, *args, **kwargs)
+        except ConverterBusyError:
+            await asyncio.sleep(_BUSY_RETRY_SECONDS)
+
+
+def ndjson_line(payload: dict) -> bytes:
+    """Một dòng NDJSON (JSON gọn + xuống dòng)"""
+    return (json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def used_colors(
+    palette: dict[int, str], totals: np.ndarray
+) -> tuple[dict[int, str], dict[int, int]]:
+    """
+    Palette và số ô của các màu đã dùng, theo index tăng dần như /convert
+    
+    Args:
+        palette: Palette của request
+        totals: Số ô cộng dồn theo vị trí palette (từ quantize_band)
+    
+    Returns:
+        Tuple (palette các màu đã dùng, {index: số ô})
+    """
+    counts = sorted(
+        (int(k), int(n)) for k, n in zip(palette, totals.tolist()) if n
+    )
+    palette_by_index = {int(k): v for k, v in palette.items()}
+    return {idx: palette_by_index[idx] for idx, _ in counts}, dict(counts)
+
+
+@router.post("/convert/stream")
+async def convert_image_stream(
+    file: UploadFile = File(..., description="Ảnh đầu vào (png/jpg/webp/gif)"),
+    cols: int = 30,
+    rows: int = 30,
+    metric: str = "rgb",
+    dither: str = "none",
+    downsample: str = "nearest",
+    band_rows: Optional[int] = None,
+    palette_id: Optional[str] = Form(None, description="ID palette đã lưu (/api/palettes)"),
+    palette_override: Optional[str] = Form(
+        None, description="Chỉ dùng các index màu này, ví dụ 1,2,3 hoặc [1,2,3]"
+    ),
+):
+    """
+    Chuyển đổi ảnh thành matrix và stream từng hàng dạng NDJSON (lưới rất lớn)
+    
+    Ảnh được decode một lần, sau đó lượng tử hoá theo từng dải band_rows hàng
+    trong worker pool; hàng của dải trước được gửi trong khi dải sau đang
+    tính. Không dựng cả matrix dạng list trong RAM, không qua cache kết quả.
+    
+    Mỗi dòng là một JSON object:
+    - {"type": "meta", "cols", "rows", "metric", "dither", "downsample", "decode"}
+    - {"type": "row", "y": 0, "row": [1, 2, ...]} cho từng hàng theo thứ tự
+    - {"type": "end", "palette": {màu đã dùng}, "counts": {index: số ô}, "elapsed_ms"}
+    - {"type": "error", "detail"} nếu lỗi sau khi đã bắt đầu stream
+    
+    Args:
+        file: File ảnh upload
+        cols: Số cột (mặc định 30)
+        rows: Số hàng (mặc định 30)
+        metric: Khoảng cách màu: rgb (mặc định), lab (ΔE76) hoặc de2000
+        dither: none (mặc định), bayer hoặc floyd-steinberg
+        downsample: nearest (mặc định), box (trung bình vùng) hoặc majority
+        band_rows: Số hàng mỗi dải (mặc định settings.stream_band_rows)
+        palette_id: Palette đã lưu trong MongoDB (optional)
+        palette_override: Chỉ giữ các index màu này của palette (optional)
+    
+    Returns:
+        StreamingResponse application/x-ndjson
+    
+    Raises:
+        HTTPException: Nếu file/tham số không hợp lệ hoặc decode lỗi
+    """
+    started = time.perf_counter()
+    validate_choice("metric", metric, COLOR_METRICS)
+    validate_choice("dither", dither, DITHER_MODES)
+    validate_choice("downsample", downsample, DOWNSAMPLE_MODES)
+    try:
+        check_grid(cols, rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    band_rows = band_rows or settings.stream_band_rows
+    if band_rows < 1:
+        raise HTTPException(status_code=400, detail="band_rows phải >= 1")
+    palette, _ = await resolve_palette(palette_id, palette_override)
     
-    # Chuyển đổi ảnh
     try:
-        result = image_converter_service.convert_image(data, cols, rows)
-        return result
+        source, _ = await open_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Decode trước khi bắt đầu stream để lỗi vẫn trả được status 400/503
+    try:
+        pixels, decode_info = await conversion_executor.run(
+            decode_grid_task, source, cols, rows, downsample
+        )
+    except ConverterBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi xử lý ảnh: {e}")
+    
+    block = decode_info.get("block")
+    scale = block or 1
+    
+    def submit_band(y: int, carry=None) -> asyncio.Task:
+        band = pixels[y * scale:(y + band_rows) * scale]
+        return asyncio.ensure_future(run_when_free(
+            quantize_band_task, band, palette, metric, dither, block, y * scale, carry
+        ))
+    
+    async def rows_stream():
+        yield ndjson_line({
+            "type": "meta", "cols": cols, "rows": rows, "metric": metric,
+            "dither": dither, "downsample": downsample, "decode": decode_info,
+        })
+        
+        # Floyd-Steinberg cần sai số của dải trước nên chạy tuần tự; các chế
+        # độ khác tính trước dải kế tiếp trong lúc gửi dải hiện tại
+        sequential = dither == "floyd-steinberg"
+        totals = np.zeros(len(palette), dtype=np.int64)
+        pending = submit_band(0)
+        try:
+            for y in range(0, rows, band_rows):
+                indices, counts, carry = await pending
+                next_y = y + band_rows
+                pending = None
+                if next_y < rows and not sequential:
+                    pending = submit_band(next_y)
+                
+                totals += counts
+                yield b"".join(
+                    ndjson_line({"type": "row", "y": y + offset, "row": row})
+                    for offset, row in enumerate(indices.tolist())
+                )
+                
+                if next_y < rows and sequential:
+                    pending = submit_band(next_y, carry)
+        except Exception as e:
+            yield ndjson_line({"type": "error", "detail": f"Lỗi xử lý ảnh: {e}"})
+            return
+        finally:
+            # Client ngắt kết nối giữa chừng thì bỏ dải đang tính dở
+            if pending is not None and not pending.done():
+                pending.cancel()
+        
+        used_palette, counts = used_colors(palette, totals)
+        yield ndjson_line({
+            "type": "end",
+            "palette": used_palette,
+            "counts": counts,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        })
+    
+    return StreamingResponse(rows_stream(), media_type=NDJSON_MEDIA_TYPE)
 
+
+@router.post("/convert/frames")
+async def convert_image_frames(
+    file: UploadFile = File(..., description="Ảnh động (gif/webp); ảnh tĩnh là 1 frame"),
+    cols: int = 30,
+    rows: int = 30,
+    metric: str = "rgb",
+    dither: str = "none",
+    downsample: str = "nearest",
+    delta: bool = True,
+    palette_id: Optional[str] = Form(None, description="ID palette đã lưu (/api/palettes)"),
+    palette_override: Optional[str] = Form(
+        None, description="Chỉ dùng các index màu này, ví dụ 1,2,3 hoặc [1,2,3]"
+    ),
+):
+    """
+    Chuyển đổi từng frame của ảnh động (GIF/WebP) và stream dạng NDJSON
+    
+    Ảnh được mở một lần cho cả request; frame được decode lười theo từng
+    lượt settings.frame_batch frame (mỗi lượt seek tiếp từ frame trước) và
+    lượng tử hoá trong worker pool, lượt sau tính trong lúc gửi lượt trước.
+    Mọi frame dùng chung palette đã biên dịch. Với delta=true, frame sau chỉ gửi các ô thay
+    đổi so với frame trước; frame đổi nhiều (delta không gọn hơn) vẫn gửi
+    matrix đầy đủ. Không qua cache kết quả.
+    
+    Mỗi dòng là một JSON object:
+    - {"type": "meta", "cols", "rows", "frame_count", "loop", "encoding", ...}
+    - {"type": "frame", "index", "duration", "matrix": [[...]]} hoặc
+      {"type": "frame", "index", "duration", "changes": [[y, x, index], ...]}
+    - {"type": "end", "palette": {màu đã dùng}, "counts": {index: số ô cộng
+      dồn mọi frame}, "elapsed_ms"}
+    - {"type": "error", "detail"} nếu lỗi sau khi đã bắt đầu stream
+    
+    Args:
+        file: File ảnh upload
+        cols: Số cột (mặc định 30)
+        rows: Số hàng (mặc định 30)
+        metric: Khoảng cách màu: rgb (mặc định), lab (ΔE76) hoặc de2000
+        dither: none (mặc định), bayer hoặc floyd-steinberg
+        downsample: nearest (mặc định), box (trung bình vùng) hoặc majority
+        delta: Gửi frame sau dạng delta (mặc định true) hay matrix đầy đủ
+        palette_id: Palette đã lưu trong MongoDB (optional)
+        palette_override: Chỉ giữ các index màu này của palette (optional)
+    
+    Returns:
+        StreamingResponse application/x-ndjson
+    
+    Raises:
+        HTTPException: Nếu file/tham số không hợp lệ, quá nhiều frame hoặc decode lỗi
+    """
+    started = time.perf_counter()
+    validate_choice("metric", metric, COLOR_METRICS)
+    validate_choice("dither", dither, DITHER_MODES)
+    validate_choice("downsample", downsample, DOWNSAMPLE_MODES)
+    try:
+        check_grid(cols, rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    palette, _ = await resolve_palette(palette_id, palette_override)
+    
+    try:
+        source, _ = await read_image_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    batch = settings.frame_batch
+    
+    # Một FrameSequence cho cả request: n_frames chỉ đếm một lần và các lượt
+    # sau seek tiếp từ frame đang đứng. Decode chạy tuần tự trong thread (ảnh
+    # đang mở không gửi sang process khác được), lượng tử hoá qua worker pool.
+    # Đọc ra bytes vì file upload có thể bị đóng trước khi stream xong.
+    try:
+        sequence = await asyncio.to_thread(
+            image_converter_service.open_frames, source.read(), cols, rows, downsample
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    decode_info = sequence.info
+    frame_count = sequence.frame_count
+    block = decode_info.get("block")
+    
+    async def convert_batch(start: int, run=run_when_free) -> list[dict]:
+        frames = await asyncio.to_thread(
+            image_converter_service.decode_frames, sequence, start, batch
+        )
+        return await run(quantize_frames_task, frames, palette, metric, dither, block)
+    
+    def submit_frames(start: int) -> asyncio.Task:
+        return asyncio.ensure_future(convert_batch(start))
+    
+    # Lượt đầu chạy trước khi stream để lỗi decode vẫn trả được status 400/503
+    try:
+        first = await convert_batch(0, conversion_executor.run)
+    except ConverterBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi xử lý ảnh: {e}")
+    
+    async def frames_stream():
+        yield ndjson_line({
+            "type": "meta", "cols": cols, "rows": rows, "frame_count": frame_count,
+            "loop": decode_info["loop"], "encoding": "delta" if delta else "full",
+            "metric": metric, "dither": dither, "downsample": downsample,
+            "decode": decode_info,
+        })
+        
+        totals = np.zeros(len(palette), dtype=np.int64)
+        previous = None
+        chunk, start, pending = first, 0, None
+        try:
+            while True:
+                next_start = start + batch
+                if next_start < frame_count:
+                    pending = submit_frames(next_start)
+                
+                lines = []
+                for frame in chunk:
+                    matrix = frame["matrix"]
+                    totals += frame["counts"]
+                    line = {"type": "frame", "index": frame["index"], "duration": frame["duration"]}
+                    changes = None
+                    if delta and previous is not None:
+                        changes = diff_matrix(previous, matrix)
+                    # Mỗi ô đổi tốn 3 số, delta chỉ lợi khi đổi ít hơn 1/3 số ô
+                    if changes is not None and changes.size < matrix.size:
+                        line["changes"] = changes.tolist()
+                    else:
+                        line["matrix"] = matrix.tolist()
+                    previous = matrix
+                    lines.append(ndjson_line(line))
+                yield b"".join(lines)
+                
+                if pending is None:
+                    break
+                chunk, start, pending = await pending, next_start, None
+        except Exception as e:
+            yield ndjson_line({"type": "error", "detail": f"Lỗi xử lý ảnh: {e}"})
+            return
+        finally:
+            # Client ngắt kết nối giữa chừng thì bỏ lượt đang tính dở
+            if pending is not None and not pending.done():
+                pending.cancel()
+        
+        used_palette, counts = used_colors(palette, totals)
+        yield ndjson_line({
+            "type": "end",
+            "palette": used_palette,
+            "counts": counts,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        })
+    
+    return StreamingResponse(frames_stream(), media_type=NDJSON_MEDIA_TYPE)
+
+
+@router.post("/convert/level")
+async def convert_image_level(
+    file: UploadFile = File(..., description="Ảnh đầu vào (png/jpg/webp/gif)"),
+    cols: int = 30,
+    rows: int = 30,
+    metric: str = "rgb",
+    dither: str = "none",
+    downsample: str = "nearest",
+    save: bool = False,
+    name: Optional[str] = Form(None, description="Tên level (mặc định tên file)"),
+    difficulty: str = Form("Medium", description="Easy, Medium hoặc Hard"),
+    palette_id: Optional[str] = Form(None, description="ID palette đã lưu (/api/palettes)"),
+    palette_override: Optional[str] = Form(
+        None, description="Chỉ dùng các index màu này, ví dụ 1,2,3 hoặc [1,2,3]"
+    ),
+):
+    """
+    Chuyển đổi ảnh thẳng thành level (board CellModel + config) cho /db/histories
+    
+    Board, config.colorMapping, selectedColors, blockCount và colorCount được
+    dựng trên server từ matrix index, client không phải dịch matrix rồi gửi
+    lại cả board. save=true lưu luôn level thành history item.
+    
+    Args:
+        file: File ảnh upload
+        cols: Số cột (config.width, mặc định 30)
+        rows: Số hàng (config.height, mặc định 30)
+        metric: Khoảng cách màu: rgb (mặc định), lab (ΔE76) hoặc de2000
+        dither: none (mặc định), bayer hoặc floyd-steinberg
+        downsample: nearest (mặc định), box (trung bình vùng) hoặc majority
+        save: Lưu level thành history item (mặc định false)
+        name: Tên level (optional, mặc định tên file không có đuôi)
+        difficulty: Easy, Medium (mặc định) hoặc Hard
+        palette_id: Palette đã lưu trong MongoDB (optional)
+        palette_override: Chỉ giữ các index màu này của palette (optional)
+    
+    Returns:
+        Dictionary chứa level, meta chuyển đổi (như /convert, không có matrix)
+        và history (_id, id, name, createdAt của history đã lưu; None nếu save=false)
+    
+    Raises:
+        HTTPException: Nếu file/tham số không hợp lệ, xử lý lỗi hoặc lưu lỗi
+    """
+    options = {
+        "metric": validate_choice("metric", metric, COLOR_METRICS),
+        "dither": validate_choice("dither", dither, DITHER_MODES),
+        "downsample": validate_choice("downsample", downsample, DOWNSAMPLE_MODES),
+        "difficulty": validate_choice("difficulty", difficulty, LEVEL_DIFFICULTIES),
+    }
+    try:
+        check_grid(cols, rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    palette, _ = await resolve_palette(palette_id, palette_override)
+    name = name or (file.filename or "level").rsplit(".", 1)[0]
+    
+    try:
+        source, _ = await open_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        result = await conversion_executor.run(
+            convert_level_task, source, cols, rows, name, palette, **options
+        )
+    except ConverterBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi xử lý ảnh: {e}")
+    
+    history = None
+    if save:
+        try:
+            # Level do server dựng đã đúng dạng HistoryLevelModel, lưu thẳng dict
+            doc = await database_service.insert_history_item(
+                level_history_doc(result["level"])
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Lỗi lưu history: {e}")
+        # level trong result đã được điền id/timestamp, không gửi board lần hai
+        history = {
+            "_id": doc["_id"],
+            "id": doc["value"]["id"],
+            "name": doc["value"]["name"],
+            "createdAt": doc["value"]["createdAt"],
+        }
+    
+    return {**result, "history": history}
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Thống kê cache kết quả chuyển đổi (hit/miss, dung lượng)
+    
+    Returns:
+        Dictionary chứa bộ đếm của cache
+    """
+    return conversion_cache.stats()
+
+
+@router.delete("/cache")
+async def clear_cache():
+    """
+    Xoá cache kết quả trong process (không xoá tầng MongoDB)
+    
+    Returns:
+        Thống kê cache sau khi xoá
+    """
+    conversion_cache.clear()
+    return conversion_cache.stats()
+
+
+@router.post("/convert/batch")
+async def convert_image_batch(
+    request: Request,
+    files: list[UploadFile] = File(..., description="Danh sách ảnh (png/jpg/webp/gif)"),
+    cols: int = 30,
+    rows: int = 30,
+    format: Optional[str] = None,
+    rle: bool = False,
+    metric: str = "rgb",
+    dither: str = "none",
+    downsample: str = "nearest",
+    palette: Optional[str] = Form(
+        None, description='Palette dùng chung dạng JSON {"1": "#ff0000", ...}'
+    ),
+    palette_id: Optional[str] = Form(None, description="ID palette đã lưu (/api/palettes)"),
+    palette_override: Optional[str] = Form(
+        None, description="Chỉ dùng các index màu này, ví dụ 1,2,3 hoặc [1,2,3]"
+    ),
+    items: Optional[str] = Form(
+        None,
+        description=(
+            'Tùy chọn riêng từng file dạng JSON [{"cols", "rows", "palette", "metric"}, ...]'
+        ),
+    ),
+):
+    """
+    Chuyển đổi nhiều ảnh trong một request, xử lý song song trong worker pool
+    
+    Args:
+        files: Các file ảnh upload
+        cols: Số cột dùng chung (mặc định 30)
+        rows: Số hàng dùng chung (mặc định 30)
+        palette: Palette dùng chung dạng JSON (optional, mặc định palette mặc định)
+        palette_id: ID palette đã lưu dùng chung thay cho palette (optional)
+        palette_override: Chỉ dùng các index màu này của palette_id (optional)
+        items: Tùy chọn riêng cho từng file, cùng thứ tự với files (optional)
+        format: Định dạng matrix cho mọi kết quả, như /convert
+        rle: Nén run-length cho định dạng packed
+        metric: Khoảng cách màu dùng chung (rgb, lab, de2000)
+        dither: Dither cho mọi ảnh (none, bayer, floyd-steinberg)
+        downsample: Cách thu nhỏ cho mọi ảnh (nearest, box, majority)
+    
+    Returns:
+        Dictionary chứa kết quả theo đúng thứ tự file, lỗi riêng từng file
+        và thống kê thời gian
+    
+    Raises:
+        HTTPException: Nếu tham số của cả batch không hợp lệ
+    """
+    started = time.perf_counter()
+    matrix_format = resolve_matrix_format(request, format)
+    options = {
+        "matrix_format": matrix_format,
+        "rle": rle and matrix_format == "packed",
+        "dither": validate_choice("dither", dither, DITHER_MODES),
+        "downsample": validate_choice("downsample", downsample, DOWNSAMPLE_MODES),
+    }
+    validate_choice("metric", metric, COLOR_METRICS)
+    
+    if len(files) > settings.max_batch_files:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tối đa {settings.max_batch_files} file mỗi batch",
+        )
+    
+    shared_palette = await resolve_shared_palette(palette, palette_id, palette_override)
+    try:
+        overrides = json.loads(items) if items else [{}] * len(files)
+    except (ValueError, json.JSONDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not isinstance(overrides, list) or len(overrides) != len(files):
+        raise HTTPException(
+            status_code=400, detail="items phải là list cùng độ dài với files"
+        )
+    
+    # Giới hạn số ảnh của batch chạy đồng thời để không chiếm hết hàng đợi
+    semaphore = asyncio.Semaphore(max(1, conversion_executor.workers))
+    
+    async def convert_one(index: int, file: UploadFile, override: dict) -> dict:
+        item = {"index": index, "filename": file.filename}
+        try:
+            if not isinstance(override, dict):
+                raise ValueError("Mỗi phần tử của items phải là object")
+            
+            item_cols = int(override.get("cols", cols))
+            item_rows = int(override.get("rows", rows))
+            check_grid(item_cols, item_rows)
+            item_palette = parse_palette(override.get("palette")) or shared_palette
+            item_metric = override.get("metric", metric)
+            if item_metric not in COLOR_METRICS:
+                raise ValueError(f"metric phải là một trong {', '.join(COLOR_METRICS)}")
+            
+            # File vẫn nằm trong spool của upload; chỉ hash + preflight ở đây
+            source, digest = await read_image_upload(file)
+            
+            cache_key = conversion_cache.make_key(
+                digest, item_cols, item_rows, palette_hash(item_palette), mode="index",
+                metric=item_metric, **options
+            )
+            result = await conversion_cache.get(cache_key)
+            if result is not None:
+                item.update(success=True, cached=True, elapsed_ms=0.0, result=result)
+                return item
+            
+            async with semaphore:
+                # Process pool cần bytes (pickle): chỉ đọc vào RAM khi đã tới lượt,
+                # nên cùng lúc chỉ khoảng workers file nằm trong bộ nhớ
+                data = source.read() if conversion_executor.uses_processes else source
+                result, elapsed_ms = await conversion_executor.run(
+                    timed_convert_image_task, data, item_cols, item_rows, item_palette,
+                    metric=item_metric, **options,
+                )
+                del data
+            await conversion_cache.put(cache_key, result)
+            item.update(
+                success=True, cached=False, elapsed_ms=round(elapsed_ms, 2), result=result
+            )
+        except (ValueError, TypeError, ConverterBusyError) as e:
+            item.update(success=False, error=str(e))
+        except Exception as e:
+            item.update(success=False, error=f"Lỗi xử lý ảnh: {e}")
+        return item
+    
+    results = await asyncio.gather(
+        *[convert_one(i, f, o) for i, (f, o) in enumerate(zip(files, overrides))]
+    )
+    
+    convert_times = [item["elapsed_ms"] for item in results if item["success"]]
+    succeeded = len(convert_times)
+    
+    return {
+        "items": results,
+        "summary": {
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+        },
+        "timings": {
+            "wall_ms": round((time.perf_counter() - started) * 1000, 2),
+            "convert_ms_total": round(sum(convert_times), 2),
+            "convert_ms_avg": round(sum(convert_times) / succeeded, 2) if succeeded else 0,
+            "convert_ms_max": round(max(convert_times), 2) if convert_times else 0,
+        },
+    }
+
+
+@router.post("/convert/variants")
+async def convert_image_variants(
+    request: Request,
+    file: UploadFile = File(..., description="Ảnh đầu vào (png/jpg/webp/gif)"),
+    variants: str = Form(
+        ...,
+        description=(
+            'Danh sách variant dạng JSON [{"cols", "rows", "palette", "metric", '
+            '"dither", "downsample"}, ...]'
+        ),
+    ),
+    palette: Optional[str] = Form(
+        None, description='Palette dùng chung dạng JSON {"1": "#ff0000", ...}'
+    ),
+    palette_id: Optional[str] = Form(None, description="ID palette đã lưu (/api/palettes)"),
+    palette_override: Optional[str] = Form(
+        None, description="Chỉ dùng các index màu này, ví dụ 1,2,3 hoặc [1,2,3]"
+    ),
+    format: Optional[str] = None,
+    rle: bool = False,
+    metric: str = "rgb",
+    dither: str = "none",
+    downsample: str = "nearest",
+):
+    """
+    Chuyển đổi một ảnh thành nhiều kích thước lưới/palette, chỉ decode một lần
+    
+    Ảnh được decode một lần thành kim tự tháp độ phân giải, mỗi variant lấy
+    mẫu từ tầng gần nhất lớn hơn nó. Variant đã có trong cache không được
+    tính lại.
+    
+    Args:
+        file: File ảnh upload
+        variants: Danh sách variant; thiếu trường nào thì dùng giá trị chung
+        palette: Palette dùng chung dạng JSON (optional, mặc định palette mặc định)
+        palette_id: ID palette đã lưu dùng chung thay cho palette (optional)
+        palette_override: Chỉ dùng các index màu này của palette_id (optional)
+        format: Định dạng matrix cho mọi variant, như /convert
+        rle: Nén run-length cho định dạng packed
+        metric: Khoảng cách màu dùng chung (rgb, lab, de2000)
+        dither: Dither dùng chung (none, bayer, floyd-steinberg)
+        downsample: Cách thu nhỏ dùng chung (nearest, box, majority)
+    
+    Returns:
+        Dictionary chứa kết quả từng variant (cùng thứ tự) và thống kê thời gian
+    
+    Raises:
+        HTTPException: Nếu file hoặc tham số không hợp lệ, hoặc xử lý lỗi
+    """
+    started = time.perf_counter()
+    matrix_format = resolve_matrix_format(request, format)
+    defaults = {
+        "metric": validate_choice("metric", metric, COLOR_METRICS),
+        "dither": validate_choice("dither", dither, DITHER_MODES),
+        "downsample": validate_choice("downsample", downsample, DOWNSAMPLE_MODES),
+    }
+    
+    shared_palette = await resolve_shared_palette(palette, palette_id, palette_override)
+    try:
+        requested = json.loads(variants)
+    except (ValueError, json.JSONDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not isinstance(requested, list) or not requested:
+        raise HTTPException(status_code=400, detail="variants phải là list không rỗng")
+    if len(requested) > settings.max_variants:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tối đa {settings.max_variants} variant mỗi request",
+        )
+    
+    # Chuẩn hoá từng variant; palette được biên dịch trong worker (LRU riêng),
+    # không biên dịch trên event loop
+    specs = []
+    try:
+        for variant in requested:
+            if not isinstance(variant, dict):
+                raise ValueError("Mỗi variant phải là object")
+            spec = {**defaults, **{k: variant[k] for k in defaults if k in variant}}
+            validate_choice("metric", spec["metric"], COLOR_METRICS)
+            validate_choice("dither", spec["dither"], DITHER_MODES)
+            validate_choice("downsample", spec["downsample"], DOWNSAMPLE_MODES)
+            spec.update(
+                cols=int(variant.get("cols", settings.default_cols)),
+                rows=int(variant.get("rows", settings.default_rows)),
+                matrix_format=matrix_format,
+                rle=rle and matrix_format == "packed",
+            )
+            check_grid(spec["cols"], spec["rows"])
+            
+            spec["palette"] = parse_palette(variant.get("palette")) or shared_palette
+            specs.append(spec)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        source, digest = await open_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Variant nào đã có trong cache thì không đưa vào worker. Key riêng
+    # (sampling="pyramid") vì lấy mẫu từ tầng kim tự tháp khác /convert
+    items = []
+    missing = []
+    for index, spec in enumerate(specs):
+        cache_key = conversion_cache.make_key(
+            digest, spec["cols"], spec["rows"], palette_hash(spec["palette"]), mode="index",
+            matrix_format=spec["matrix_format"], rle=spec["rle"], metric=spec["metric"],
+            dither=spec["dither"], downsample=spec["downsample"], sampling="pyramid",
+        )
+        item = {"index": index, "cols": spec["cols"], "rows": spec["rows"]}
+        result = await conversion_cache.get(cache_key)
+        if result is not None:
+            item.update(cached=True, elapsed_ms=0.0, result=result)
+        else:
+            missing.append((item, cache_key, spec))
+        items.append(item)
+    
+    decode_ms = 0.0
+    if missing:
+        try:
+            output = await conversion_executor.run(
+                convert_variants_task, source, [spec for _, _, spec in missing]
+            )
+        except ConverterBusyError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Lỗi xử lý ảnh: {e}")
+        
+        decode_ms = output["decode_ms"]
+        for (item, cache_key, _), result, elapsed_ms in zip(
+            missing, output["results"], output["elapsed_ms"]
+        ):
+            await conversion_cache.put(cache_key, result)
+            item.update(cached=False, elapsed_ms=round(elapsed_ms, 2), result=result)
+    
+    convert_times = [item["elapsed_ms"] for item in items]
+    return {
+        "variants": items,
+        "timings": {
+            "wall_ms": round((time.perf_counter() - started) * 1000, 2),
+            "decode_ms": round(decode_ms, 2),
+            "convert_ms_total": round(sum(convert_times), 2),
+            "convert_ms_max": round(max(convert_times), 2),
+        },
+    }
@@ -2,12 +2,24 @@
 Image Converter Service
 Business logic cho việc chuyển đổi ảnh
 """
-from PIL import Image
-from io import BytesIO
-from typing import Optional
+import time
+
+import numpy as np
+from typing import BinaryIO, Optional, Union
 
 from app.config import settings
-from .utils import build_palette_rgb, closest_palette_index, validate_image_file
+from .decode import DOWNSAMPLE_MODES, FrameSequence, ImagePyramid, decode_to_grid
+from .dither import DITHER_MODES, floyd_steinberg_band, ordered_dither, palette_spread
+from .level import build_level
+from .packing import MATRIX_FORMATS, pack_matrix
+from .palette import CompiledPalette, get_compiled_palette
+from .preflight import check_grid
+from .utils import (
+    block_majority,
+    build_palette_rgb,
+    closest_palette_index,
+    validate_image_file,
+)
 
 
 class ImageConverterService:
@@ -30,50 +42,438 @@ class ImageConverterService:
         return validate_image_file(
             content_type,
             file_size,
-            settings.max_image_size
+            settings.max_image_size,
+            settings.allowed_image_types
         )
     
     def convert_image(
         self,
-        image_data: bytes,
+        image_data: Union[bytes, BinaryIO],
         cols: int,
         rows: int,
-        palette: Optional[dict[int, str]] = None
+        palette: Optional[Union[dict[int, str], CompiledPalette]] = None,
+        matrix_format: str = "json",
+        rle: bool = False,
+        metric: str = "rgb",
+        dither: str = "none",
+        downsample: str = "nearest"
     ) -> dict:
         """
         Chuyển đổi ảnh thành pixel art matrix
         
         Args:
-            image_data: Dữ liệu ảnh (bytes)
+            image_data: Dữ liệu ảnh (bytes hoặc file object đọc được)
             cols: Số cột
             rows: Số hàng
-            palette: Palette tùy chỉnh (optional, mặc định dùng default_palette)
+            palette: Palette tùy chỉnh hoặc CompiledPalette
+                (optional, mặc định dùng default_palette)
+            matrix_format: "json" (list of lists) hoặc "packed" (base64)
+            rle: Nén run-length khi matrix_format="packed"
+            metric: Cách đo khoảng cách màu: rgb, lab (ΔE76) hoặc de2000
+                (bỏ qua nếu palette là CompiledPalette)
+            dither: none, bayer (ordered 8x8) hoặc floyd-steinberg
+            downsample: nearest (lấy một pixel), box (trung bình vùng) hoặc
+                majority (màu chiếm đa số trong khối)
+        
+        Returns:
+            Dictionary chứa matrix (hoặc data nếu packed) và metadata
+        
+        Raises:
+            ValueError: Nếu không đọc được ảnh hoặc lưới vượt max_grid_cells
+            ImageTooLargeError: Nếu ảnh vượt max_image_pixels
+        
+        Note:
+            meta.decode cho biết cách decode (jpeg_draft/full) và kích thước
+            ảnh thực sự được decode, để kiểm chứng trên production
+        """
+        self.check_options(matrix_format, dither, downsample)
+        check_grid(cols, rows)
+        
+        # Palette đã biên dịch (LUT) được cache theo hash, dùng lại giữa các request
+        compiled = self.compile_palette(palette, metric)
+        
+        img, decode_info = decode_to_grid(image_data, cols, rows, downsample)
+        
+        return self._convert_grid(
+            img, decode_info, cols, rows, compiled,
+            matrix_format, rle, dither, downsample,
+        )
+    
+    def convert_variants(
+        self,
+        image_data: Union[bytes, BinaryIO],
+        variants: list[dict]
+    ) -> dict:
+        """
+        Chuyển đổi một ảnh thành nhiều lưới/palette với một lần decode
+        
+        Args:
+            image_data: Dữ liệu ảnh (bytes hoặc file object đọc được)
+            variants: Danh sách dict tham số như convert_image: cols, rows và
+                tuỳ chọn palette, metric, matrix_format, rle, dither, downsample
+        
+        Returns:
+            Dictionary {"results": [...], "elapsed_ms": [...], "decode_ms": float}
+            theo đúng thứ tự variants
+        
+        Raises:
+            ValueError: Nếu không đọc được ảnh hoặc tham số không hợp lệ
+        """
+        if not variants:
+            raise ValueError("Cần ít nhất một variant")
+        
+        specs = []
+        for variant in variants:
+            spec = {
+                "cols": int(variant["cols"]),
+                "rows": int(variant["rows"]),
+                "matrix_format": variant.get("matrix_format", "json"),
+                "rle": bool(variant.get("rle", False)),
+                "dither": variant.get("dither", "none"),
+                "downsample": variant.get("downsample", "nearest"),
+            }
+            self.check_options(spec["matrix_format"], spec["dither"], spec["downsample"])
+            check_grid(spec["cols"], spec["rows"])
+            spec["compiled"] = self.compile_palette(
+                variant.get("palette"), variant.get("metric", "rgb")
+            )
+            specs.append(spec)
+        
+        started = time.perf_counter()
+        pyramid = ImagePyramid(
+            image_data,
+            [(spec["cols"], spec["rows"], spec["downsample"]) for spec in specs],
+        )
+        decode_ms = (time.perf_counter() - started) * 1000
+        
+        results, elapsed = [], []
+        for spec in specs:
+            started = time.perf_counter()
+            img, decode_info = pyramid.resample(spec["cols"], spec["rows"], spec["downsample"])
+            results.append(self._convert_grid(
+                img, decode_info, spec["cols"], spec["rows"], spec["compiled"],
+                spec["matrix_format"], spec["rle"], spec["dither"], spec["downsample"],
+            ))
+            elapsed.append((time.perf_counter() - started) * 1000)
+        
+        return {"results": results, "elapsed_ms": elapsed, "decode_ms": decode_ms}
+    
+    def convert_level(
+        self,
+        image_data: Union[bytes, BinaryIO],
+        cols: int,
+        rows: int,
+        name: str,
+        palette: Optional[Union[dict[int, str], CompiledPalette]] = None,
+        difficulty: str = "Medium",
+        metric: str = "rgb",
+        dither: str = "none",
+        downsample: str = "nearest"
+    ) -> dict:
+        """
+        Chuyển đổi ảnh thẳng thành level (board CellModel + config)
+        
+        Board được dựng từ array index bằng tra bảng (xem level.build_board),
+        không qua matrix dạng list hay validate Pydantic từng ô.
+        
+        Args:
+            image_data: Dữ liệu ảnh
+            cols: Số cột (config.width)
+            rows: Số hàng (config.height)
+            name: Tên level
+            palette: Palette tùy chỉnh hoặc CompiledPalette (optional)
+            difficulty: Easy, Medium hoặc Hard
+            metric: Cách đo khoảng cách màu (rgb, lab, de2000)
+            dither: none, bayer hoặc floyd-steinberg
+            downsample: nearest, box hoặc majority
+        
+        Returns:
+            Dictionary {"level": level dạng HistoryLevelModel, "meta": metadata
+            chuyển đổi như /convert}
+        
+        Raises:
+            ValueError: Nếu không đọc được ảnh hoặc tham số không hợp lệ
+        """
+        self.check_options("json", dither, downsample)
+        check_grid(cols, rows)
+        compiled = self.compile_palette(palette, metric)
+        
+        img, decode_info = decode_to_grid(image_data, cols, rows, downsample)
+        indices, counts, _ = self.quantize_band(
+            np.asarray(img, dtype=np.uint8), compiled, dither, decode_info.get("block")
+        )
+        counts = compiled.count_map(counts)
+        
+        level = build_level(indices, counts, compiled.palette, name, difficulty)
+        meta = self._build_result(
+            [], counts, compiled.palette, cols, rows, decode_info,
+            metric=compiled.metric, dither=dither, downsample=downsample,
+        )["meta"]
+        return {"level": level, "meta": meta}
+    
+    def open_frames(
+        self,
+        image_data: Union[bytes, BinaryIO],
+        cols: int,
+        rows: int,
+        downsample: str = "nearest"
+    ) -> FrameSequence:
+        """
+        Mở ảnh động một lần cho cả lượt chuyển đổi (đếm frame một lần)
+        
+        Args:
+            image_data: Dữ liệu ảnh
+            cols: Số cột
+            rows: Số hàng
+            downsample: nearest, box hoặc majority
+        
+        Returns:
+            FrameSequence; các lượt decode_frames tiếp theo chỉ seek tiếp
+            từ frame đang đứng, không decode lại từ frame 0
+        
+        Raises:
+            ValueError: Nếu không đọc được ảnh, tham số sai hoặc quá
+                settings.max_frames frame
+        """
+        check_grid(cols, rows)
+        if downsample not in DOWNSAMPLE_MODES:
+            raise ValueError(f"downsample phải là một trong {', '.join(DOWNSAMPLE_MODES)}")
+        
+        sequence = FrameSequence(image_data, cols, rows, downsample)
+        if sequence.frame_count > settings.max_frames:
+            raise ValueError(
+                f"Ảnh có {sequence.frame_count} frame, tối đa {settings.max_frames}"
+            )
+        return sequence
+    
+    def decode_frames(
+        self, sequence: FrameSequence, start: int = 0, limit: Optional[int] = None
+    ) -> list[dict]:
+        """
+        Decode các frame [start, start + limit) đã thu nhỏ về lưới
         
         Returns:
-            Dictionary chứa matrix và metadata
+            List {"index", "duration", "pixels" (array uint8 (H, W, 3))}
         
         Raises:
-            ValueError: Nếu không đọc được ảnh
+            ValueError: Nếu decode frame lỗi
         """
-        # Sử dụng palette mặc định nếu không có palette tùy chỉnh
+        return [
+            {"index": index, "duration": duration, "pixels": np.asarray(img, dtype=np.uint8)}
+            for index, img, duration in sequence.frames(start, limit)
+        ]
+    
+    def quantize_frames(
+        self,
+        frames: list[dict],
+        compiled: CompiledPalette,
+        dither: str = "none",
+        block: Optional[int] = None
+    ) -> list[dict]:
+        """
+        Lượng tử hoá các frame đã decode (decode_frames) với chung một palette
+        
+        Returns:
+            List {"index", "duration", "matrix", "counts"}, matrix là array
+            (rows, cols), counts là số ô theo vị trí palette
+        """
+        result = []
+        for frame in frames:
+            indices, counts, _ = self.quantize_band(frame["pixels"], compiled, dither, block)
+            result.append({
+                "index": frame["index"],
+                "duration": frame["duration"],
+                "matrix": indices,
+                "counts": counts,
+            })
+        return result
+    
+    def convert_frames(
+        self,
+        image_data: Union[bytes, BinaryIO],
+        cols: int,
+        rows: int,
+        palette: Optional[Union[dict[int, str], CompiledPalette]] = None,
+        metric: str = "rgb",
+        dither: str = "none",
+        downsample: str = "nearest",
+        start: int = 0,
+        limit: Optional[int] = None
+    ) -> dict:
+        """
+        Lượng tử hoá các frame [start, start + limit) của ảnh động (GIF/WebP)
+        
+        Frame được decode lười lần lượt và dùng chung một CompiledPalette.
+        Cần stream nhiều lượt thì dùng open_frames + decode_frames trên cùng
+        một FrameSequence (mở lại ảnh cho mỗi lượt phải decode lại từ frame 0).
+        
+        Args:
+            image_data: Dữ liệu ảnh
+            cols: Số cột
+            rows: Số hàng
+            palette: Palette tùy chỉnh hoặc CompiledPalette (optional)
+            metric: Cách đo khoảng cách màu (rgb, lab, de2000)
+            dither: none, bayer hoặc floyd-steinberg (áp dụng riêng từng frame)
+            downsample: nearest, box hoặc majority
+            start: Frame đầu tiên
+            limit: Số frame tối đa (None = đến hết)
+        
+        Returns:
+            Dictionary {"decode": thông tin decode (có frame_count, loop),
+            "frames": [{"index", "duration", "matrix", "counts"}]}
+        
+        Raises:
+            ValueError: Nếu không đọc được ảnh, tham số sai hoặc quá
+                settings.max_frames frame
+        """
+        self.check_options("json", dither, downsample)
+        compiled = self.compile_palette(palette, metric)
+        
+        sequence = self.open_frames(image_data, cols, rows, downsample)
+        decode_info = sequence.info
+        frames = self.decode_frames(sequence, start, limit)
+        
+        return {
+            "decode": decode_info,
+            "frames": self.quantize_frames(frames, compiled, dither, decode_info.get("block")),
+        }
+    
+    def check_options(self, matrix_format: str, dither: str, downsample: str):
+        """
+        Kiểm tra các tuỳ chọn chuyển đổi
+        
+        Raises:
+            ValueError: Nếu có tuỳ chọn không hợp lệ
+        """
+        if matrix_format not in MATRIX_FORMATS:
+            raise ValueError(f"format phải là một trong {', '.join(MATRIX_FORMATS)}")
+        if dither not in DITHER_MODES:
+            raise ValueError(f"dither phải là một trong {', '.join(DITHER_MODES)}")
+        if downsample not in DOWNSAMPLE_MODES:
+            raise ValueError(f"downsample phải là một trong {', '.join(DOWNSAMPLE_MODES)}")
+    
+    def _convert_grid(
+        self,
+        img,
+        decode_info: dict,
+        cols: int,
+        rows: int,
+        compiled: CompiledPalette,
+        matrix_format: str,
+        rle: bool,
+        dither: str,
+        downsample: str
+    ) -> dict:
+        """Lượng tử hoá ảnh RGB đã thu nhỏ và đóng gói kết quả"""
+        indices, counts, _ = self.quantize_band(
+            np.asarray(img, dtype=np.uint8), compiled, dither, decode_info.get("block")
+        )
+        
+        return self._build_result(
+            indices, compiled.count_map(counts), compiled.palette, cols, rows, decode_info,
+            matrix_format, rle, compiled.metric, dither, downsample,
+        )
+    
+    def quantize_band(
+        self,
+        pixels: np.ndarray,
+        compiled: CompiledPalette,
+        dither: str = "none",
+        block: Optional[int] = None,
+        y0: int = 0,
+        carry: Optional[np.ndarray] = None
+    ) -> tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        Lượng tử hoá một dải hàng (hoặc cả ảnh) đã thu nhỏ thành palette index
+        
+        Số ô của từng màu được đếm luôn trong lượt này (np.bincount trên vị trí
+        palette), không cần duyệt lại matrix.
+        
+        Args:
+            pixels: Array uint8 shape (H, W, 3); với downsample=majority là ảnh
+                trung gian, H và W là bội của block
+            compiled: CompiledPalette dùng để tra màu
+            dither: none, bayer hoặc floyd-steinberg
+            block: Cạnh khối của downsample=majority (None nếu không dùng)
+            y0: Hàng đầu tiên của dải trong pixels của cả ảnh (pha ma trận Bayer)
+            carry: Sai số Floyd-Steinberg từ dải trước (optional)
+        
+        Returns:
+            Tuple (array palette index shape (H, W) hoặc (H/block, W/block),
+            số ô theo vị trí palette shape (P,), sai số Floyd-Steinberg cho
+            dải sau hoặc None)
+        """
+        # Tra LUT cho toàn bộ dải trong một phép gather
+        carry_out = None
+        if dither == "floyd-steinberg":
+            positions, carry_out = floyd_steinberg_band(pixels, compiled, carry)
+        else:
+            if dither == "bayer":
+                strength = settings.dither_strength
+                if strength is None:
+                    strength = palette_spread(compiled.colors)
+                pixels = ordered_dither(pixels, strength, y0)
+            positions = compiled.positions(pixels).reshape(pixels.shape[:2])
+        
+        if block:
+            # Ảnh được lượng tử hoá ở độ phân giải trung gian, mỗi ô lấy màu
+            # xuất hiện nhiều nhất trong khối block x block của nó
+            positions = block_majority(positions, block, len(compiled))
+        
+        counts = np.bincount(positions.ravel(), minlength=len(compiled))
+        return compiled.keys[positions], counts, carry_out
+    
+    def compile_palette(
+        self,
+        palette: Optional[Union[dict[int, str], CompiledPalette]] = None,
+        metric: str = "rgb"
+    ) -> CompiledPalette:
+        """
+        Lấy CompiledPalette cho palette (mặc định dùng default_palette)
+        
+        Args:
+            palette: Palette dạng dict hoặc CompiledPalette có sẵn
+            metric: Cách đo khoảng cách màu (rgb, lab, de2000)
+        
+        Returns:
+            CompiledPalette từ LRU cache
+        """
+        if isinstance(palette, CompiledPalette):
+            return palette
         if palette is None:
             palette = self.default_palette
+        return get_compiled_palette(palette, metric=metric)
+    
+    def convert_image_reference(
+        self,
+        image_data: bytes,
+        cols: int,
+        rows: int,
+        palette: Optional[dict[int, str]] = None
+    ) -> dict:
+        """
+        Bản cài đặt tham chiếu: duyệt từng pixel với closest_palette_index
         
-        # Đọc ảnh
-        try:
-            img = Image.open(BytesIO(image_data)).convert("RGB")
-        except Exception as e:
-            raise ValueError(f"Không đọc được ảnh: {e}")
+        Chậm, chỉ dùng để đối chiếu kết quả của convert_image trong tests.
         
-        # Chuyển đổi palette sang RGB
-        palette_rgb = build_palette_rgb(palette)
+        Args:
+            image_data: Dữ liệu ảnh (bytes)
+            cols: Số cột
+            rows: Số hàng
+            palette: Palette tùy chỉnh (optional, mặc định dùng default_palette)
         
-        # Resize ảnh về kích thước mong muốn
-        img = img.resize((cols, rows), Image.NEAREST)
+        Returns:
+            Dictionary chứa matrix và metadata (giống convert_image)
+        """
+        if palette is None:
+            palette = self.default_palette
+        
+        img, decode_info = decode_to_grid(image_data, cols, rows)
+        palette_rgb = build_palette_rgb(palette)
         
-        # Tạo matrix và thu thập màu thực sự được sử dụng
+        # Tạo matrix và đếm số ô của từng màu được sử dụng
         matrix: list[list[int]] = []
-        used_colors = set()
+        counts: dict[int, int] = {}
         pixels = img.load()
         
         for y in range(rows):
@@ -82,21 +482,57 @@ class ImageConverterService:
                 rgb = pixels[x, y]
                 idx = closest_palette_index(rgb, palette_rgb)
                 row.append(idx)
-                used_colors.add(idx)
+                counts[idx] = counts.get(idx, 0) + 1
             matrix.append(row)
         
+        return self._build_result(
+            matrix, dict(sorted(counts.items())), palette, cols, rows, decode_info
+        )
+    
+    def _build_result(
+        self,
+        matrix: Union[np.ndarray, list[list[int]]],
+        counts: dict[int, int],
+        palette: dict[int, str],
+        cols: int,
+        rows: int,
+        decode_info: dict,
+        matrix_format: str = "json",
+        rle: bool = False,
+        metric: str = "rgb",
+        dither: str = "none",
+        downsample: str = "nearest"
+    ) -> dict:
+        """
+        Đóng gói matrix và metadata trả về cho client
+        
+        counts là {index: số ô} của các màu có trong ảnh, theo index tăng dần
+        """
+        # Palette tùy chỉnh có thể dùng key dạng string ("1"), chuẩn hoá về int
+        palette_by_index = {int(k): v for k, v in palette.items()}
+        
         # Chỉ trả về các màu thực sự có trong ảnh
-        actual_palette = {idx: palette[idx] for idx in used_colors}
+        actual_palette = {idx: palette_by_index[idx] for idx in counts}
         
-        return {
-            "meta": {
-                "cols": cols,
-                "rows": rows,
-                "palette": actual_palette,
-                "mode": "index",
-            },
-            "matrix": matrix,
+        meta = {
+            "cols": cols,
+            "rows": rows,
+            "palette": actual_palette,
+            "counts": counts,
+            "mode": "index",
+            "metric": metric,
+            "dither": dither,
+            "downsample": downsample,
+            "decode": decode_info,
         }
+        
+        if matrix_format == "packed":
+            meta["encoding"], data = pack_matrix(np.asarray(matrix), rle)
+            return {"meta": meta, "data": data}
+        
+        if isinstance(matrix, np.ndarray):
+            matrix = matrix.tolist()
+        return {"meta": meta, "matrix": matrix}
     
     def get_palette(self) -> dict:
         """
@@ -114,3 +550,107 @@ class ImageConverterService:
 # Singleton instance
 image_converter_service = ImageConverterService()
 
+
+def convert_image_task(
+    image_data: Union[bytes, BinaryIO],
+    cols: int,
+    rows: int,
+    palette: Optional[Union[dict[int, str], CompiledPalette]] = None,
+    **options
+) -> dict:
+    """
+    Entry point chạy trong worker process (hàm top-level để pickle được)
+    
+    Mỗi worker có LRU palette riêng nên palette chỉ biên dịch một lần/worker.
+    options được chuyển nguyên cho convert_image (matrix_format, rle, metric, dither...).
+    """
+    return image_converter_service.convert_image(
+        image_data, cols, rows, palette, **options
+    )
+
+
+def decode_grid_task(
+    image_data: Union[bytes, BinaryIO],
+    cols: int,
+    rows: int,
+    downsample: str = "nearest"
+) -> tuple[np.ndarray, dict]:
+    """
+    Decode và thu nhỏ ảnh trong worker, trả về pixel (uint8, pickle gọn)
+    
+    Dùng cho chế độ stream: lượng tử hoá chạy sau theo từng dải hàng.
+    """
+    img, decode_info = decode_to_grid(image_data, cols, rows, downsample)
+    return np.asarray(img, dtype=np.uint8), decode_info
+
+
+def quantize_band_task(
+    pixels: np.ndarray,
+    palette: Optional[dict[int, str]] = None,
+    metric: str = "rgb",
+    dither: str = "none",
+    block: Optional[int] = None,
+    y0: int = 0,
+    carry: Optional[np.ndarray] = None
+) -> tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """
+    Lượng tử hoá một dải hàng trong worker (palette biên dịch qua LRU của worker)
+    """
+    compiled = image_converter_service.compile_palette(palette, metric)
+    return image_converter_service.quantize_band(
+        pixels, compiled, dither, block, y0, carry
+    )
+
+
+def timed_convert_image_task(
+    image_data: Union[bytes, BinaryIO],
+    cols: int,
+    rows: int,
+    palette: Optional[Union[dict[int, str], CompiledPalette]] = None,
+    **options
+) -> tuple[dict, float]:
+    """
+    Như convert_image_task nhưng trả thêm thời gian xử lý trong worker (ms)
+    """
+    started = time.perf_counter()
+    result = image_converter_service.convert_image(
+        image_data, cols, rows, palette, **options
+    )
+    return result, (time.perf_counter() - started) * 1000
+
+
+def convert_variants_task(image_data: Union[bytes, BinaryIO], variants: list[dict]) -> dict:
+    """
+    Entry point worker cho nhiều variant của cùng một ảnh (một lần decode)
+    """
+    return image_converter_service.convert_variants(image_data, variants)
+
+
+def quantize_frames_task(
+    frames: list[dict],
+    palette: Optional[dict[int, str]] = None,
+    metric: str = "rgb",
+    dither: str = "none",
+    block: Optional[int] = None
+) -> list[dict]:
+    """
+    Lượng tử hoá một lượt frame đã decode trong worker (xem quantize_frames)
+    """
+    compiled = image_converter_service.compile_palette(palette, metric)
+    return image_converter_service.quantize_frames(frames, compiled, dither, block)
+
+
+def convert_level_task(
+    image_data: Union[bytes, BinaryIO],
+    cols: int,
+    rows: int,
+    name: str,
+    palette: Optional[dict[int, str]] = None,
+    **options
+) -> dict:
+    """
+    Entry point worker cho /image/convert/level (xem convert_level)
+    """
+    return image_converter_service.convert_level(
+        image_data, cols, rows, name, palette, **options
+    )
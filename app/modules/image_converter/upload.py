@@ -0,0 +1,121 @@
+"""
+Upload Helpers
+Đọc file upload theo từng chunk với giới hạn kích thước
+"""
+import hashlib
+import json
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile
+
+from app.config import settings
+
+
+class UploadTooLargeError(ValueError):
+    """File/request vượt quá kích thước cho phép"""
+
+
+def _too_large_message(max_size: int) -> str:
+    return f"File quá lớn (tối đa {max_size / (1024 * 1024)}MB)"
+
+
+async def read_upload(file: UploadFile, max_size: int) -> tuple[BinaryIO, int, str]:
+    """
+    Kiểm tra kích thước upload theo từng chunk, không giữ cả file trong RAM
+
+    Dừng ngay khi vượt max_size. File được trả về ở vị trí đầu để decoder đọc
+    thẳng từ SpooledTemporaryFile, không tạo thêm bản copy bytes. Hash nội
+    dung (dùng cho cache kết quả) được tính luôn trong lượt đọc này.
+
+    Args:
+        file: UploadFile từ FastAPI
+        max_size: Kích thước tối đa (bytes)
+
+    Returns:
+        Tuple (file object đã seek về 0, kích thước, sha256 hex của nội dung)
+
+    Raises:
+        UploadTooLargeError: Nếu file vượt quá max_size
+    """
+    # Starlette đã biết kích thước khi parse multipart, từ chối luôn nếu có
+    if file.size is not None and file.size > max_size:
+        raise UploadTooLargeError(_too_large_message(max_size))
+
+    size = 0
+    digest = hashlib.sha256()
+    while True:
+        chunk = await file.read(settings.upload_chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_size:
+            raise UploadTooLargeError(_too_large_message(max_size))
+        digest.update(chunk)
+
+    await file.seek(0)
+    return file.file, size, digest.hexdigest()
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware giới hạn kích thước body cho các route upload
+
+    Từ chối bằng Content-Length khi có, và đếm bytes khi nhận body (chunked
+    transfer) để dừng ngay khi vượt giới hạn, trước khi multipart parser kịp
+    ghi toàn bộ body ra spool.
+    """
+
+    def __init__(self, app, limits: dict[str, int]):
+        """
+        Args:
+            app: ASGI app
+            limits: Dictionary {path: số bytes tối đa của body}
+        """
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    too_large = int(value) > limit
+                except ValueError:
+                    too_large = False
+                if too_large:
+                    await self._reject(send, limit)
+                    return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI re-raise HTTPException phát sinh khi đọc body
+                    raise HTTPException(
+                        status_code=413, detail=_too_large_message(limit)
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send, limit: int):
+        body = json.dumps({"detail": _too_large_message(limit)}).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
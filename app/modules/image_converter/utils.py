@@ -1,8 +1,20 @@
 """
 Image Converter Utilities
 """
+import json
+import re
+from typing import Optional
+
+import numpy as np
+
 from app.utils.helpers import hex_to_rgb
 
+HEX_COLOR_PATTERN = re.compile(r"^#?[0-9a-fA-F]{6}$")
+
+# Giới hạn số phần tử (pixels x palette) của ma trận khoảng cách mỗi lần tính,
+# tránh cấp phát quá lớn khi ảnh lớn và palette nhiều màu
+DISTANCE_CHUNK_ELEMENTS = 1 << 20
+
 
 def build_palette_rgb(palette: dict[int, str]) -> dict[int, tuple[int, int, int]]:
     """
@@ -45,7 +57,188 @@ def closest_palette_index(
     return best_idx
 
 
-def validate_image_file(content_type: str, file_size: int, max_size: int) -> tuple[bool, str]:
+def palette_to_arrays(
+    palette_rgb: dict[int, tuple[int, int, int]]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Chuyển palette RGB sang numpy arrays, giữ nguyên thứ tự của dict
+    
+    Args:
+        palette_rgb: Dictionary {index: (r, g, b)}
+    
+    Returns:
+        Tuple (keys, colors): keys shape (P,), colors shape (P, 3) int32
+    """
+    keys = np.fromiter(palette_rgb.keys(), dtype=np.int64, count=len(palette_rgb))
+    colors = np.array(list(palette_rgb.values()), dtype=np.int32).reshape(-1, 3)
+    return keys, colors
+
+
+def nearest_palette_positions(pixels: np.ndarray, colors: np.ndarray) -> np.ndarray:
+    """
+    Tìm vị trí màu gần nhất trong palette cho toàn bộ pixels (vectorized)
+    
+    Cùng tiêu chí với closest_palette_index: bình phương khoảng cách RGB,
+    khi bằng nhau thì lấy màu đứng trước trong palette (np.argmin trả về
+    vị trí nhỏ nhất).
+    
+    Args:
+        pixels: Array shape (N, 3) giá trị 0-255
+        colors: Array shape (P, 3) từ palette_to_arrays
+    
+    Returns:
+        Array shape (N,) chứa vị trí (0..P-1) trong palette
+    """
+    if len(colors) == 0:
+        raise ValueError("Palette rỗng")
+    
+    pixels = np.asarray(pixels, dtype=np.int32).reshape(-1, 3)
+    colors = np.asarray(colors, dtype=np.int32)
+    
+    # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, bỏ |p|^2 vì không đổi theo từng pixel.
+    # Dùng số nguyên nên so sánh (kể cả hoà) giống hệt cách tính từng pixel.
+    color_norms = np.einsum("pc,pc->p", colors, colors)
+    colors_t = colors.T
+    
+    positions = np.empty(len(pixels), dtype=np.intp)
+    chunk = max(1, DISTANCE_CHUNK_ELEMENTS // len(colors))
+    for start in range(0, len(pixels), chunk):
+        block = pixels[start:start + chunk]
+        distances = color_norms - 2 * (block @ colors_t)
+        positions[start:start + chunk] = np.argmin(distances, axis=1)
+    
+    return positions
+
+
+def block_majority(positions: np.ndarray, block: int, palette_size: int) -> np.ndarray:
+    """
+    Chọn vị trí palette xuất hiện nhiều nhất trong từng khối block x block
+    
+    Sort giá trị trong từng khối rồi đếm độ dài các đoạn bằng nhau, không lặp
+    theo ô; bộ nhớ tỉ lệ với số pixel của các khối, không phụ thuộc palette.
+    Khi hoà thì lấy màu đứng trước trong palette.
+    
+    Args:
+        positions: Array shape (rows * block, cols * block)
+        block: Cạnh khối
+        palette_size: Số màu trong palette
+    
+    Returns:
+        Array shape (rows, cols)
+    """
+    height, width = positions.shape
+    rows, cols = height // block, width // block
+    if block == 1:
+        return positions
+    
+    samples = block * block
+    blocks = positions.reshape(rows, block, cols, block).transpose(0, 2, 1, 3)
+    values = np.sort(
+        blocks.reshape(rows * cols, samples).astype(np.min_scalar_type(palette_size)),
+        axis=1,
+    )
+    
+    # run[i, j]: số phần tử bằng values[i, j] tính từ đầu đoạn tới j (kể cả j)
+    index = np.arange(samples, dtype=np.min_scalar_type(samples))
+    starts = np.ones(values.shape, dtype=bool)
+    starts[:, 1:] = values[:, 1:] != values[:, :-1]
+    run_start = np.maximum.accumulate(np.where(starts, index, 0), axis=1)
+    run = index - run_start
+    
+    # argmax lấy đoạn đầu tiên đạt độ dài lớn nhất, tức giá trị nhỏ nhất khi hoà
+    best = run.argmax(axis=1)
+    return values[np.arange(rows * cols), best].reshape(rows, cols).astype(positions.dtype)
+
+
+def parse_palette(value: Optional[str]) -> Optional[dict[int, str]]:
+    """
+    Parse palette tùy chỉnh từ chuỗi JSON {"index": "#rrggbb"}
+    
+    Args:
+        value: Chuỗi JSON hoặc None
+    
+    Returns:
+        Dictionary {index: hex_color} hoặc None nếu không truyền
+    
+    Raises:
+        ValueError: Nếu JSON hoặc mã màu không hợp lệ
+    """
+    if value is None or value == "":
+        return None
+    
+    try:
+        raw = json.loads(value) if isinstance(value, str) else value
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Palette không phải JSON hợp lệ: {e}")
+    
+    if not isinstance(raw, dict) or not raw:
+        raise ValueError("Palette phải là object {index: hex_color} không rỗng")
+    
+    palette = {}
+    for key, color in raw.items():
+        try:
+            index = int(key)
+        except (TypeError, ValueError):
+            raise ValueError(f"Index màu không hợp lệ: {key}")
+        if not isinstance(color, str) or not HEX_COLOR_PATTERN.match(color):
+            raise ValueError(f"Mã màu không hợp lệ cho index {key}: {color}")
+        palette[index] = color if color.startswith("#") else f"#{color}"
+    
+    return palette
+
+
+def parse_palette_override(
+    value: Optional[str], base_palette: dict[int, str]
+) -> Optional[dict[int, str]]:
+    """
+    Lấy palette con theo danh sách index: "1,2,3" hoặc JSON "[1, 2, 3]"
+    
+    Thứ tự màu giữ theo base_palette (thứ tự quyết định tie-break), nên
+    "3,1" và "1,3" cho cùng một palette.
+    
+    Args:
+        value: Chuỗi danh sách index hoặc None
+        base_palette: Palette gốc {index: hex_color}
+    
+    Returns:
+        Dictionary {index: hex_color} hoặc None nếu không truyền
+    
+    Raises:
+        ValueError: Nếu format sai hoặc index không có trong base_palette
+    """
+    if value is None or value.strip() == "":
+        return None
+    
+    text = value.strip()
+    try:
+        if text.startswith("["):
+            raw = json.loads(text)
+            if not isinstance(raw, list):
+                raise ValueError
+        else:
+            raw = text.split(",")
+        indices = {int(str(item).strip()) for item in raw}
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise ValueError(f"palette_override không hợp lệ: {value} (ví dụ 1,2,3 hoặc [1,2,3])")
+    
+    base = {int(k): v for k, v in base_palette.items()}
+    unknown = sorted(indices - base.keys())
+    if unknown:
+        raise ValueError(
+            f"Index màu không có trong palette: {', '.join(map(str, unknown))}"
+        )
+    if not indices:
+        raise ValueError("palette_override phải có ít nhất một màu")
+    
+    return {index: color for index, color in base.items() if index in indices}
+
+
+def validate_image_file(
+    content_type: str,
+    file_size: int,
+    max_size: int,
+    allowed_types: list[str]
+) -> tuple[bool, str]:
     """
     Validate file ảnh
     
@@ -53,12 +246,11 @@ def validate_image_file(content_type: str, file_size: int, max_size: int) -> tup
         content_type: MIME type của file
         file_size: Kích thước file (bytes)
         max_size: Kích thước tối đa cho phép (bytes)
+        allowed_types: Các MIME type được chấp nhận
     
     Returns:
         Tuple (is_valid, error_message)
     """
-    allowed_types = ["image/png", "image/jpeg", "image/webp"]
-    
     if content_type not in allowed_types:
         return False, f"Chỉ hỗ trợ {', '.join(allowed_types)}"
     
@@ -70,4 +262,3 @@ def validate_image_file(content_type: str, file_size: int, max_size: int) -> tup
         return False, f"File quá lớn (tối đa {max_mb}MB)"
     
     return True, ""
-
@@ -0,0 +1,8 @@
+"""
+Jobs Module
+Hàng đợi job chạy nền (chuyển đổi ảnh, import) theo dõi qua collection imports
+"""
+from .routes import router
+from .service import job_manager
+
+__all__ = ["router", "job_manager"]
@@ -0,0 +1,13 @@
+"""
+Job Models
+Pydantic models cho job API
+"""
+from pydantic import BaseModel, Field
+
+from app.modules.database.models import HistoryValueModel
+
+
+class HistoryImportRequest(BaseModel):
+    """Request model cho job import histories"""
+
+    items: list[HistoryValueModel] = Field(..., description="Danh sách history value")
@@ -0,0 +1,317 @@
+"""
+Job Routes
+API endpoints cho job chạy nền: tạo job, xem trạng thái, stream tiến độ, lấy kết quả
+"""
+import json
+from typing import Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.utils.helpers import format_response
+from app.modules.database.service import database_service
+from app.modules.image_converter.colorspace import COLOR_METRICS
+from app.modules.image_converter.decode import DOWNSAMPLE_MODES
+from app.modules.image_converter.dither import DITHER_MODES
+from app.modules.image_converter.preflight import check_grid
+from app.modules.image_converter.routes import (
+    read_image_upload,
+    resolve_matrix_format,
+    resolve_shared_palette,
+    validate_choice,
+)
+from app.modules.image_converter.upload import UploadTooLargeError
+from app.modules.image_converter.utils import parse_palette
+from .models import HistoryImportRequest
+from .service import (
+    JobQueueFullError,
+    convert_item,
+    import_history_item,
+    job_manager,
+)
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+def job_links(job_id: str) -> dict:
+    """Đường dẫn theo dõi job trả về khi tạo job"""
+    return {
+        "status": f"/jobs/{job_id}",
+        "events": f"/jobs/{job_id}/events",
+        "results": f"/jobs/{job_id}/results",
+    }
+
+
+@router.post("/convert", status_code=202)
+async def submit_convert_job(
+    request: Request,
+    files: list[UploadFile] = File(..., description="Danh sách ảnh (png/jpg/webp/gif)"),
+    cols: int = 30,
+    rows: int = 30,
+    format: Optional[str] = None,
+    rle: bool = False,
+    metric: str = "rgb",
+    dither: str = "none",
+    downsample: str = "nearest",
+    palette: Optional[str] = Form(
+        None, description='Palette dùng chung dạng JSON {"1": "#ff0000", ...}'
+    ),
+    palette_id: Optional[str] = Form(None, description="ID palette đã lưu (/api/palettes)"),
+    palette_override: Optional[str] = Form(
+        None, description="Chỉ dùng các index màu này, ví dụ 1,2,3 hoặc [1,2,3]"
+    ),
+    items: Optional[str] = Form(
+        None,
+        description=(
+            'Tùy chọn riêng từng file dạng JSON [{"cols", "rows", "palette", "metric"}, ...]'
+        ),
+    ),
+):
+    """
+    Tạo job chuyển đổi ảnh chạy nền, trả về ngay job id
+
+    Tham số giống /image/convert/batch. Tiến độ được ghi vào collection
+    imports, kết quả từng ảnh lấy qua /jobs/{job_id}/results.
+
+    Args:
+        files: Các file ảnh upload
+        cols: Số cột dùng chung (mặc định 30)
+        rows: Số hàng dùng chung (mặc định 30)
+        palette: Palette dùng chung dạng JSON (optional, mặc định palette mặc định)
+        palette_id: ID palette đã lưu dùng chung thay cho palette (optional)
+        palette_override: Chỉ dùng các index màu này của palette_id (optional)
+        items: Tùy chọn riêng cho từng file, cùng thứ tự với files (optional)
+        format: Định dạng matrix cho mọi kết quả, như /image/convert
+        rle: Nén run-length cho định dạng packed
+        metric: Khoảng cách màu dùng chung (rgb, lab, de2000)
+        dither: Dither cho mọi ảnh (none, bayer, floyd-steinberg)
+        downsample: Cách thu nhỏ cho mọi ảnh (nearest, box, majority)
+
+    Returns:
+        Document imports của job và các đường dẫn theo dõi
+
+    Raises:
+        HTTPException: Nếu tham số/file không hợp lệ hoặc hàng đợi job đầy
+    """
+    matrix_format = resolve_matrix_format(request, format)
+    options = {
+        "matrix_format": matrix_format,
+        "rle": rle and matrix_format == "packed",
+        "dither": validate_choice("dither", dither, DITHER_MODES),
+        "downsample": validate_choice("downsample", downsample, DOWNSAMPLE_MODES),
+    }
+    validate_choice("metric", metric, COLOR_METRICS)
+
+    if len(files) > settings.max_batch_files:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tối đa {settings.max_batch_files} file mỗi job",
+        )
+
+    shared_palette = await resolve_shared_palette(palette, palette_id, palette_override)
+    try:
+        overrides = json.loads(items) if items else [{}] * len(files)
+    except (ValueError, json.JSONDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not isinstance(overrides, list) or len(overrides) != len(files):
+        raise HTTPException(
+            status_code=400, detail="items phải là list cùng độ dài với files"
+        )
+
+    # Đọc hết file trước khi trả response: upload bị đóng khi request kết thúc.
+    # Tổng bytes được kiểm tra theo từng file để từ chối sớm khi hàng đợi đầy
+    job_items = []
+    job_bytes = 0
+    try:
+        for file, override in zip(files, overrides):
+            if not isinstance(override, dict):
+                raise ValueError("Mỗi phần tử của items phải là object")
+            item_metric = override.get("metric", metric)
+            if item_metric not in COLOR_METRICS:
+                raise ValueError(f"metric phải là một trong {', '.join(COLOR_METRICS)}")
+
+            item_cols = int(override.get("cols", cols))
+            item_rows = int(override.get("rows", rows))
+            check_grid(item_cols, item_rows)
+            try:
+                source, digest = await read_image_upload(file)
+            except UploadTooLargeError as e:
+                raise UploadTooLargeError(f"{file.filename}: {e}")
+            except ValueError as e:
+                raise ValueError(f"{file.filename}: {e}")
+
+            data = source.read()
+            job_bytes += len(data)
+            job_manager.check_capacity(job_bytes)
+
+            job_items.append(
+                {
+                    "filename": file.filename,
+                    "data": data,
+                    "digest": digest,
+                    "cols": item_cols,
+                    "rows": item_rows,
+                    "palette": parse_palette(override.get("palette")) or shared_palette,
+                    "options": {**options, "metric": item_metric},
+                }
+            )
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        doc = await job_manager.submit(
+            "convert",
+            "api",
+            job_items,
+            convert_item,
+            metadata={"options": {**options, "metric": metric, "cols": cols, "rows": rows}},
+        )
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return format_response(
+        success=True,
+        message="Job created successfully",
+        data={**doc, "links": job_links(doc["_id"])},
+    )
+
+
+@router.post("/import/histories", status_code=202)
+async def submit_history_import_job(data: HistoryImportRequest):
+    """
+    Tạo job import nhiều history chạy nền
+
+    Args:
+        data: HistoryImportRequest chứa danh sách history value
+
+    Returns:
+        Document imports của job và các đường dẫn theo dõi
+
+    Raises:
+        HTTPException: Nếu hàng đợi job đầy
+    """
+    try:
+        doc = await job_manager.submit(
+            "histories",
+            "api",
+            [{"value": value} for value in data.items],
+            import_history_item,
+        )
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return format_response(
+        success=True,
+        message="Job created successfully",
+        data={**doc, "links": job_links(doc["_id"])},
+    )
+
+
+@router.get("")
+async def list_jobs(
+    skip: int = Query(0, ge=0, description="Số items bỏ qua"),
+    limit: int = Query(10, ge=1, le=100, description="Số items tối đa"),
+):
+    """
+    Danh sách job (document imports), mới nhất trước
+
+    Args:
+        skip: Số items bỏ qua
+        limit: Số items tối đa
+
+    Returns:
+        Danh sách job
+    """
+    docs = await database_service.list_imports(skip=skip, limit=limit)
+    return format_response(
+        success=True, message="Jobs retrieved successfully", data=docs
+    )
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """
+    Trạng thái job (bộ đếm trong process nếu job đang chạy)
+
+    Args:
+        job_id: ID của job
+
+    Returns:
+        Document imports của job
+    """
+    doc = await job_manager.get_status(job_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return format_response(
+        success=True, message="Job retrieved successfully", data=doc
+    )
+
+
+@router.get("/{job_id}/events")
+async def stream_job(job_id: str):
+    """
+    Stream trạng thái job dạng Server-Sent Events đến khi job xong
+
+    Mỗi thay đổi là một event "status" (data là document imports), event
+    cuối có status completed/failed. Comment ": ping" giữ kết nối khi lâu
+    không có thay đổi.
+
+    Args:
+        job_id: ID của job
+
+    Returns:
+        StreamingResponse text/event-stream
+    """
+    if await job_manager.get_status(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async for doc in job_manager.stream(job_id):
+            if doc is None:
+                yield ": ping\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps(doc, default=str)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{job_id}/results")
+async def get_job_results(
+    job_id: str,
+    skip: int = Query(0, ge=0, description="Số items bỏ qua"),
+    limit: int = Query(50, ge=1, le=500, description="Số items tối đa"),
+):
+    """
+    Kết quả từng item của job (theo thứ tự gửi lên)
+
+    Kết quả được ghi theo lô nên job đang chạy có thể chưa có đủ.
+
+    Args:
+        job_id: ID của job
+        skip: Số items bỏ qua
+        limit: Số items tối đa
+
+    Returns:
+        Danh sách kết quả item
+    """
+    doc = await job_manager.get_status(job_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    results = await job_manager.get_results(job_id, skip=skip, limit=limit)
+    return format_response(
+        success=True,
+        message="Job results retrieved successfully",
+        data={"job": doc, "items": results},
+    )
@@ -0,0 +1,448 @@
+"""
+Job Service
+Hàng đợi job chạy nền trong process, trạng thái lưu ở collection imports
+"""
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from app.config import settings
+from app.modules.database.connection import get_database
+from app.modules.database.models import HistoryItemCreateRequest, ImportCreateRequest
+from app.modules.database.service import database_service
+from app.modules.image_converter.cache import conversion_cache
+from app.modules.image_converter.executor import ConverterBusyError, conversion_executor
+from app.modules.image_converter.palette import palette_hash
+from app.modules.image_converter.service import timed_convert_image_task
+
+# Hàm xử lý một item của job: nhận item, trả về dict kết quả
+ItemRunner = Callable[[dict], Awaitable[dict]]
+
+# Chờ trước khi thử lại khi hàng đợi của worker pool đầy
+_BUSY_RETRY_SECONDS = 0.25
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class JobQueueFullError(RuntimeError):
+    """Hàng đợi job đã đầy"""
+
+
+def item_size(item: Optional[dict]) -> int:
+    """Số bytes ảnh một item giữ trong RAM cho đến khi được xử lý"""
+    data = item.get("data") if item else None
+    return len(data) if data is not None else 0
+
+
+class JobState:
+    """
+    Trạng thái trong process của một job đang chờ/đang chạy
+
+    Bộ đếm ở đây luôn mới hơn document imports (chỉ ghi theo lô), stream SSE
+    đọc từ đây và chờ thay đổi qua event.
+    """
+
+    def __init__(self, job_id: str, kind: str, items: list[dict], runner: ItemRunner):
+        self.id = job_id
+        self.kind = kind
+        self.items = items
+        self.runner = runner
+        self.total = len(items)
+        self.bytes = sum(item_size(item) for item in items)
+        self.processed = 0
+        self.failed = 0
+        self.status = "pending"
+        self.error_message: Optional[str] = None
+        self.version = 0
+        self._changed = asyncio.Event()
+
+    def snapshot(self) -> dict:
+        """Bộ đếm hiện tại dạng dict (ghép vào document imports)"""
+        return {
+            "status": self.status,
+            "total_items": self.total,
+            "processed_items": self.processed,
+            "failed_items": self.failed,
+            "error_message": self.error_message,
+        }
+
+    def notify(self):
+        """Báo cho các stream đang chờ là trạng thái đã đổi"""
+        self.version += 1
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_change(self, version: int, timeout: float) -> bool:
+        """
+        Chờ đến khi version khác giá trị đã thấy
+
+        Returns:
+            False nếu hết timeout mà chưa có thay đổi
+        """
+        if self.version != version:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class JobManager:
+    """
+    Quản lý job nền: hàng đợi + worker pool asyncio trong process
+
+    - Mỗi job là một document trong collection imports (status, total_items,
+      processed_items, failed_items)
+    - workers task lấy job từ hàng đợi; item của một job chạy song song có
+      giới hạn (ảnh được chuyển đổi trong conversion_executor)
+    - Bytes ảnh của các job chưa xong được giới hạn chung (max_queued_bytes),
+      item xử lý xong thì trả lại phần của nó
+    - Tiến độ và kết quả item được ghi theo lô (mỗi progress_batch item hoặc
+      progress_interval giây) thay vì một lần ghi cho mỗi item
+    - Kết quả item lưu ở collection import_results để lấy lại sau
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_queued_bytes: Optional[int] = None,
+        progress_batch: Optional[int] = None,
+        progress_interval: Optional[float] = None,
+    ):
+        self.workers = settings.job_workers if workers is None else workers
+        self.max_queue = settings.job_max_queue if max_queue is None else max_queue
+        self.max_queued_bytes = (
+            settings.job_max_queued_bytes if max_queued_bytes is None else max_queued_bytes
+        )
+        self.progress_batch = (
+            settings.job_progress_batch if progress_batch is None else progress_batch
+        )
+        self.progress_interval = (
+            settings.job_progress_interval
+            if progress_interval is None
+            else progress_interval
+        )
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._jobs: dict[str, JobState] = {}
+
+    def _results(self):
+        return get_database()[settings.job_results_collection]
+
+    def start(self):
+        """Khởi tạo hàng đợi và worker task (gọi trong event loop của app)"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            for i in range(max(1, self.workers))
+        ]
+
+    async def shutdown(self):
+        """Dừng worker, đánh dấu failed các job chưa chạy xong"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+        for state in list(self._jobs.values()):
+            try:
+                await database_service.update_import_status(
+                    state.id,
+                    "failed",
+                    processed_items=state.processed,
+                    failed_items=state.failed,
+                    error_message="Job bị dừng do server tắt",
+                )
+            except Exception as e:
+                print(f"⚠️  Could not mark job {state.id} as failed: {e}")
+        self._jobs.clear()
+
+    @property
+    def queued(self) -> int:
+        """Số job đang chờ trong hàng đợi"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def queued_bytes(self) -> int:
+        """Tổng bytes ảnh các job chưa xong còn giữ trong RAM"""
+        return sum(state.bytes for state in self._jobs.values())
+
+    def check_capacity(self, size: int):
+        """
+        Kiểm tra còn chỗ cho thêm size bytes ảnh trong hàng đợi
+
+        Args:
+            size: Số bytes muốn thêm
+
+        Raises:
+            JobQueueFullError: Nếu vượt max_queued_bytes
+        """
+        queued = self.queued_bytes
+        if queued + size > self.max_queued_bytes:
+            raise JobQueueFullError(
+                f"Hàng đợi job đã đầy ({queued // (1024 * 1024)}MB ảnh đang chờ), thử lại sau"
+            )
+
+    async def submit(
+        self,
+        kind: str,
+        source: str,
+        items: list[dict],
+        runner: ItemRunner,
+        metadata: Optional[dict] = None,
+    ) -> dict:
+        """
+        Tạo document imports cho job và đưa vào hàng đợi
+
+        Args:
+            kind: Loại job (convert, histories...)
+            source: Nguồn job (ghi vào imports.source)
+            items: Danh sách item, runner nhận từng item
+            runner: Coroutine function xử lý một item
+            metadata: Thông tin thêm lưu vào imports.metadata (phải lưu được BSON)
+
+        Returns:
+            Document imports vừa tạo
+
+        Raises:
+            JobQueueFullError: Nếu hàng đợi đã đầy (số job hoặc tổng bytes ảnh)
+        """
+        self.start()
+        if self.queued >= self.max_queue:
+            raise JobQueueFullError(
+                f"Hàng đợi job đã đầy ({self.queued} job đang chờ), thử lại sau"
+            )
+        self.check_capacity(sum(item_size(item) for item in items))
+
+        doc = await database_service.create_import(
+            ImportCreateRequest(
+                source=source,
+                total_items=len(items),
+                metadata={"type": kind, **(metadata or {})},
+            )
+        )
+        state = JobState(doc["_id"], kind, items, runner)
+        self._jobs[state.id] = state
+        self._queue.put_nowait(state)
+        return doc
+
+    async def _worker(self):
+        while True:
+            state = await self._queue.get()
+            try:
+                await self._run_job(state)
+            except Exception as e:
+                state.status = "failed"
+                state.error_message = str(e)
+                try:
+                    await database_service.update_import_status(
+                        state.id, "failed", state.processed, state.failed, str(e)
+                    )
+                except Exception as db_error:
+                    print(f"⚠️  Could not mark job {state.id} as failed: {db_error}")
+            finally:
+                state.notify()
+                # Job bị huỷ giữa chừng (shutdown) vẫn giữ lại để đánh dấu failed
+                if state.status in FINISHED_STATUSES:
+                    self._jobs.pop(state.id, None)
+                self._queue.task_done()
+
+    async def _run_job(self, state: JobState):
+        state.status = "processing"
+        state.notify()
+        await database_service.update_import_status(state.id, "processing")
+
+        concurrency = settings.job_item_concurrency or conversion_executor.workers
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        flush_lock = asyncio.Lock()
+        pending: list[dict] = []
+        last_flush = time.monotonic()
+
+        async def flush():
+            nonlocal last_flush
+            async with flush_lock:
+                batch = pending[:]
+                del pending[:]
+                last_flush = time.monotonic()
+                if batch:
+                    await self._results().insert_many(batch, ordered=False)
+                await database_service.update_import_status(
+                    state.id, state.status, state.processed, state.failed
+                )
+
+        async def run_item(index: int, item: dict):
+            record = {"import_id": state.id, "index": index}
+            async with semaphore:
+                try:
+                    record.update(await state.runner(item))
+                    record["success"] = True
+                except Exception as e:
+                    record.update(success=False, error=str(e))
+            # Bytes ảnh không cần nữa, trả bộ nhớ sớm
+            state.items[index] = None
+            state.bytes -= item_size(item)
+
+            if record.get("filename") is None and "filename" in item:
+                record["filename"] = item["filename"]
+            if "result" in record:
+                # JSON string vì palette dùng key int (BSON chỉ nhận key string)
+                record["result"] = json.dumps(record["result"], separators=(",", ":"))
+            pending.append(record)
+
+            state.processed += 1
+            if not record["success"]:
+                state.failed += 1
+            state.notify()
+
+            if (
+                len(pending) >= self.progress_batch
+                or time.monotonic() - last_flush >= self.progress_interval
+            ):
+                await flush()
+
+        await asyncio.gather(*[run_item(i, item) for i, item in enumerate(state.items)])
+
+        state.status = "failed" if state.total and state.failed == state.total else "completed"
+        if state.failed:
+            state.error_message = f"{state.failed}/{state.total} item thất bại"
+        await flush()
+        await database_service.update_import_status(
+            state.id, state.status, state.processed, state.failed, state.error_message
+        )
+
+    async def get_status(self, job_id: str) -> Optional[dict]:
+        """
+        Lấy trạng thái job: document imports, bộ đếm trong process nếu job còn chạy
+
+        Args:
+            job_id: ID của job (_id trong imports)
+
+        Returns:
+            Document imports hoặc None nếu không tồn tại
+        """
+        doc = await database_service.get_import(job_id)
+        if doc is None:
+            return None
+        state = self._jobs.get(job_id)
+        if state is not None:
+            doc.update({k: v for k, v in state.snapshot().items() if v is not None})
+        return doc
+
+    async def stream(
+        self, job_id: str, heartbeat: float = 15.0
+    ) -> AsyncIterator[Optional[dict]]:
+        """
+        Phát trạng thái job mỗi khi thay đổi, kết thúc khi job xong
+
+        Args:
+            job_id: ID của job
+            heartbeat: Số giây không có thay đổi thì phát None (giữ kết nối)
+
+        Yields:
+            Document trạng thái, hoặc None cho heartbeat
+        """
+        while True:
+            state = self._jobs.get(job_id)
+            version = state.version if state is not None else 0
+            doc = await self.get_status(job_id)
+            if doc is None:
+                return
+            yield doc
+            if doc["status"] in FINISHED_STATUSES or state is None:
+                return
+            while not await state.wait_for_change(version, heartbeat):
+                yield None
+
+    async def get_results(self, job_id: str, skip: int = 0, limit: int = 50) -> list[dict]:
+        """
+        Lấy kết quả item của job theo thứ tự index
+
+        Args:
+            job_id: ID của job
+            skip: Số item bỏ qua
+            limit: Số item tối đa
+
+        Returns:
+            Danh sách kết quả item (result đã parse lại từ JSON)
+        """
+        cursor = (
+            self._results()
+            .find({"import_id": job_id}, {"_id": 0})
+            .sort("index", 1)
+            .skip(skip)
+            .limit(limit)
+        )
+        docs = await cursor.to_list(length=limit)
+        for doc in docs:
+            if isinstance(doc.get("result"), str):
+                doc["result"] = json.loads(doc["result"])
+        return docs
+
+
+async def convert_item(item: dict) -> dict:
+    """
+    Chuyển đổi một ảnh của job convert (dùng cache kết quả như /image/convert)
+
+    Args:
+        item: {"data", "digest", "filename", "cols", "rows", "palette", "options"}
+
+    Returns:
+        Dict {"filename", "cached", "elapsed_ms", "result"}
+    """
+    options = item["options"]
+    cache_key = conversion_cache.make_key(
+        item["digest"], item["cols"], item["rows"], palette_hash(item["palette"]),
+        mode="index", **options,
+    )
+    result = await conversion_cache.get(cache_key)
+    if result is not None:
+        return {"filename": item["filename"], "cached": True, "elapsed_ms": 0.0, "result": result}
+
+    # Job không bị từ chối khi worker pool bận, chỉ chờ đến lượt
+    while True:
+        try:
+            result, elapsed_ms = await conversion_executor.run(
+                timed_convert_image_task, item["data"], item["cols"], item["rows"],
+                item["palette"], **options,
+            )
+            break
+        except ConverterBusyError:
+            await asyncio.sleep(_BUSY_RETRY_SECONDS)
+
+    await conversion_cache.put(cache_key, result)
+    return {
+        "filename": item["filename"],
+        "cached": False,
+        "elapsed_ms": round(elapsed_ms, 2),
+        "result": result,
+    }
+
+
+async def import_history_item(item: dict) -> dict:
+    """
+    Tạo một history của job import, giống POST /api/histories
+
+    Đi qua create_history_item nên có đủ value.id, level.id, config.id,
+    timestamp và nameSort (sửa/xoá theo value.id như history tạo qua API).
+
+    Args:
+        item: {"value": HistoryValueModel}
+
+    Returns:
+        Dict {"history_id" (_id), "id" (value.id)}
+    """
+    doc = await database_service.create_history_item(
+        HistoryItemCreateRequest(value=item["value"])
+    )
+    return {"history_id": doc["_id"], "id": doc["value"]["id"]}
+
+
+# Singleton instance
+job_manager = JobManager()
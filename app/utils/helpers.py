@@ -2,8 +2,11 @@
 Common helper functions
 """
 
+import struct
 from typing import Any, Optional
 from datetime import datetime
+
+import numpy as np
 from fastapi import HTTPException
 
 
@@ -212,3 +215,47 @@ def sort_histories_by_name(histories: list[dict], order: str = "asc") -> list[di
     sorted_histories = sorted(histories, key=get_sort_key, reverse=(order == "desc"))
 
     return sorted_histories
+
+
+def history_name_sort_key(name: Any) -> str:
+    """
+    Khóa sort dạng string cho value.name (field nameSort của histories)
+
+    So sánh chuỗi (MongoDB sort, không cần collation) cho cùng thứ tự với
+    sort_histories_by_name:
+    - name là số: "0" + 16 hex của float64 đã biến đổi để thứ tự chuỗi
+      trùng thứ tự số (kể cả số âm, số thập phân)
+    - name là text: "1" + name.lower(), nên số luôn đứng trước text
+
+    Args:
+        name: Giá trị value.name
+
+    Returns:
+        Sort key string
+    """
+    try:
+        # + 0.0 để -0.0 và 0.0 cho cùng một key
+        value = float(name) + 0.0
+    except (ValueError, TypeError):
+        return "1" + (name.lower() if isinstance(name, str) else "")
+
+    bits = struct.unpack(">Q", struct.pack(">d", value))[0]
+    # Số âm: đảo mọi bit; số dương: bật bit dấu. Thứ tự unsigned = thứ tự số
+    bits = bits ^ 0xFFFFFFFFFFFFFFFF if bits >> 63 else bits | (1 << 63)
+    return f"0{bits:016x}"
+
+
+def matrix_color_counts(matrix: list[list[int]]) -> dict[str, int]:
+    """
+    Đếm số ô của từng màu trong matrix (một lượt numpy, không duyệt từng ô)
+
+    Args:
+        matrix: Ma trận index màu
+
+    Returns:
+        Dictionary {index dạng string: số ô} theo index tăng dần (key string
+        để lưu được vào MongoDB)
+    """
+    values = np.asarray(matrix, dtype=np.int64).ravel()
+    indices, counts = np.unique(values, return_counts=True)
+    return {str(i): int(n) for i, n in zip(indices.tolist(), counts.tolist())}
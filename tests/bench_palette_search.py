@@ -0,0 +1,101 @@
+"""
+Benchmark Palette Search
+So sánh tìm màu gần nhất: duyệt tuyến tính, vectorized brute force và
+CompiledPalette (LUT + lưới ứng viên) theo kích thước palette
+
+Chạy: python tests/bench_palette_search.py [số pixel]
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import settings  # noqa: E402
+from app.modules.image_converter.palette import CompiledPalette  # noqa: E402
+from app.modules.image_converter.utils import (  # noqa: E402
+    build_palette_rgb,
+    closest_palette_index,
+    nearest_palette_positions,
+    palette_to_arrays,
+)
+
+PALETTE_SIZES = (12, 32, 64, 128, 256)
+LINEAR_SAMPLE = 20000  # Vòng lặp Python chậm, chỉ đo trên mẫu rồi quy đổi
+
+
+def random_palette(size: int, rng: np.random.Generator) -> dict[int, str]:
+    """Palette ngẫu nhiên {1..size: hex}"""
+    colors = rng.integers(0, 1 << 24, size=size)
+    return {i + 1: f"#{int(c):06x}" for i, c in enumerate(colors)}
+
+
+def timed(fn, *args) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def run(pixel_count: int = 200_000):
+    rng = np.random.default_rng(42)
+    # Ảnh tự nhiên có nhiều vùng màu gần nhau: trộn pixel ngẫu nhiên và dải mịn
+    pixels = rng.integers(0, 256, size=(pixel_count, 3), dtype=np.uint8)
+    pixels[: pixel_count // 2] = np.clip(
+        rng.normal(128, 40, size=(pixel_count // 2, 3)), 0, 255
+    ).astype(np.uint8)
+
+    print(f"📊 Nearest-color search, {pixel_count} pixels (thời gian: giây)\n")
+    print(
+        f"{'colors':>6} | {'linear*':>8} | {'brute':>7} | {'lut':>7} | "
+        f"{'build':>6} | {'index':>7} | {'ambiguous':>9} | {'vs brute':>8}"
+    )
+    print("-" * 80)
+
+    for size in PALETTE_SIZES:
+        palette = random_palette(size, rng)
+        palette_rgb = build_palette_rgb(palette)
+        keys, colors = palette_to_arrays(palette_rgb)
+
+        # Duyệt tuyến tính (closest_palette_index), quy đổi ra số pixel đầy đủ
+        sample = [tuple(int(v) for v in p) for p in pixels[:LINEAR_SAMPLE]]
+        linear_time, _ = timed(
+            lambda: [closest_palette_index(p, palette_rgb) for p in sample]
+        )
+        linear_time *= pixel_count / LINEAR_SAMPLE
+
+        brute_time, expected = timed(nearest_palette_positions, pixels, colors)
+
+        # LUT không có lưới ứng viên: ô mơ hồ tính với cả palette
+        threshold = settings.palette_index_threshold
+        settings.palette_index_threshold = 1 << 16
+        try:
+            lut_only = CompiledPalette(palette, 6)
+        finally:
+            settings.palette_index_threshold = threshold
+        lut_time, got = timed(lut_only.positions, pixels)
+        assert np.array_equal(got, expected), f"LUT mismatch with {size} colors"
+
+        # LUT + lưới ứng viên (luôn bật để so sánh)
+        settings.palette_index_threshold = 0
+        try:
+            build_time, indexed = timed(CompiledPalette, palette, 6)
+        finally:
+            settings.palette_index_threshold = threshold
+        index_time, got = timed(indexed.positions, pixels)
+        assert np.array_equal(got, expected), f"Index mismatch with {size} colors"
+
+        ambiguous = float((indexed.lut < 0).mean())
+        print(
+            f"{size:>6} | {linear_time:>8.3f} | {brute_time:>7.3f} | {lut_time:>7.4f} | "
+            f"{build_time:>6.3f} | {index_time:>7.4f} | {ambiguous:>9.3f} | "
+            f"{brute_time / index_time:>7.1f}x"
+        )
+
+    print(f"\n* linear: đo trên {LINEAR_SAMPLE} pixel rồi quy đổi")
+    print(f"  Lưới ứng viên tự bật khi palette > {settings.palette_index_threshold} màu")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
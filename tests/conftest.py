@@ -0,0 +1,445 @@
+"""
+Test Helpers
+Dùng chung cho các file test: tạo ảnh, client FastAPI, executor dạng thread và
+collection MongoDB giả lập trong RAM
+
+Import trực tiếp (from conftest import ...): pytest đưa thư mục tests vào
+sys.path, chạy file test như script thì thư mục tests là sys.path[0].
+"""
+import copy
+import re
+from contextlib import contextmanager
+from io import BytesIO
+from types import SimpleNamespace
+from typing import Any, Optional
+
+import numpy as np
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.modules.database.service import database_service
+from app.modules.image_converter import routes as converter_routes
+from app.modules.image_converter.executor import ConversionExecutor
+from app.modules.image_converter.registry import palette_registry
+
+RED, GREEN, BLUE, WHITE = (255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 255)
+
+
+# ==================== ẢNH ====================
+
+
+def encode_image(img: Image.Image, format: str = "PNG") -> bytes:
+    """Ghi ảnh PIL ra bytes theo định dạng"""
+    buf = BytesIO()
+    img.save(buf, format=format)
+    return buf.getvalue()
+
+
+def make_png(width: int, height: int, seed: int = 0) -> bytes:
+    """Ảnh PNG màu ngẫu nhiên (cùng seed thì cùng ảnh)"""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    return encode_image(Image.fromarray(pixels))
+
+
+def make_solid_image(
+    width: int, height: int, color: tuple[int, int, int] = (200, 10, 10), format: str = "PNG"
+) -> bytes:
+    """Ảnh một màu theo định dạng (PNG, JPEG, WEBP...)"""
+    return encode_image(Image.new("RGB", (width, height), color), format)
+
+
+def make_stripes_png(
+    colors: list[tuple[int, int, int]], height: int = 3, stripe_width: int = 3
+) -> bytes:
+    """Ảnh PNG các dải dọc, mỗi dải stripe_width pixel một màu"""
+    pixels = np.repeat(np.array(colors, dtype=np.uint8), stripe_width, axis=0)
+    rows = np.ascontiguousarray(np.broadcast_to(pixels, (height, *pixels.shape)))
+    return encode_image(Image.fromarray(rows))
+
+
+# ==================== APP ====================
+
+
+def make_client(*routers) -> TestClient:
+    """TestClient cho app chỉ gồm các router cần test"""
+    app = FastAPI()
+    for router in routers:
+        app.include_router(router)
+    return TestClient(app)
+
+
+@contextmanager
+def thread_executor():
+    """Thay conversion_executor của route bằng executor chạy thread (workers=0)"""
+    original = converter_routes.conversion_executor
+    converter_routes.conversion_executor = ConversionExecutor(workers=0)
+    try:
+        yield converter_routes.conversion_executor
+    finally:
+        converter_routes.conversion_executor.shutdown()
+        converter_routes.conversion_executor = original
+
+
+@contextmanager
+def use_collection(name: str, collection):
+    """Thay collection của database_service (histories, images, imports...)"""
+    original = getattr(database_service, name)
+    setattr(database_service, name, collection)
+    try:
+        yield collection
+    finally:
+        setattr(database_service, name, original)
+
+
+@contextmanager
+def fake_palettes(docs: dict[str, dict]):
+    """Palette đã lưu lấy từ docs thay vì MongoDB; registry được xoá cache"""
+    reads = []
+
+    async def get_palette(palette_id):
+        reads.append(palette_id)
+        return docs.get(palette_id)
+
+    original = database_service.get_palette
+    database_service.get_palette = get_palette
+    palette_registry.invalidate()
+    try:
+        yield reads
+    finally:
+        database_service.get_palette = original
+        palette_registry.invalidate()
+
+
+# ==================== MONGODB GIẢ LẬP ====================
+
+_MISSING = object()
+
+
+def get_path(doc: Any, path: str) -> Any:
+    """Giá trị theo đường dẫn a.b.c (_MISSING nếu không có)"""
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def set_path(doc: dict, path: str, value: Any):
+    """Gán giá trị theo đường dẫn a.b.c (tạo dict con nếu thiếu)"""
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _type_rank(value: Any) -> int:
+    """Thứ tự kiểu khi sort của MongoDB: null < số < chuỗi < object < array < ObjectId"""
+    if value is None or value is _MISSING:
+        return 0
+    if isinstance(value, bool):
+        return 6
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, ObjectId):
+        return 5
+    return 7
+
+
+def sort_key(value: Any) -> tuple:
+    """Khóa sort theo thứ tự của MongoDB (field thiếu coi như null)"""
+    rank = _type_rank(value)
+    return (rank, None if rank == 0 else value)
+
+
+def _compare(value: Any, target: Any) -> Optional[int]:
+    """So sánh như $gt/$lt: chỉ so được giá trị cùng kiểu (None nếu khác kiểu)"""
+    if _type_rank(value) != _type_rank(target) or _type_rank(value) == 0:
+        return None
+    return (value > target) - (value < target)
+
+
+def _match_condition(value: Any, cond: Any) -> bool:
+    if isinstance(cond, dict) and any(key.startswith("$") for key in cond):
+        for op, target in cond.items():
+            if op == "$regex":
+                flags = re.IGNORECASE if "i" in cond.get("$options", "") else 0
+                ok = isinstance(value, str) and re.search(target, value, flags) is not None
+            elif op == "$options":
+                continue
+            elif op == "$exists":
+                ok = (value is not _MISSING) == bool(target)
+            elif op == "$ne":
+                ok = not _match_condition(value, target)
+            elif op == "$in":
+                ok = any(_match_condition(value, item) for item in target)
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                result = _compare(value, target)
+                ok = result is not None and {
+                    "$gt": result > 0, "$gte": result >= 0,
+                    "$lt": result < 0, "$lte": result <= 0,
+                }[op]
+            else:
+                raise NotImplementedError(f"Toán tử {op} chưa được giả lập")
+            if not ok:
+                return False
+        return True
+
+    if cond is None:
+        return value is None or value is _MISSING
+    return value is not _MISSING and value == cond
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    """Đánh giá filter MongoDB (so sánh bằng, $regex, $or/$and, $gt/$lt...) trên doc"""
+    for field, cond in (query or {}).items():
+        if field == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif field == "$and":
+            if not all(matches(doc, sub) for sub in cond):
+                return False
+        elif not _match_condition(get_path(doc, field), cond):
+            return False
+    return True
+
+
+def sort_docs(docs: list[dict], spec) -> list[dict]:
+    """Sort nhiều khóa như MongoDB, spec dạng [(field, 1|-1), ...] hoặc dict"""
+    docs = list(docs)
+    for field, direction in reversed(list(dict(spec).items())):
+        docs.sort(key=lambda doc: sort_key(get_path(doc, field)), reverse=direction == -1)
+    return docs
+
+
+def project(doc: dict, projection: Optional[dict]) -> dict:
+    """Áp projection dạng inclusion (field lồng nhau bằng dấu chấm) hoặc {"_id": 0}"""
+    if not projection:
+        return copy.deepcopy(doc)
+
+    included = {field: flag for field, flag in projection.items() if field != "_id"}
+    if not included:
+        result = copy.deepcopy(doc)
+        if projection.get("_id", 1) == 0:
+            result.pop("_id", None)
+        return result
+
+    result = {} if projection.get("_id", 1) == 0 else {"_id": doc["_id"]}
+    for path in included:
+        value = get_path(doc, path)
+        if value is not _MISSING:
+            set_path(result, path, copy.deepcopy(value))
+    return result
+
+
+class FakeCursor:
+    """Cursor của FakeCollection: sort/skip/limit ghi lại trong calls"""
+
+    def __init__(self, collection: "FakeCollection", query: dict, projection: Optional[dict]):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self.spec = []
+        self.n_skip = 0
+        self.n_limit = 0
+        self.calls = []
+
+    def sort(self, spec, direction=None):
+        if direction is not None:
+            spec = [(spec, direction)]
+        self.calls.append(("sort", spec))
+        self.spec = spec
+        return self
+
+    def skip(self, n):
+        self.calls.append(("skip", n))
+        self.n_skip = n
+        return self
+
+    def limit(self, n):
+        self.calls.append(("limit", n))
+        self.n_limit = n
+        return self
+
+    def _results(self) -> list[dict]:
+        docs = [doc for doc in self.collection.docs if matches(doc, self.query)]
+        docs = sort_docs(docs, self.spec)[self.n_skip:]
+        if self.n_limit:
+            docs = docs[:self.n_limit]
+        return [project(doc, self.projection) for doc in docs]
+
+    async def to_list(self, length=None):
+        self.collection.calls.append("find")
+        return self._results()
+
+    def __aiter__(self):
+        self.collection.calls.append("find")
+
+        async def iterate():
+            for doc in self._results():
+                yield doc
+
+        return iterate()
+
+
+class FakeAggregateCursor:
+    def __init__(self, result: list[dict]):
+        self.result = result
+
+    async def to_list(self, length=None):
+        return self.result
+
+
+class FakeCollection:
+    """
+    Collection MongoDB trong RAM cho test
+
+    docs là các document đã lưu (bản copy, như MongoDB); calls ghi lại lệnh đã
+    chạy (find, count, estimated, aggregate, insert_many...), projections ghi
+    projection của từng find().
+    """
+
+    def __init__(self, docs: Optional[list[dict]] = None):
+        self.docs = list(docs or [])
+        self.calls = []
+        self.projections = []
+        self.cursors = []
+        self.indexes = {"_id_": {"key": [("_id", 1)], "v": 2}}
+        self.created_indexes = []
+
+    def _find(self, query: dict) -> Optional[dict]:
+        return next((doc for doc in self.docs if matches(doc, query)), None)
+
+    @staticmethod
+    def _apply_update(doc: dict, update: dict):
+        for op, fields in update.items():
+            if op != "$set":
+                raise NotImplementedError(f"Update {op} chưa được giả lập")
+            for path, value in fields.items():
+                set_path(doc, path, copy.deepcopy(value))
+
+    def find(self, query=None, projection=None):
+        self.projections.append(projection)
+        cursor = FakeCursor(self, query or {}, projection)
+        self.cursors.append(cursor)
+        return cursor
+
+    async def find_one(self, query=None, projection=None):
+        doc = self._find(query or {})
+        return project(doc, projection) if doc is not None else None
+
+    async def insert_one(self, doc):
+        doc.setdefault("_id", ObjectId())
+        self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        self.calls.append("insert_many")
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_ids=[doc["_id"] for doc in docs])
+
+    async def replace_one(self, query, doc, upsert=False):
+        existing = self._find(query)
+        if existing is not None:
+            self.docs.remove(existing)
+        elif not upsert:
+            return SimpleNamespace(matched_count=0)
+        self.docs.append({**copy.deepcopy(doc), **{k: v for k, v in query.items()
+                                                    if not k.startswith("$")}})
+        return SimpleNamespace(matched_count=int(existing is not None))
+
+    async def find_one_and_update(self, query, update, return_document=False, **kwargs):
+        doc = self._find(query)
+        if doc is None:
+            return None
+        before = copy.deepcopy(doc)
+        self._apply_update(doc, update)
+        return copy.deepcopy(doc) if return_document else before
+
+    async def bulk_write(self, operations, ordered=True):
+        for op in operations:
+            doc = self._find(op._filter)
+            if doc is not None:
+                self._apply_update(doc, op._doc)
+
+    async def delete_one(self, query):
+        doc = self._find(query)
+        if doc is not None:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def count_documents(self, query):
+        self.calls.append("count")
+        return sum(matches(doc, query) for doc in self.docs)
+
+    async def estimated_document_count(self):
+        self.calls.append("estimated")
+        return len(self.docs)
+
+    def aggregate(self, pipeline: list[dict]):
+        """Giả lập pipeline $match -> $project -> $facet{items, total} của facet_pipeline"""
+        self.calls.append("aggregate")
+        docs = self.docs
+        result = None
+        for stage in pipeline:
+            (op, arg), = stage.items()
+            if op == "$match":
+                docs = [doc for doc in docs if matches(doc, arg)]
+            elif op == "$project":
+                docs = [project(doc, arg) for doc in docs]
+            elif op == "$facet":
+                result = {name: self._run_facet(docs, stages) for name, stages in arg.items()}
+            else:
+                raise NotImplementedError(f"Stage {op} chưa được giả lập")
+        return FakeAggregateCursor([result] if result is not None else docs)
+
+    @staticmethod
+    def _run_facet(docs: list[dict], stages: list[dict]) -> list[dict]:
+        for stage in stages:
+            (op, arg), = stage.items()
+            if op == "$match":
+                docs = [doc for doc in docs if matches(doc, arg)]
+            elif op == "$sort":
+                docs = sort_docs(docs, arg)
+            elif op == "$skip":
+                docs = docs[arg:]
+            elif op == "$limit":
+                docs = docs[:arg]
+            elif op == "$project":
+                docs = [project(doc, arg) for doc in docs]
+            elif op == "$count":
+                docs = [{arg: len(docs)}] if docs else []
+            else:
+                raise NotImplementedError(f"Stage {op} chưa được giả lập")
+        return [copy.deepcopy(doc) for doc in docs]
+
+    async def index_information(self):
+        return {name: dict(info) for name, info in self.indexes.items()}
+
+    async def create_index(self, keys, name, **options):
+        if name in self.indexes:
+            raise AssertionError(f"{name} đã tồn tại")
+        self.created_indexes.append(name)
+        self.indexes[name] = {"key": list(keys), "v": 2, **options}
+
+    async def drop_index(self, name):
+        del self.indexes[name]
+
+
+class FakeDatabase(dict):
+    """Database giả lập: collection được tạo khi truy cập lần đầu"""
+
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
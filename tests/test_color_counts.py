@@ -0,0 +1,60 @@
+"""
+Test Color Counts
+Kiểm tra meta.counts (số ô từng màu) và thống kê màu lưu vào metadata của image
+"""
+from collections import Counter
+
+from app.modules.database.service import color_stats
+from app.modules.image_converter.service import image_converter_service
+
+from conftest import make_png
+
+
+def test_counts_match_matrix():
+    """meta.counts khớp với đếm lại matrix, cho mọi chế độ dither/downsample"""
+    print("🧪 Test meta.counts")
+
+    image = make_png(120, 90, seed=5)
+    for options in (
+        {},
+        {"dither": "floyd-steinberg"},
+        {"downsample": "majority"},
+        {"metric": "lab", "palette": {7: "#000000", 3: "#ffffff", 5: "#ff0000"}},
+    ):
+        result = image_converter_service.convert_image(image, 40, 30, **options)
+        expected = Counter(v for row in result["matrix"] for v in row)
+        counts = result["meta"]["counts"]
+        assert counts == dict(sorted(expected.items())), options
+        assert list(counts) == sorted(counts)
+        assert list(counts) == list(result["meta"]["palette"])
+        assert sum(counts.values()) == 40 * 30
+
+    packed = image_converter_service.convert_image(image, 40, 30, matrix_format="packed")
+    assert packed["meta"]["counts"] == image_converter_service.convert_image(
+        image, 40, 30
+    )["meta"]["counts"]
+
+    print("✅ meta.counts tests passed")
+
+
+def test_color_stats_for_metadata():
+    """Thống kê lưu vào metadata dùng key string (BSON)"""
+    print("\n🧪 Test color_stats")
+
+    stats = color_stats([[1, 2, 2], [12, 2, 1]])
+    assert stats == {"counts": {"1": 2, "2": 3, "12": 1}, "color_count": 3}
+    assert color_stats([]) == {"counts": {}, "color_count": 0}
+
+    print("✅ color_stats tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Color Counts\n")
+    print("=" * 60)
+
+    test_counts_match_matrix()
+    test_color_stats_for_metadata()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
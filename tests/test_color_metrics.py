@@ -0,0 +1,134 @@
+"""
+Test Color Metrics
+Kiểm tra chuyển đổi sRGB -> Lab, ΔE2000 và LUT theo metric cảm nhận
+"""
+import pickle
+
+import numpy as np
+
+from app.config import settings
+from app.modules.image_converter.colorspace import (
+    delta_e2000,
+    nearest_lab_positions,
+    srgb_to_lab,
+)
+from app.modules.image_converter.palette import CompiledPalette
+from app.modules.image_converter.service import image_converter_service
+
+from conftest import make_solid_image
+
+# Một số cặp trong bộ dữ liệu kiểm thử CIEDE2000 của Sharma et al. (2005)
+SHARMA_PAIRS = [
+    ((50.0, 2.6772, -79.7751), (50.0, 0.0, -82.7485), 2.0425),
+    ((50.0, 0.0, 0.0), (50.0, -1.0, 2.0), 2.3669),
+    ((50.0, 2.49, -0.001), (50.0, -2.49, 0.0009), 7.1792),
+    ((50.0, 2.5, 0.0), (73.0, 25.0, -18.0), 27.1492),
+    ((50.0, 2.5, 0.0), (50.0, 3.1736, 0.5854), 1.0000),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+    ((2.0776, 0.0795, -1.1350), (0.9033, -0.0636, -0.5514), 0.9082),
+]
+
+
+def test_srgb_to_lab_reference_values():
+    """Trắng, đen và đỏ sRGB khớp giá trị Lab D65 chuẩn"""
+    print("🧪 Test sRGB -> Lab")
+
+    lab = srgb_to_lab(np.array([[255, 255, 255], [0, 0, 0], [255, 0, 0]]))
+    assert np.allclose(lab[0], [100.0, 0.0, 0.0], atol=1e-3)
+    assert np.allclose(lab[1], [0.0, 0.0, 0.0], atol=1e-9)
+    assert np.allclose(lab[2], [53.2408, 80.0925, 67.2032], atol=1e-3)
+
+    # Đầu vào số thực cho cùng kết quả với bảng gamma
+    assert np.allclose(
+        srgb_to_lab(np.array([12.0, 200.0, 77.0])), srgb_to_lab(np.array([12, 200, 77]))
+    )
+
+    print("✅ sRGB -> Lab tests passed")
+
+
+def test_delta_e2000_sharma_pairs():
+    """ΔE2000 khớp bộ dữ liệu chuẩn tới 4 chữ số thập phân"""
+    print("\n🧪 Test ΔE2000")
+
+    lab1 = np.array([pair[0] for pair in SHARMA_PAIRS])
+    lab2 = np.array([pair[1] for pair in SHARMA_PAIRS])
+    expected = np.array([pair[2] for pair in SHARMA_PAIRS])
+    assert np.allclose(delta_e2000(lab1, lab2), expected, atol=1e-4)
+    # Đối xứng
+    assert np.allclose(delta_e2000(lab2, lab1), expected, atol=1e-4)
+
+    print("✅ ΔE2000 tests passed")
+
+
+def test_perceptual_lut_matches_brute_force():
+    """LUT + danh sách ứng viên cho kết quả giống hệt tính ΔE toàn palette"""
+    print("\n🧪 Test perceptual LUT vs brute force")
+
+    rng = np.random.default_rng(3)
+    pixels = rng.integers(0, 256, size=(60000, 3), dtype=np.uint8)
+    pixels[:10000] //= 8  # Vùng tối, nơi sRGB -> Lab phi tuyến mạnh nhất
+    random_palette = {i: "#%06x" % rng.integers(0, 1 << 24) for i in range(40)}
+
+    for palette in (settings.default_palette, random_palette):
+        for metric in ("lab", "de2000"):
+            for lut_bits in (5, 6):
+                compiled = CompiledPalette(palette, lut_bits=lut_bits, metric=metric)
+                expected = nearest_lab_positions(
+                    srgb_to_lab(pixels), compiled.lab_colors, metric
+                )
+                assert np.array_equal(compiled.positions(pixels), expected), metric
+                print(f"   {len(palette)} màu, {metric}, {lut_bits} bit: khớp ✓")
+
+    print("✅ Perceptual LUT tests passed")
+
+
+def test_de2000_nearest_regression():
+    """(88, 95, 100) với 6 bit: ΔE2000 gần nhất là index 6 (19.19), không phải 10 (19.98)"""
+    print("\n🧪 Test ΔE2000 nearest color (88, 95, 100)")
+
+
+    pixel = np.array([[88, 95, 100]], dtype=np.uint8)
+    compiled = CompiledPalette(settings.default_palette, lut_bits=6, metric="de2000")
+    expected = nearest_lab_positions(srgb_to_lab(pixel), compiled.lab_colors, "de2000")
+    assert np.array_equal(compiled.positions(pixel), expected)
+
+    result = image_converter_service.convert_image(make_solid_image(1, 1, (88, 95, 100)), 1, 1, metric="de2000")
+    assert result["matrix"][0][0] == 6
+
+    print("✅ ΔE2000 regression tests passed")
+
+
+def test_convert_image_metric():
+    """convert_image ghi metric vào meta, metric lạ bị từ chối"""
+    print("\n🧪 Test convert_image metric")
+
+    # Hồng cam: khoảng cách RGB chọn Grey (11), ΔE76 chọn Brown (10)
+    data = make_solid_image(4, 4, (239, 138, 109))
+
+    rgb = image_converter_service.convert_image(data, 2, 2)
+    lab = image_converter_service.convert_image(data, 2, 2, metric="lab")
+    assert rgb["meta"]["metric"] == "rgb"
+    assert lab["meta"]["metric"] == "lab"
+    assert rgb["matrix"][0][0] == 11
+    assert lab["matrix"][0][0] == 10
+    print(f"   rgb -> {rgb['matrix'][0][0]}, lab -> {lab['matrix'][0][0]}")
+
+    compiled = image_converter_service.compile_palette(None, "de2000")
+    restored = pickle.loads(pickle.dumps(compiled))
+    assert restored.metric == "de2000"
+
+    try:
+        image_converter_service.convert_image(data, 2, 2, metric="hsv")
+        assert False, "metric không hợp lệ phải lỗi"
+    except ValueError:
+        pass
+
+    print("✅ convert_image metric tests passed")
+
+
+if __name__ == "__main__":
+    test_srgb_to_lab_reference_values()
+    test_delta_e2000_sharma_pairs()
+    test_perceptual_lut_matches_brute_force()
+    test_de2000_nearest_regression()
+    test_convert_image_metric()
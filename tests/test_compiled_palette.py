@@ -0,0 +1,111 @@
+"""
+Test Compiled Palette
+Kiểm tra LUT của CompiledPalette cho kết quả giống tìm kiếm brute force
+"""
+import numpy as np
+
+from app.config import settings
+from app.modules.image_converter.palette import (
+    CompiledPalette,
+    clear_palette_cache,
+    get_compiled_palette,
+)
+from app.modules.image_converter.utils import nearest_palette_positions
+
+
+def random_palette(size: int, seed: int) -> dict[int, str]:
+    """Tạo palette ngẫu nhiên"""
+    rng = np.random.default_rng(seed)
+    return {i + 1: "#%06x" % rng.integers(0, 1 << 24) for i in range(size)}
+
+
+def test_lut_matches_brute_force():
+    """LUT (kể cả ô mơ hồ) cho kết quả giống hệt brute force"""
+    print("🧪 Test LUT vs brute force")
+
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (50000, 3), dtype=np.uint8)
+    # Thêm lưới đều để phủ mọi vùng của khối RGB
+    grid = np.stack(
+        np.meshgrid(*[np.arange(0, 256, 15, dtype=np.uint8)] * 3), axis=-1
+    ).reshape(-1, 3)
+    pixels = np.concatenate([pixels, grid])
+
+    for palette in [settings.default_palette, random_palette(40, 1)]:
+        for bits in (4, 6):
+            compiled = CompiledPalette(palette, bits)
+            expected = nearest_palette_positions(pixels, compiled.colors)
+            assert (compiled.positions(pixels) == expected).all()
+
+    print("✅ LUT tests passed")
+
+
+def test_candidate_index_for_large_palettes():
+    """Palette lớn dùng lưới ứng viên và vẫn khớp brute force (kể cả hoà)"""
+    print("\n🧪 Test candidate index (large palettes)")
+
+    rng = np.random.default_rng(2)
+    pixels = rng.integers(0, 256, (50000, 3), dtype=np.uint8)
+
+    small = CompiledPalette(settings.default_palette, 5)
+    assert not small.use_index and small.cell_slots is None
+
+    # Palette có màu trùng và màu cách đều để kiểm tra tie-break qua ứng viên
+    palette = random_palette(200, 3)
+    palette[201] = palette[1]
+    palette[202] = "#000000"
+    palette[203] = "#020202"
+
+    for bits in (4, 6):
+        compiled = CompiledPalette(palette, bits)
+        assert compiled.use_index and len(compiled.cell_candidates) > 0
+        expected = nearest_palette_positions(pixels, compiled.colors)
+        assert (compiled.positions(pixels) == expected).all()
+        assert compiled.positions(np.array([[1, 1, 1]], dtype=np.uint8)).tolist() == [201]
+
+    print("✅ Candidate index tests passed")
+
+
+def test_lut_tie_breaking():
+    """Màu cách đều hai màu palette lấy màu đứng trước (lut_bits mặc định theo settings)"""
+    print("\n🧪 Test LUT tie-breaking")
+
+    pixel = np.array([[1, 1, 1]], dtype=np.uint8)
+    assert CompiledPalette({5: "#000000", 3: "#020202"}).quantize(pixel).tolist() == [5]
+    assert CompiledPalette({3: "#020202", 5: "#000000"}).quantize(pixel).tolist() == [3]
+    assert CompiledPalette({1: "#000000"}).lut_bits == settings.palette_lut_bits
+
+    print("✅ Tie-breaking tests passed")
+
+
+def test_cache_reuses_compiled_palette():
+    """Palette giống nhau (khác object) dùng chung một CompiledPalette"""
+    print("\n🧪 Test palette LRU cache")
+
+    clear_palette_cache()
+    first = get_compiled_palette()
+    assert get_compiled_palette(dict(settings.default_palette)) is first
+
+    # Key dạng string cho cùng hash với key int
+    as_json = {str(k): v for k, v in settings.default_palette.items()}
+    assert get_compiled_palette(as_json) is first
+
+    # Đổi thứ tự thì là palette khác (thứ tự quyết định tie-break)
+    reordered = dict(reversed(list(settings.default_palette.items())))
+    assert get_compiled_palette(reordered) is not first
+
+    print("✅ Cache tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Compiled Palette\n")
+    print("=" * 60)
+
+    test_lut_matches_brute_force()
+    test_candidate_index_for_large_palettes()
+    test_lut_tie_breaking()
+    test_cache_reuses_compiled_palette()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
@@ -0,0 +1,109 @@
+"""
+Test Conversion Cache
+Kiểm tra cache kết quả chuyển đổi (key, LRU theo bộ nhớ, bộ đếm)
+"""
+import asyncio
+
+from app.config import settings
+from app.modules.image_converter.cache import ConversionCache, estimate_result_size
+
+from conftest import FakeCollection
+
+
+def make_result(cols: int, rows: int) -> dict:
+    """Kết quả giả lập {"meta", "matrix"}"""
+    return {
+        "meta": {"cols": cols, "rows": rows, "palette": {1: "#ff0000"}, "mode": "index"},
+        "matrix": [[1] * cols for _ in range(rows)],
+    }
+
+
+def test_cache_key_depends_on_all_inputs():
+    """Key thay đổi khi ảnh, kích thước, palette, mode hoặc settings kết quả thay đổi"""
+    print("🧪 Test cache key")
+
+    base = ConversionCache.make_key("img", 30, 30, "pal", mode="index")
+    assert base == ConversionCache.make_key("img", 30, 30, "pal", mode="index")
+    assert base != ConversionCache.make_key("img2", 30, 30, "pal", mode="index")
+    assert base != ConversionCache.make_key("img", 30, 20, "pal", mode="index")
+    assert base != ConversionCache.make_key("img", 30, 30, "pal2", mode="index")
+    assert base != ConversionCache.make_key("img", 30, 30, "pal", mode="other")
+
+    for name, value in (("dither_strength", 12.5), ("majority_block_size", 2)):
+        original = getattr(settings, name)
+        setattr(settings, name, value)
+        try:
+            assert base != ConversionCache.make_key("img", 30, 30, "pal", mode="index"), name
+        finally:
+            setattr(settings, name, original)
+    assert base == ConversionCache.make_key("img", 30, 30, "pal", mode="index")
+
+    print("✅ Cache key tests passed")
+
+
+def test_memory_lru_eviction_and_counters():
+    """LRU bỏ entry cũ nhất khi vượt giới hạn bộ nhớ"""
+    print("\n🧪 Test LRU eviction")
+
+    result = make_result(10, 10)
+    cache = ConversionCache(max_bytes=estimate_result_size(result) * 2, persistent=False)
+
+    async def run():
+        await cache.put("a", result)
+        await cache.put("b", result)
+        assert await cache.get("a") is result  # "a" thành mới nhất
+        await cache.put("c", result)  # bỏ "b"
+        assert await cache.get("b") is None
+        assert await cache.get("c") is result
+
+    asyncio.run(run())
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["memory_hits"] == 2 and stats["misses"] == 1
+    assert stats["bytes"] <= stats["max_bytes"]
+
+    print("✅ LRU tests passed")
+
+
+def test_persistent_hit_same_shape_as_memory_hit():
+    """Kết quả đọc từ MongoDB có key int như kết quả trong RAM"""
+    print("\n🧪 Test persistent cache key types")
+
+    result = make_result(3, 2)
+    result["meta"]["palette"] = {1: "#ff0000", 12: "#00ff00"}
+    result["meta"]["counts"] = {1: 4, 12: 2}
+
+    cache = ConversionCache(persistent=True)
+    collection = FakeCollection()
+    cache._collection = lambda: collection
+
+    async def run():
+        await cache.put("k", result)
+        memory_hit = await cache.get("k")
+        cache.clear()
+        persistent_hit = await cache.get("k")
+        return memory_hit, persistent_hit
+
+    memory_hit, persistent_hit = asyncio.run(run())
+    stored, = collection.docs
+    assert stored["_id"] == "k" and isinstance(stored["result"], str)
+    assert persistent_hit == memory_hit == result
+    assert list(persistent_hit["meta"]["palette"]) == [1, 12]
+    assert list(persistent_hit["meta"]["counts"]) == [1, 12]
+    assert cache.stats()["persistent_hits"] == 1
+
+    print("✅ Persistent cache key type tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Conversion Cache\n")
+    print("=" * 60)
+
+    test_cache_key_depends_on_all_inputs()
+    test_memory_lru_eviction_and_counters()
+    test_persistent_hit_same_shape_as_memory_hit()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
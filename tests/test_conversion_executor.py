@@ -0,0 +1,76 @@
+"""
+Test Conversion Executor
+Kiểm tra chuyển đổi ảnh chạy ngoài event loop qua ConversionExecutor
+"""
+import asyncio
+import threading
+
+from app.modules.image_converter.executor import ConversionExecutor, ConverterBusyError
+from app.modules.image_converter.service import convert_image_task, image_converter_service
+
+from conftest import RED, WHITE, make_stripes_png
+
+
+def test_process_pool_conversion():
+    """Kết quả từ process pool giống gọi trực tiếp"""
+    print("🧪 Test process pool conversion")
+
+    data = make_stripes_png([RED, WHITE], height=8, stripe_width=4)
+    executor = ConversionExecutor(workers=1, max_queue=4, max_tasks_per_child=2)
+
+    async def run():
+        return await asyncio.gather(
+            *[executor.run(convert_image_task, data, 4, 4) for _ in range(3)]
+        )
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        executor.shutdown()
+
+    expected = image_converter_service.convert_image(data, 4, 4)
+    assert all(result == expected for result in results)
+    assert executor.pending == 0
+
+    print("✅ Process pool tests passed")
+
+
+def test_queue_limit():
+    """Vượt quá max_queue thì bị từ chối ngay"""
+    print("\n🧪 Test queue limit")
+
+    release = threading.Event()
+    executor = ConversionExecutor(workers=0, max_queue=1)
+
+    async def run():
+        blocked = asyncio.ensure_future(executor.run(release.wait, 5))
+        await asyncio.sleep(0)
+        try:
+            await executor.run(release.wait, 5)
+            raise AssertionError("Expected ConverterBusyError")
+        except ConverterBusyError:
+            pass
+        finally:
+            release.set()
+        await blocked
+
+    try:
+        asyncio.run(run())
+    finally:
+        executor.shutdown()
+
+    assert executor.pending == 0
+
+    print("✅ Queue limit tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Conversion Executor\n")
+    print("=" * 60)
+
+    test_process_pool_conversion()
+    test_queue_limit()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
@@ -0,0 +1,251 @@
+"""
+Test Convert Batch
+Kiểm tra /image/convert/batch: thứ tự kết quả, lỗi riêng từng file, tùy chọn
+riêng từng file, palette_id/palette_override và khối summary/timings
+"""
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from app.modules.image_converter import routes
+from app.modules.image_converter.cache import conversion_cache
+
+from conftest import (
+    BLUE, GREEN, RED, fake_palettes, make_client, make_stripes_png, thread_executor,
+)
+
+def post_batch(client: TestClient, uploads: list[tuple[str, bytes]], params: str = "",
+               **data) -> dict:
+    response = client.post(
+        f"/image/convert/batch?{params}",
+        files=[("files", (name, content, "image/png")) for name, content in uploads],
+        data=data,
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def run_with_executor(test):
+    """Chạy test với executor dạng thread và cache trống, khôi phục sau đó"""
+    conversion_cache.clear()
+    try:
+        with thread_executor():
+            test(make_client(routes.router))
+    finally:
+        conversion_cache.clear()
+
+
+def test_batch_order_and_errors():
+    """Kết quả đúng thứ tự file; file lỗi không làm hỏng cả batch"""
+    print("\n🧪 Test batch order / per-item errors")
+
+    def check(client):
+        uploads = [
+            ("red.png", make_stripes_png([RED, RED])),
+            ("broken.png", b"not an image"),
+            ("blue.png", make_stripes_png([BLUE, BLUE])),
+        ]
+        body = post_batch(client, uploads, "cols=6&rows=3",
+                          palette=json.dumps({"1": "#ff0000", "2": "#0000ff"}))
+
+        items = body["items"]
+        assert [item["index"] for item in items] == [0, 1, 2]
+        assert [item["filename"] for item in items] == ["red.png", "broken.png", "blue.png"]
+        assert [item["success"] for item in items] == [True, False, True]
+        assert items[1]["error"] and "result" not in items[1]
+        assert items[0]["result"]["matrix"][0] == [1] * 6
+        assert items[2]["result"]["matrix"][0] == [2] * 6
+
+        assert body["summary"] == {"total": 3, "succeeded": 2, "failed": 1}
+
+    run_with_executor(check)
+    print("✅ batch order / per-item errors tests passed")
+
+
+def test_batch_item_overrides():
+    """cols/rows/palette/metric riêng từng file; override sai chỉ lỗi file đó"""
+    print("\n🧪 Test batch per-item overrides")
+
+    def check(client):
+        data = make_stripes_png([RED, GREEN, BLUE])
+        overrides = [
+            {},
+            {"cols": 3, "rows": 1},
+            {"palette": {"7": "#00ff00"}, "metric": "lab"},
+            {"metric": "nope"},
+            {"cols": 0},
+        ]
+        body = post_batch(
+            client, [(f"{i}.png", data) for i in range(len(overrides))], "cols=9&rows=3",
+            items=json.dumps(overrides),
+        )
+        items = body["items"]
+
+        assert len(items[0]["result"]["matrix"]) == 3
+        assert len(items[0]["result"]["matrix"][0]) == 9
+        assert len(items[1]["result"]["matrix"]) == 1
+        assert len(items[1]["result"]["matrix"][0]) == 3
+        assert items[2]["result"]["matrix"] == [[7] * 9] * 3
+        assert set(items[2]["result"]["meta"]["palette"]) == {"7"}
+        assert items[2]["result"]["meta"]["metric"] == "lab"
+        assert not items[3]["success"] and "metric" in items[3]["error"]
+        assert not items[4]["success"]
+        assert body["summary"] == {"total": 5, "succeeded": 3, "failed": 2}
+
+        bad = client.post(
+            "/image/convert/batch",
+            files=[("files", ("a.png", data, "image/png"))],
+            data={"items": json.dumps([{}, {}])},
+        )
+        assert bad.status_code == 400
+
+    run_with_executor(check)
+    print("✅ batch per-item overrides tests passed")
+
+
+def test_batch_timings_and_cache():
+    """Khối timings khớp elapsed_ms của từng file, lần gọi lại lấy từ cache"""
+    print("\n🧪 Test batch timings / summary")
+
+    def check(client):
+        uploads = [("a.png", make_stripes_png([RED])), ("b.png", make_stripes_png([GREEN, BLUE]))]
+        body = post_batch(client, uploads, "cols=4&rows=2")
+
+        timings = body["timings"]
+        assert set(timings) == {"wall_ms", "convert_ms_total", "convert_ms_avg",
+                                "convert_ms_max"}
+        elapsed = [item["elapsed_ms"] for item in body["items"]]
+        assert not any(item["cached"] for item in body["items"])
+        assert abs(timings["convert_ms_total"] - sum(elapsed)) < 0.05
+        assert timings["convert_ms_max"] == max(elapsed)
+        assert abs(timings["convert_ms_avg"] - sum(elapsed) / 2) < 0.05
+        assert timings["wall_ms"] >= timings["convert_ms_max"]
+
+        again = post_batch(client, uploads, "cols=4&rows=2")
+        assert all(item["cached"] for item in again["items"])
+        assert again["timings"]["convert_ms_total"] == 0
+        assert again["items"][1]["result"] == body["items"][1]["result"]
+
+        empty = post_batch(client, [("x.png", b"nope")])
+        assert empty["summary"] == {"total": 1, "succeeded": 0, "failed": 1}
+        assert empty["timings"]["convert_ms_avg"] == 0
+        assert empty["timings"]["convert_ms_max"] == 0
+
+    run_with_executor(check)
+    print("✅ batch timings / summary tests passed")
+
+
+def test_batch_and_variants_palette_registry():
+    """palette_id/palette_override đi qua registry như các route convert khác"""
+    print("\n🧪 Test batch/variants palette_id + palette_override")
+
+    docs = {"p1": {"_id": "p1", "colors": {"4": "#ff0000", "5": "#00ff00", "6": "#0000ff"}}}
+
+    def check(client):
+        data = make_stripes_png([RED, GREEN, BLUE])
+        body = post_batch(client, [("a.png", data)], "cols=9&rows=3", palette_id="p1")
+        assert body["items"][0]["result"]["matrix"][0] == [4, 4, 4, 5, 5, 5, 6, 6, 6]
+
+        body = post_batch(client, [("a.png", data)], "cols=9&rows=3",
+                          palette_id="p1", palette_override="4,6")
+        assert set(body["items"][0]["result"]["meta"]["palette"]) == {"4", "6"}
+        assert body["items"][0]["result"]["matrix"][0][:3] == [4, 4, 4]
+        assert body["items"][0]["result"]["matrix"][0][6:] == [6, 6, 6]
+
+        response = client.post(
+            "/image/convert/variants",
+            files={"file": ("a.png", data, "image/png")},
+            data={"variants": json.dumps([{"cols": 9, "rows": 3}]), "palette_id": "p1",
+                  "palette_override": "5"},
+        )
+        assert response.status_code == 200, response.text
+        result = response.json()["variants"][0]["result"]
+        assert result["matrix"] == [[5] * 9] * 3
+
+        batch = [("files", ("a.png", data, "image/png"))]
+        missing = client.post("/image/convert/batch", files=batch,
+                              data={"palette_id": "missing"})
+        assert missing.status_code == 404
+        bad = client.post("/image/convert/batch", files=batch,
+                          data={"palette_id": "p1", "palette_override": "4,99"})
+        assert bad.status_code == 400
+        both = client.post("/image/convert/batch", files=batch,
+                           data={"palette_id": "p1", "palette": '{"1": "#ffffff"}'})
+        assert both.status_code == 400
+
+    with fake_palettes(docs):
+        run_with_executor(check)
+
+    print("✅ batch/variants palette registry tests passed")
+
+
+class ProcessLikeExecutor:
+    """Executor giả như process pool: nhận bytes, đếm số file đang nằm trong RAM"""
+
+    uses_processes = True
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.in_memory = 0
+        self.max_in_memory = 0
+
+    def track_read(self, source):
+        read = source.read
+
+        def counted_read(*args):
+            self.in_memory += 1
+            self.max_in_memory = max(self.max_in_memory, self.in_memory)
+            return read(*args)
+
+        source.read = counted_read
+        return source
+
+    async def run(self, fn, data, *args, **kwargs):
+        assert isinstance(data, bytes)
+        await asyncio.sleep(0.01)
+        self.in_memory -= 1
+        return {"meta": {}, "matrix": [[1]]}, 1.0
+
+
+def test_batch_reads_bytes_only_when_converting():
+    """Process pool: chỉ khoảng workers file được đọc thành bytes cùng lúc"""
+    print("\n🧪 Test batch bounded upload memory")
+
+    executor = ProcessLikeExecutor(workers=2)
+    original_executor = routes.conversion_executor
+    original_read = routes.read_image_upload
+
+    async def tracked_read(file):
+        source, digest = await original_read(file)
+        return executor.track_read(source), digest
+
+    routes.conversion_executor = executor
+    routes.read_image_upload = tracked_read
+    conversion_cache.clear()
+    try:
+        uploads = [(f"{i}.png", make_stripes_png([(i, i, i)])) for i in range(8)]
+        body = post_batch(make_client(routes.router), uploads, "cols=1&rows=1")
+        assert body["summary"]["succeeded"] == 8
+        assert executor.max_in_memory == 2
+    finally:
+        routes.conversion_executor = original_executor
+        routes.read_image_upload = original_read
+        conversion_cache.clear()
+
+    print("✅ batch bounded upload memory tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Convert Batch\n")
+    print("=" * 60)
+
+    test_batch_order_and_errors()
+    test_batch_item_overrides()
+    test_batch_timings_and_cache()
+    test_batch_and_variants_palette_registry()
+    test_batch_reads_bytes_only_when_converting()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
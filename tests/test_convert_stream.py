@@ -0,0 +1,88 @@
+"""
+Test Convert Stream
+Kiểm tra lượng tử hoá theo dải hàng và endpoint NDJSON /image/convert/stream
+"""
+import json
+
+import numpy as np
+
+from app.modules.image_converter import routes
+from app.modules.image_converter.service import (
+    decode_grid_task,
+    image_converter_service,
+    quantize_band_task,
+)
+
+from conftest import make_client, make_png, thread_executor
+
+
+def test_bands_match_whole_image():
+    """Ghép các dải (kể cả carry Floyd-Steinberg, pha Bayer) giống chuyển đổi cả ảnh"""
+    print("🧪 Test band quantization")
+
+    image = make_png(160, 120, seed=3)
+    cols, rows, band = 40, 30, 7
+    for dither in ("none", "bayer", "floyd-steinberg"):
+        for downsample in ("nearest", "majority"):
+            expected = image_converter_service.convert_image(
+                image, cols, rows, dither=dither, downsample=downsample
+            )["matrix"]
+
+            pixels, info = decode_grid_task(image, cols, rows, downsample)
+            scale = info.get("block") or 1
+            carry, bands = None, []
+            for y in range(0, rows, band):
+                indices, _, carry = quantize_band_task(
+                    pixels[y * scale:(y + band) * scale], None, "rgb", dither,
+                    info.get("block"), y * scale, carry,
+                )
+                bands.append(indices)
+            assert np.vstack(bands).tolist() == expected, (dither, downsample)
+
+    print("✅ Band quantization tests passed")
+
+
+def test_stream_endpoint_ndjson():
+    """Endpoint trả meta, từng hàng theo thứ tự rồi end với palette đã dùng"""
+    print("\n🧪 Test /image/convert/stream")
+
+    with thread_executor():
+        client = make_client(routes.router)
+
+        image = make_png(90, 60, seed=4)
+        response = client.post(
+            "/image/convert/stream?cols=45&rows=30&band_rows=8&dither=bayer",
+            files={"file": ("a.png", image, "image/png")},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[0]["type"] == "meta" and lines[-1]["type"] == "end"
+        matrix = [line["row"] for line in lines[1:-1]]
+        assert [line["y"] for line in lines[1:-1]] == list(range(30))
+
+        expected = image_converter_service.convert_image(image, 45, 30, dither="bayer")
+        assert matrix == expected["matrix"]
+        assert lines[-1]["palette"] == {str(k): v for k, v in expected["meta"]["palette"].items()}
+        assert lines[-1]["counts"] == {str(k): v for k, v in expected["meta"]["counts"].items()}
+
+        bad = client.post(
+            "/image/convert/stream?dither=x",
+            files={"file": ("a.png", image, "image/png")},
+        )
+        assert bad.status_code == 400
+
+    print("✅ Stream endpoint tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Convert Stream\n")
+    print("=" * 60)
+
+    test_bands_match_whole_image()
+    test_stream_endpoint_ndjson()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
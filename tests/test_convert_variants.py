@@ -0,0 +1,73 @@
+"""
+Test Convert Variants
+Kiểm tra chuyển đổi nhiều lưới/palette từ một lần decode (ImagePyramid)
+"""
+from app.modules.image_converter.decode import ImagePyramid
+from app.modules.image_converter.service import image_converter_service
+
+from conftest import make_png
+
+
+def test_pyramid_levels():
+    """Tầng giảm 2 lần cho tới lưới nhỏ nhất, mỗi lưới lấy tầng nhỏ nhất đủ lớn"""
+    print("🧪 Test ImagePyramid")
+
+    data = make_png(400, 320)
+    pyramid = ImagePyramid(data, [(20, 20, "nearest"), (40, 40, "box"), (90, 70, "nearest")])
+    sizes = [level.size for level in pyramid.levels]
+    assert sizes == [(400, 320), (200, 160), (100, 80), (50, 40), (25, 20)]
+
+    for cols, rows, level in [(20, 20, 4), (40, 40, 3), (90, 70, 2), (100, 80, 2)]:
+        img, info = pyramid.resample(cols, rows, "box")
+        assert img.size == (cols, rows) and img.mode == "RGB"
+        assert info["level"] == level, (cols, rows, info)
+
+    _, info = pyramid.resample(10, 10, "majority")
+    assert info["block"] == 4 and info["level"] == 3
+
+    print("✅ ImagePyramid tests passed")
+
+
+def test_convert_variants():
+    """Nhiều variant trong một lần gọi, variant lớn nhất giống convert_image"""
+    print("\n🧪 Test convert_variants")
+
+    data = make_png(120, 90, seed=1)
+    gray = {1: "#000000", 2: "#ffffff"}
+    output = image_converter_service.convert_variants(
+        data,
+        [
+            {"cols": 90, "rows": 60},
+            {"cols": 30, "rows": 30, "palette": gray},
+            {"cols": 20, "rows": 20, "metric": "lab", "downsample": "box"},
+            {"cols": 20, "rows": 10, "matrix_format": "packed", "rle": True},
+        ],
+    )
+    results = output["results"]
+    assert len(results) == len(output["elapsed_ms"]) == 4
+    assert len(results[0]["matrix"]) == 60 and len(results[0]["matrix"][0]) == 90
+    assert set(results[1]["meta"]["palette"]) <= {1, 2}
+    assert results[2]["meta"]["metric"] == "lab"
+    assert results[2]["meta"]["downsample"] == "box"
+    assert results[3]["meta"]["encoding"]["rle"] is True
+
+    # Variant lớn nhất lấy mẫu từ ảnh gốc (tầng 0) nên khớp /convert
+    assert results[0]["meta"]["decode"]["level"] == 0
+    single = image_converter_service.convert_image(data, 90, 60)
+    assert results[0]["matrix"] == single["matrix"]
+
+    print(f"   decode {output['decode_ms']:.2f} ms, variants "
+          + ", ".join(f"{ms:.2f}" for ms in output["elapsed_ms"]) + " ms")
+
+    try:
+        image_converter_service.convert_variants(data, [])
+        assert False, "danh sách rỗng phải lỗi"
+    except ValueError:
+        pass
+
+    print("✅ convert_variants tests passed")
+
+
+if __name__ == "__main__":
+    test_pyramid_levels()
+    test_convert_variants()
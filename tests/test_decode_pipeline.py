@@ -0,0 +1,71 @@
+"""
+Test Decode Pipeline
+Kiểm tra decode JPEG dạng draft và chuyển RGB sau khi thu nhỏ
+"""
+import io
+
+from PIL import Image
+
+from app.modules.image_converter.decode import decode_to_grid
+from app.modules.image_converter.service import image_converter_service
+
+from conftest import encode_image
+
+
+def gradient(width: int, height: int) -> Image.Image:
+    """Ảnh RGB dạng gradient"""
+    img = Image.new("RGB", (width, height))
+    img.putdata(
+        [
+            ((x * 255) // width, (y * 255) // height, 128)
+            for y in range(height)
+            for x in range(width)
+        ]
+    )
+    return img
+
+
+def test_jpeg_uses_draft():
+    """JPEG lớn được decode ở tỉ lệ giảm nhưng vẫn >= kích thước lưới"""
+    print("🧪 Test JPEG draft decoding")
+
+    data = encode_image(gradient(1600, 1200), "JPEG")
+    img, info = decode_to_grid(data, 40, 30)
+
+    assert img.size == (40, 30) and img.mode == "RGB"
+    assert info["path"] == "jpeg_draft"
+    assert info["source_size"] == [1600, 1200]
+    assert info["decoded_size"] == [200, 150]
+
+    result = image_converter_service.convert_image(data, 40, 30)
+    assert result["meta"]["decode"]["path"] == "jpeg_draft"
+
+    print("✅ JPEG draft tests passed")
+
+
+def test_non_jpeg_matches_full_decode():
+    """PNG (P/RGBA) cho kết quả giống convert RGB toàn ảnh rồi resize"""
+    print("\n🧪 Test deferred RGB conversion")
+
+    base = gradient(97, 61)
+    for img in (base.convert("P"), base.convert("RGBA"), base.convert("L")):
+        data = encode_image(img)
+        decoded, info = decode_to_grid(data, 23, 17)
+        expected = Image.open(io.BytesIO(data)).convert("RGB").resize((23, 17), Image.NEAREST)
+
+        assert info["path"] == "full"
+        assert list(decoded.getdata()) == list(expected.getdata())
+
+    print("✅ Deferred conversion tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Decode Pipeline\n")
+    print("=" * 60)
+
+    test_jpeg_uses_draft()
+    test_non_jpeg_matches_full_decode()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
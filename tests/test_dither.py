@@ -0,0 +1,119 @@
+"""
+Test Dithering
+Kiểm tra ordered dither (Bayer) và Floyd-Steinberg theo đường chéo
+"""
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from app.config import settings
+from app.modules.image_converter.dither import (
+    bayer_matrix,
+    floyd_steinberg_positions,
+    ordered_dither,
+)
+from app.modules.image_converter.palette import CompiledPalette
+from app.modules.image_converter.service import image_converter_service
+
+from conftest import encode_image
+
+
+def floyd_steinberg_reference(pixels: np.ndarray, compiled: CompiledPalette) -> np.ndarray:
+    """Floyd-Steinberg quét raster từng pixel (chậm, để đối chiếu)"""
+    height, width = pixels.shape[:2]
+    work = pixels.astype(np.float64)
+    positions = np.empty((height, width), dtype=np.intp)
+    for y in range(height):
+        for x in range(width):
+            value = np.clip(work[y, x], 0, 255)
+            found = compiled.positions(np.rint(value).astype(np.uint8)[None, :])[0]
+            positions[y, x] = found
+            error = value - compiled.colors[found]
+            if x + 1 < width:
+                work[y, x + 1] += error * (7 / 16)
+            if y + 1 < height:
+                if x > 0:
+                    work[y + 1, x - 1] += error * (3 / 16)
+                work[y + 1, x] += error * (5 / 16)
+                if x + 1 < width:
+                    work[y + 1, x + 1] += error * (1 / 16)
+    return positions
+
+
+def gradient_png(width: int, height: int) -> bytes:
+    """Ảnh gradient mịn (dễ bị banding khi không dither)"""
+    xs = np.linspace(0, 255, width)
+    ys = np.linspace(0, 255, height)
+    pixels = np.stack(
+        np.broadcast_arrays(xs[None, :], ys[:, None], (xs[None, :] + ys[:, None]) / 2),
+        axis=-1,
+    ).astype(np.uint8)
+    return encode_image(Image.fromarray(pixels))
+
+
+def test_bayer_matrix():
+    """Bayer 8x8 chứa mỗi ngưỡng đúng một lần, đối xứng quanh 0"""
+    print("🧪 Test Bayer matrix")
+
+    matrix = bayer_matrix(8)
+    ranks = np.rint((matrix + 0.5) * 64 - 0.5).astype(int)
+    assert sorted(ranks.ravel().tolist()) == list(range(64))
+    assert abs(matrix.mean()) < 1e-12
+
+    flat = np.full((16, 16, 3), 128, dtype=np.uint8)
+    dithered = ordered_dither(flat, 32)
+    assert dithered.min() < 128 < dithered.max()
+
+    print("✅ Bayer matrix tests passed")
+
+
+def test_floyd_steinberg_matches_raster_order():
+    """Wavefront cho kết quả giống quét raster"""
+    print("\n🧪 Test Floyd-Steinberg wavefront")
+
+    rng = np.random.default_rng(5)
+    compiled = CompiledPalette(settings.default_palette, 5)
+    for height, width in [(1, 1), (1, 9), (9, 1), (13, 17), (20, 8)]:
+        pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        expected = floyd_steinberg_reference(pixels, compiled)
+        assert np.array_equal(floyd_steinberg_positions(pixels, compiled), expected)
+
+    print("✅ Floyd-Steinberg tests passed")
+
+
+def test_convert_image_dither_modes():
+    """Dither giữ độ sáng cục bộ (trung bình khối 6x6) sát ảnh gốc hơn"""
+    print("\n🧪 Test convert_image dither modes")
+
+    data = gradient_png(200, 200)
+    gray = {1: "#000000", 2: "#ffffff"}
+    source = np.asarray(Image.open(BytesIO(data)).convert("L").resize((60, 60), Image.NEAREST))
+
+    def block_means(image: np.ndarray) -> np.ndarray:
+        return image.reshape(10, 6, 10, 6).mean(axis=(1, 3))
+
+    errors = {}
+    for dither in ("none", "bayer", "floyd-steinberg"):
+        result = image_converter_service.convert_image(data, 60, 60, gray, dither=dither)
+        assert result["meta"]["dither"] == dither
+        levels = np.where(np.array(result["matrix"]) == 2, 255, 0)
+        errors[dither] = np.abs(block_means(levels) - block_means(source)).mean()
+        print(f"   {dither}: sai lệch độ sáng theo khối {errors[dither]:.1f}")
+
+    assert errors["bayer"] < errors["none"] / 2
+    assert errors["floyd-steinberg"] < errors["none"] / 2
+
+    try:
+        image_converter_service.convert_image(data, 4, 4, dither="random")
+        assert False, "dither không hợp lệ phải lỗi"
+    except ValueError:
+        pass
+
+    print("✅ Dither mode tests passed")
+
+
+if __name__ == "__main__":
+    test_bayer_matrix()
+    test_floyd_steinberg_matches_raster_order()
+    test_convert_image_dither_modes()
@@ -0,0 +1,102 @@
+"""
+Test Downsample Modes
+Kiểm tra các chế độ thu nhỏ: nearest, box (trung bình vùng), majority
+"""
+import numpy as np
+from PIL import Image
+
+from app.modules.image_converter.service import image_converter_service
+from app.modules.image_converter.utils import block_majority
+
+from conftest import encode_image
+
+PALETTE = {1: "#000000", 2: "#808080", 3: "#ffffff", 4: "#ff0000", 5: "#0000ff"}
+
+
+def to_png(pixels: np.ndarray, mode: str = None) -> bytes:
+    img = Image.fromarray(pixels)
+    if mode:
+        img = img.convert(mode)
+    return encode_image(img)
+
+
+def test_block_majority():
+    """Bầu màu theo khối, hoà thì lấy màu đứng trước"""
+    print("🧪 Test block_majority")
+
+    positions = np.array([
+        [0, 0, 1, 2],
+        [0, 1, 2, 1],
+        [3, 3, 4, 4],
+        [3, 4, 3, 4],
+    ])
+    assert block_majority(positions, 2, 5).tolist() == [[0, 1], [3, 4]]
+    assert block_majority(positions, 1, 5) is positions
+
+    # Palette lớn: khớp đếm phiếu bằng bincount trên (ô, màu), kể cả hoà
+    rng = np.random.default_rng(7)
+    for palette_size, block in ((256, 4), (3, 3), (40, 2)):
+        positions = rng.integers(0, palette_size, size=(30 * block, 20 * block))
+        blocks = positions.reshape(30, block, 20, block).transpose(0, 2, 1, 3)
+        keys = np.arange(600).repeat(block * block) * palette_size + blocks.reshape(-1)
+        expected = np.bincount(keys, minlength=600 * palette_size)
+        expected = expected.reshape(30, 20, palette_size).argmax(axis=-1)
+        assert np.array_equal(block_majority(positions, block, palette_size), expected)
+
+    print("✅ block_majority tests passed")
+
+
+def test_box_averages_fine_detail():
+    """Bàn cờ 1px đen/trắng: box ra xám, nearest ra đen hoặc trắng"""
+    print("\n🧪 Test box downsample")
+
+    checker = ((np.indices((80, 80)).sum(axis=0) % 2) * 255).astype(np.uint8)
+    data = to_png(np.stack([checker] * 3, axis=-1))
+
+    nearest = image_converter_service.convert_image(data, 10, 10, PALETTE)
+    box = image_converter_service.convert_image(data, 10, 10, PALETTE, downsample="box")
+    assert set(np.unique(nearest["matrix"]).tolist()) <= {1, 3}
+    assert np.unique(box["matrix"]).tolist() == [2]
+    assert box["meta"]["downsample"] == "box"
+
+    # Ảnh palette (mode P) được chuyển RGB trước khi lấy trung bình
+    paletted = image_converter_service.convert_image(
+        to_png(np.stack([checker] * 3, axis=-1), "P"), 10, 10, PALETTE, downsample="box"
+    )
+    assert np.unique(paletted["matrix"]).tolist() == [2]
+
+    print("✅ Box downsample tests passed")
+
+
+def test_majority_removes_speckles():
+    """Nền đỏ lốm đốm xanh 15%: majority cho toàn đỏ, nearest dính đốm"""
+    print("\n🧪 Test majority downsample")
+
+    rng = np.random.default_rng(0)
+    pixels = np.zeros((120, 120, 3), dtype=np.uint8)
+    pixels[...] = (255, 0, 0)
+    pixels[rng.random((120, 120)) < 0.15] = (0, 0, 255)
+    data = to_png(pixels)
+
+    nearest = image_converter_service.convert_image(data, 30, 30, PALETTE)
+    majority = image_converter_service.convert_image(
+        data, 30, 30, PALETTE, downsample="majority"
+    )
+    assert 5 in np.unique(nearest["matrix"]).tolist()
+    assert np.unique(majority["matrix"]).tolist() == [4]
+    assert majority["meta"]["decode"]["block"] == 4
+    assert len(majority["matrix"]) == 30 and len(majority["matrix"][0]) == 30
+
+    # Ảnh nhỏ hơn lưới x block: khối tự thu nhỏ
+    small = image_converter_service.convert_image(
+        data, 60, 60, PALETTE, downsample="majority"
+    )
+    assert small["meta"]["decode"]["block"] == 2
+
+    print("✅ Majority downsample tests passed")
+
+
+if __name__ == "__main__":
+    test_block_majority()
+    test_box_averages_fine_detail()
+    test_majority_removes_speckles()
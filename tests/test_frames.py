@@ -0,0 +1,162 @@
+"""
+Test Frames
+Kiểm tra chuyển đổi ảnh động (GIF/WebP) theo từng frame và endpoint /image/convert/frames
+"""
+import json
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from app.config import settings
+from app.modules.image_converter import routes
+from app.modules.image_converter.packing import apply_diff, diff_matrix
+from app.modules.image_converter.service import image_converter_service
+
+from conftest import encode_image, make_client, thread_executor
+
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
+
+
+def make_animation(frame_count: int, format: str = "GIF") -> bytes:
+    """Ảnh động 20x10: nền đỏ, một ô vuông 4x4 chạy sang phải mỗi frame"""
+    frames = []
+    for i in range(frame_count):
+        img = Image.new("RGB", (20, 10), COLORS[0])
+        for x in range(2 * i, 2 * i + 4):
+            for y in range(3, 7):
+                img.putpixel((x % 20, y), COLORS[1 + i % 3])
+        frames.append(img)
+    buf = BytesIO()
+    frames[0].save(
+        buf, format=format, save_all=True, append_images=frames[1:],
+        duration=50, loop=0, lossless=True,
+    )
+    return buf.getvalue()
+
+
+def test_diff_matrix():
+    """diff_matrix chỉ lấy ô thay đổi, apply_diff dựng lại đúng frame"""
+    print("🧪 Test diff_matrix")
+
+    previous = np.array([[1, 1, 2], [3, 3, 3]])
+    current = np.array([[1, 4, 2], [3, 3, 5]])
+    changes = diff_matrix(previous, current)
+    assert changes.tolist() == [[0, 1, 4], [1, 2, 5]]
+    assert apply_diff(previous, changes).tolist() == current.tolist()
+    assert diff_matrix(current, current).shape == (0, 3)
+
+    print("✅ diff_matrix tests passed")
+
+
+def test_convert_frames_service():
+    """Mỗi frame lượng tử hoá như ảnh tĩnh tương ứng, chia lượt không đổi kết quả"""
+    print("\n🧪 Test convert_frames")
+
+    for format in ("GIF", "WEBP"):
+        data = make_animation(5, format)
+        result = image_converter_service.convert_frames(data, 20, 10)
+        assert result["decode"]["frame_count"] == 5
+        assert [f["index"] for f in result["frames"]] == list(range(5))
+        assert all(f["duration"] == 50 for f in result["frames"])
+
+        with Image.open(BytesIO(data)) as img:
+            img.seek(3)
+            frame = encode_image(img.convert("RGB"))
+        expected = image_converter_service.convert_image(frame, 20, 10)
+        assert result["frames"][3]["matrix"].tolist() == expected["matrix"], format
+
+        part = image_converter_service.convert_frames(data, 20, 10, start=2, limit=2)
+        assert [f["index"] for f in part["frames"]] == [2, 3]
+        assert part["frames"][1]["matrix"].tolist() == expected["matrix"]
+
+    original = settings.max_frames
+    settings.max_frames = 3
+    try:
+        image_converter_service.convert_frames(make_animation(5), 20, 10)
+        raise AssertionError("Expected ValueError")
+    except ValueError:
+        pass
+    finally:
+        settings.max_frames = original
+
+    print("✅ convert_frames tests passed")
+
+
+def test_frames_endpoint():
+    """Stream delta dựng lại đúng các frame đầy đủ, qua nhiều lượt frame_batch"""
+    print("\n🧪 Test /image/convert/frames")
+
+    original_batch = settings.frame_batch
+    settings.frame_batch = 2
+    try:
+        with thread_executor():
+            client = make_client(routes.router)
+            data = make_animation(7)
+
+            def post(delta: bool) -> list[dict]:
+                response = client.post(
+                    f"/image/convert/frames?cols=20&rows=10&delta={str(delta).lower()}",
+                    files={"file": ("a.gif", data, "image/gif")},
+                )
+                assert response.status_code == 200
+                return [json.loads(line) for line in response.text.splitlines()]
+
+            # Ảnh chỉ mở (và đếm frame) một lần cho cả request dù chia nhiều lượt
+            opened = []
+            open_frames = image_converter_service.open_frames
+
+            def counting_open_frames(*args, **kwargs):
+                opened.append(args)
+                return open_frames(*args, **kwargs)
+
+            image_converter_service.open_frames = counting_open_frames
+            try:
+                full = post(False)
+            finally:
+                image_converter_service.open_frames = open_frames
+            assert len(opened) == 1
+            assert full[0]["type"] == "meta" and full[0]["frame_count"] == 7
+            assert full[0]["encoding"] == "full" and full[-1]["type"] == "end"
+            full_frames = [line["matrix"] for line in full[1:-1]]
+            assert len(full_frames) == 7
+
+            lines = post(True)
+            assert lines[0]["encoding"] == "delta"
+            assert "matrix" in lines[1] and all("changes" in line for line in lines[2:-1])
+            matrix = None
+            for line, expected in zip(lines[1:-1], full_frames):
+                matrix = np.array(line["matrix"]) if "matrix" in line else apply_diff(matrix, line["changes"])
+                assert matrix.tolist() == expected
+
+            totals = {}
+            for frame in full_frames:
+                for row in frame:
+                    for idx in row:
+                        totals[str(idx)] = totals.get(str(idx), 0) + 1
+            assert lines[-1]["counts"] == totals
+
+            # GIF tĩnh cũng dùng được với /image/convert
+            single = client.post(
+                "/image/convert?cols=20&rows=10",
+                files={"file": ("a.gif", make_animation(1), "image/gif")},
+            )
+            assert single.status_code == 200
+            assert single.json()["matrix"] == full_frames[0]
+    finally:
+        settings.frame_batch = original_batch
+
+    print("✅ Frames endpoint tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Frames\n")
+    print("=" * 60)
+
+    test_diff_matrix()
+    test_convert_frames_service()
+    test_frames_endpoint()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
@@ -0,0 +1,104 @@
+"""
+Test History Name Sort
+Kiểm tra nameSort (khóa sort theo name tính sẵn) và sort/phân trang chạy trong MongoDB
+"""
+import asyncio
+
+import numpy as np
+from bson import ObjectId
+
+from app.modules.database.models import HistoryCreateRequest
+from app.modules.database.service import database_service
+from app.modules.image_converter.level import build_level
+from app.modules.jobs.service import import_history_item
+from app.utils.helpers import history_name_sort_key, sort_histories_by_name
+
+from conftest import FakeCollection, use_collection
+
+PALETTE = {1: "#ff0000", 2: "#00ff00"}
+NAMES = ["4", "41", "-3", "2.5", "abc", "Level 2", "b", "1e3", "51", "5", "", "Zed", "10"]
+
+
+def make_doc(name):
+    return {"_id": ObjectId(), "key": "history", "value": {"name": name}}
+
+
+def test_name_sort_key_matches_python_sort():
+    """Sort theo nameSort (so sánh chuỗi) cho cùng thứ tự với sort_histories_by_name"""
+    print("🧪 Test history_name_sort_key")
+
+    docs = [make_doc(name) for name in NAMES + [None, "-0", "0", " 7 "]]
+    expected = [doc["value"]["name"] for doc in sort_histories_by_name(docs, "asc")]
+    by_key = sorted(docs, key=lambda doc: history_name_sort_key(doc["value"]["name"]))
+    assert [doc["value"]["name"] for doc in by_key] == expected
+    assert history_name_sort_key("-0") == history_name_sort_key("0")
+    assert history_name_sort_key("LEVEL") == history_name_sort_key("level")
+
+    print("✅ history_name_sort_key tests passed")
+
+
+def test_list_histories_sorts_in_database():
+    """Backfill ghi nameSort, list_histories sort/skip/limit trong MongoDB"""
+    print("\n🧪 Test list_histories name sort pushdown")
+
+    docs = [make_doc(name) for name in NAMES]
+    with use_collection("histories", FakeCollection(docs)) as histories:
+        async def run():
+            updated = await database_service.backfill_history_name_sort(batch_size=4)
+            assert updated == len(NAMES)
+            assert await database_service.backfill_history_name_sort() == 0
+
+            for order in ("asc", "desc"):
+                expected = [
+                    doc["value"]["name"] for doc in sort_histories_by_name(docs, order)
+                ]
+                page = await database_service.list_histories(
+                    skip=3, limit=5, sort_by="name", sort_order=order
+                )
+                assert [doc["value"]["name"] for doc in page] == expected[3:8], order
+
+                cursor = histories.cursors[-1]
+                direction = 1 if order == "asc" else -1
+                assert cursor.calls == [
+                    ("sort", [("nameSort", direction), ("_id", direction)]),
+                    ("skip", 3),
+                    ("limit", 5),
+                ]
+
+        asyncio.run(run())
+
+    print("✅ list_histories pushdown tests passed")
+
+
+def test_create_history_writes_name_sort():
+    """create_history và job import (insert_history_item) đều ghi nameSort"""
+    print("\n🧪 Test create_history nameSort")
+
+    level = build_level(np.array([[1, 2], [2, 1]]), {1: 2, 2: 2}, PALETTE, "level")
+    with use_collection("histories", FakeCollection()) as histories:
+        async def run():
+            await database_service.create_history(
+                HistoryCreateRequest(value={"name": "41", "level": level})
+            )
+            await import_history_item({"value": {"name": "Level 2", "level": level}})
+
+        asyncio.run(run())
+        assert [doc["nameSort"] for doc in histories.docs] == [
+            history_name_sort_key("41"),
+            history_name_sort_key("Level 2"),
+        ]
+
+    print("✅ create_history nameSort tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing History Name Sort\n")
+    print("=" * 60)
+
+    test_name_sort_key_matches_python_sort()
+    test_list_histories_sorts_in_database()
+    test_create_history_writes_name_sort()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
@@ -0,0 +1,130 @@
+"""
+Test Image Level
+Kiểm tra dựng level (board CellModel + config) từ ảnh và endpoint /image/convert/level
+"""
+import numpy as np
+
+from app.modules.database.models import HistoryItemCreateRequest, HistoryLevelModel
+from app.modules.image_converter import routes
+from app.modules.image_converter.level import build_board, build_level
+
+from conftest import (
+    BLUE, RED, FakeCollection, make_client, make_stripes_png, thread_executor, use_collection,
+)
+
+
+# Ảnh 6x2: 3 cột đỏ, 3 cột xanh dương
+STRIPES_PNG = make_stripes_png([RED, BLUE], height=2)
+
+
+def test_build_level():
+    """Board/config đúng dạng HistoryLevelModel, số liệu khớp matrix"""
+    print("🧪 Test build_level")
+
+    matrix = np.array([[1, 1, 3], [3, 3, 12]])
+    board = build_board(matrix)
+    assert [[cell["color"] for cell in row] for row in board] == [
+        ["1", "1", "3"], ["3", "3", "12"]
+    ]
+    assert all(cell["type"] == "block" and cell["element"] is None
+               for row in board for cell in row)
+
+    palette = {1: "#ff0000", 3: "#0000ff", 12: "#000000", 5: "#00ff00"}
+    level = build_level(matrix, {1: 2, 3: 3, 12: 1}, palette, "demo", "Hard")
+    config = level["config"]
+    assert (config["width"], config["height"]) == (3, 2)
+    assert config["blockCount"] == 6 and config["colorCount"] == 3
+    assert config["selectedColors"] == ["1", "3", "12"]
+    assert config["colorMapping"] == {"1": "#ff0000", "3": "#0000ff", "12": "#000000"}
+
+    # Frontend vẫn gửi được level này qua /db/histories
+    model = HistoryLevelModel(**level)
+    assert model.board[1][2].color == "12"
+
+    try:
+        build_level(matrix, {1: 2}, palette, "demo", "Extreme")
+        raise AssertionError("Expected ValueError")
+    except ValueError:
+        pass
+
+    print("✅ build_level tests passed")
+
+
+def test_build_board_any_int_keys():
+    """Key âm, không liên tục hoặc rất lớn không làm sai màu/cấp phát bảng lớn"""
+    print("\n🧪 Test build_board key int tuỳ ý")
+
+    cases = [
+        np.array([[-1, 2], [2, -1]]),
+        np.array([[-5, -2], [-2, -5]]),
+        np.array([[1_000_000_000, 7], [-3, 1_000_000_000]]),
+    ]
+    for matrix in cases:
+        board = build_board(matrix)
+        assert [[cell["color"] for cell in row] for row in board] == [
+            [str(idx) for idx in row] for row in matrix.tolist()
+        ]
+
+    board = build_board(np.array([[-1, 2], [2, -1]]))
+    assert board[0][0] is board[1][1] and board[0][0] is not board[0][1]
+    assert build_board(np.zeros((2, 0), dtype=int)) == [[], []]
+
+    print("✅ build_board key int tuỳ ý tests passed")
+
+
+def test_convert_level_endpoint():
+    """/image/convert/level trả level, save=true lưu history có id"""
+    print("\n🧪 Test /image/convert/level")
+
+    with thread_executor(), use_collection("histories", FakeCollection()) as histories:
+        client = make_client(routes.router)
+
+        response = client.post(
+            "/image/convert/level?cols=6&rows=2",
+            files={"file": ("castle.png", STRIPES_PNG, "image/png")},
+        )
+        assert response.status_code == 200
+        body = response.json()
+        level = body["level"]
+        assert body["history"] is None and histories.docs == []
+        assert level["config"]["name"] == "castle"
+        assert [cell["color"] for cell in level["board"][0]] == ["1", "1", "1", "2", "2", "2"]
+        assert level["config"]["colorMapping"] == body["meta"]["palette"]
+        assert body["meta"]["counts"] == {"1": 6, "2": 6}
+        HistoryLevelModel(**level)
+
+        saved = client.post(
+            "/image/convert/level?cols=6&rows=2&save=true",
+            files={"file": ("castle.png", STRIPES_PNG, "image/png")},
+            data={"name": "Level 7", "difficulty": "Easy"},
+        )
+        assert saved.status_code == 200
+        body = saved.json()
+        doc = histories.docs[0]
+        assert body["history"]["id"] == doc["value"]["id"]
+        assert body["level"]["id"] == body["level"]["config"]["id"] == doc["value"]["id"]
+        assert doc["value"]["name"] == "Level 7"
+        assert doc["value"]["level"]["config"]["difficulty"] == "Easy"
+        HistoryItemCreateRequest(**{k: v for k, v in doc.items() if k != "_id"})
+
+        bad = client.post(
+            "/image/convert/level",
+            files={"file": ("castle.png", STRIPES_PNG, "image/png")},
+            data={"difficulty": "Extreme"},
+        )
+        assert bad.status_code == 400
+
+    print("✅ /image/convert/level tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Image Level\n")
+    print("=" * 60)
+
+    test_build_level()
+    test_build_board_any_int_keys()
+    test_convert_level_endpoint()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
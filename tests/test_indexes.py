@@ -0,0 +1,97 @@
+"""
+Test Indexes
+Kiểm tra đối chiếu index lúc startup, tóm tắt explain() và allowlist sort_by của images
+"""
+import asyncio
+
+from app.modules.database import routes
+from app.modules.database.indexes import (
+    INDEXES,
+    ensure_indexes,
+    index_name,
+    summarize_plan,
+)
+
+from conftest import FakeDatabase, make_client
+
+
+def test_ensure_indexes_idempotent():
+    """Lần đầu tạo mọi index, lần sau không đổi; index sai option được tạo lại"""
+    print("🧪 Test ensure_indexes")
+
+    db = FakeDatabase()
+    db["histories"].indexes["legacy_idx"] = {"key": [("foo", 1)], "v": 2}
+
+    async def run():
+        first = await ensure_indexes(db)
+        for collection, indexes in INDEXES.items():
+            names = [index_name(index["keys"]) for index in indexes]
+            assert first[collection]["created"] == names
+            assert first[collection]["failed"] == {}
+        assert first["histories"]["extra"] == ["legacy_idx"]
+        assert "value.id_1" in first["histories"]["created"]
+
+        second = await ensure_indexes(db)
+        assert all(not r["created"] and not r["rebuilt"] for r in second.values())
+
+        # value.id_1 bị tạo tay không unique -> xoá và tạo lại đúng khai báo
+        db["histories"].indexes["value.id_1"] = {"key": [("value.id", 1)], "v": 2}
+        third = await ensure_indexes(db)
+        assert third["histories"]["rebuilt"] == ["value.id_1"]
+        assert db["histories"].indexes["value.id_1"]["unique"] is True
+
+    asyncio.run(run())
+    print("✅ ensure_indexes tests passed")
+
+
+def test_summarize_plan():
+    """Đọc được winning plan dạng classic lẫn SBE (queryPlan)"""
+    print("\n🧪 Test summarize_plan")
+
+    classic = {
+        "queryPlanner": {"winningPlan": {
+            "stage": "LIMIT",
+            "inputStage": {"stage": "FETCH", "inputStage": {
+                "stage": "IXSCAN", "indexName": "updatedAt_1__id_1",
+            }},
+        }},
+        "executionStats": {"totalDocsExamined": 10},
+    }
+    summary = summarize_plan(classic)
+    assert summary["stages"] == ["LIMIT", "FETCH", "IXSCAN"]
+    assert summary["indexes"] == ["updatedAt_1__id_1"]
+    assert summary["collscan"] is False and summary["docs_examined"] == 10
+
+    sbe = {"queryPlanner": {"winningPlan": {"queryPlan": {
+        "stage": "SORT", "inputStage": {"stage": "COLLSCAN"},
+    }}}}
+    summary = summarize_plan(sbe)
+    assert summary["stages"] == ["SORT", "COLLSCAN"] and summary["collscan"] is True
+
+    print("✅ summarize_plan tests passed")
+
+
+def test_list_images_sort_allowlist():
+    """sort_by ngoài allowlist bị từ chối trước khi chạm MongoDB"""
+    print("\n🧪 Test list_images sort_by allowlist")
+
+    client = make_client(routes.router)
+
+    response = client.get("/api/images?sort_by=matrix")
+    assert response.status_code == 400
+    assert "created_at" in response.json()["detail"]
+
+    print("✅ sort_by allowlist tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Indexes\n")
+    print("=" * 60)
+
+    test_ensure_indexes_idempotent()
+    test_summarize_plan()
+    test_list_images_sort_allowlist()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
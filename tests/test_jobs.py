@@ -0,0 +1,285 @@
+"""
+Test Jobs
+Kiểm tra hàng đợi job: tiến độ ghi theo lô vào imports, kết quả, stream trạng thái
+(collection imports/import_results được thay bằng bản giả lập trong RAM)
+"""
+import asyncio
+
+import numpy as np
+
+from app.modules.database import routes as database_routes
+from app.modules.image_converter.level import build_level
+from app.modules.jobs import routes as jobs_routes
+from app.modules.jobs import service as jobs_service
+from app.modules.jobs.service import JobManager, import_history_item
+
+from conftest import (
+    RED, FakeCollection, fake_palettes, make_client, make_solid_image, use_collection,
+)
+
+
+class FakeImports:
+    """Thay cho các hàm imports của database_service"""
+
+    def __init__(self):
+        self.docs = {}
+        self.updates = []
+
+    async def create_import(self, data):
+        doc = {**data.model_dump(), "_id": str(len(self.docs) + 1), "status": "pending",
+               "processed_items": 0, "failed_items": 0}
+        self.docs[doc["_id"]] = doc
+        return dict(doc)
+
+    async def get_import(self, import_id):
+        doc = self.docs.get(import_id)
+        return dict(doc) if doc else None
+
+    async def update_import_status(self, import_id, status, processed_items=None,
+                                   failed_items=None, error_message=None):
+        self.updates.append((status, processed_items, failed_items))
+        doc = self.docs[import_id]
+        doc["status"] = status
+        if processed_items is not None:
+            doc["processed_items"] = processed_items
+        if failed_items is not None:
+            doc["failed_items"] = failed_items
+        if error_message is not None:
+            doc["error_message"] = error_message
+        return dict(doc)
+
+
+def make_manager(monkey_db: FakeImports, results: FakeCollection) -> JobManager:
+    jobs_service.database_service = monkey_db
+    manager = JobManager(workers=1, max_queue=2, progress_batch=4, progress_interval=60)
+    manager._results = lambda: results
+    return manager
+
+
+async def square_or_fail(item: dict) -> dict:
+    """Runner thử: item âm thì lỗi"""
+    await asyncio.sleep(0)
+    if item["value"] < 0:
+        raise ValueError("negative")
+    return {"result": {"square": item["value"] ** 2}}
+
+
+def test_job_progress_batched_and_results_stored():
+    """Tiến độ ghi theo lô, status cuối là completed kèm số item lỗi"""
+    print("🧪 Test job progress")
+
+    original = jobs_service.database_service
+    imports, results = FakeImports(), FakeCollection()
+
+    async def run():
+        manager = make_manager(imports, results)
+        items = [{"value": v} for v in [1, 2, -3, 4, 5, 6, 7, -8, 9, 10]]
+        doc = await manager.submit("test", "api", items, square_or_fail)
+
+        statuses = []
+        async for snapshot in manager.stream(doc["_id"], heartbeat=5):
+            if snapshot is not None:
+                statuses.append(snapshot["status"])
+        await manager.shutdown()
+        return doc["_id"], statuses
+
+    try:
+        job_id, statuses = asyncio.run(run())
+    finally:
+        jobs_service.database_service = original
+
+    final = imports.docs[job_id]
+    assert final["status"] == "completed"
+    assert final["processed_items"] == 10 and final["failed_items"] == 2
+    assert statuses[-1] == "completed"
+
+    # 10 item, lô 4 -> 3 lần ghi kết quả, ít hơn nhiều so với mỗi item một lần
+    assert results.calls.count("insert_many") == 3
+    progress_writes = [u for u in imports.updates if u[0] == "processing" and u[1]]
+    assert len(progress_writes) == 2
+
+    by_index = {doc["index"]: doc for doc in results.docs}
+    assert sorted(by_index) == list(range(10))
+    assert by_index[0]["result"] == '{"square":1}'
+    assert by_index[2]["success"] is False and by_index[2]["error"] == "negative"
+
+    print("✅ Job progress tests passed")
+
+
+def test_job_queue_limit_and_shutdown():
+    """Hàng đợi đầy thì từ chối, job chưa xong bị đánh dấu failed khi shutdown"""
+    print("\n🧪 Test job queue limit")
+
+    original = jobs_service.database_service
+    imports, results = FakeImports(), FakeCollection()
+
+    async def run():
+        blocker = asyncio.Event()
+
+        async def wait_forever(item: dict) -> dict:
+            await blocker.wait()
+            return {}
+
+        manager = make_manager(imports, results)
+        await manager.submit("test", "api", [{}], wait_forever)
+        await asyncio.sleep(0.01)  # worker lấy job đầu tiên
+        await manager.submit("test", "api", [{}], wait_forever)
+        await manager.submit("test", "api", [{}], wait_forever)
+        try:
+            await manager.submit("test", "api", [{}], wait_forever)
+            raise AssertionError("Hàng đợi đầy phải bị từ chối")
+        except jobs_service.JobQueueFullError:
+            pass
+
+        await manager.shutdown()
+
+    try:
+        asyncio.run(run())
+    finally:
+        jobs_service.database_service = original
+
+    assert len(imports.docs) == 3
+    assert all(doc["status"] == "failed" for doc in imports.docs.values())
+
+    print("✅ Job queue tests passed")
+
+
+def test_job_queued_bytes_limit():
+    """Tổng bytes ảnh chưa xử lý bị giới hạn, item xong thì trả lại chỗ"""
+    print("\n🧪 Test job queued bytes limit")
+
+    original = jobs_service.database_service
+    imports, results = FakeImports(), FakeCollection()
+
+    async def run():
+        blocker = asyncio.Event()
+
+        async def wait_for_blocker(item: dict) -> dict:
+            await blocker.wait()
+            return {}
+
+        manager = make_manager(imports, results)
+        manager.max_queued_bytes = 10
+        doc = await manager.submit(
+            "test", "api", [{"data": b"abcdef"}, {"data": b"ghij"}], wait_for_blocker
+        )
+        assert manager.queued_bytes == 10
+        try:
+            await manager.submit("test", "api", [{"data": b"x"}], wait_for_blocker)
+            raise AssertionError("Vượt max_queued_bytes phải bị từ chối")
+        except jobs_service.JobQueueFullError:
+            pass
+
+        blocker.set()
+        async for _ in manager.stream(doc["_id"], heartbeat=5):
+            pass
+        assert manager.queued_bytes == 0
+        await manager.submit("test", "api", [{"data": b"0123456789"}], wait_for_blocker)
+        await manager.shutdown()
+
+    try:
+        asyncio.run(run())
+    finally:
+        jobs_service.database_service = original
+
+    assert len(imports.docs) == 2
+
+    print("✅ Job queued bytes tests passed")
+
+
+def test_convert_job_rejected_when_bytes_full():
+    """/jobs/convert trả 503 khi ảnh upload vượt chỗ còn lại của hàng đợi"""
+    print("\n🧪 Test /jobs/convert queued bytes limit")
+
+    original = jobs_service.job_manager.max_queued_bytes
+    jobs_service.job_manager.max_queued_bytes = 10
+    try:
+        client = make_client(jobs_routes.router)
+        data = make_solid_image(8, 8, RED)
+        response = client.post("/jobs/convert", files=[("files", ("a.png", data, "image/png"))])
+        assert response.status_code == 503
+    finally:
+        jobs_service.job_manager.max_queued_bytes = original
+
+    print("✅ /jobs/convert queued bytes tests passed")
+
+
+def test_imported_history_editable_by_api():
+    """History của job import có value.id như POST /api/histories: đổi tên, xoá được"""
+    print("\n🧪 Test imported history rename/delete")
+
+    level = build_level(np.array([[1, 2], [2, 1]]), {1: 2, 2: 2},
+                        {1: "#ff0000", 2: "#00ff00"}, "level")
+    with use_collection("histories", FakeCollection()) as histories:
+        result = asyncio.run(import_history_item({"value": {"name": "Imported", "level": level}}))
+        doc = histories.docs[0]
+        history_id = doc["value"]["id"]
+        assert result == {"history_id": str(doc["_id"]), "id": history_id}
+        assert doc["key"] == "history" and doc["timestamp"]
+        assert doc["value"]["level"]["id"] == history_id
+        assert doc["value"]["level"]["config"]["id"] == history_id
+        assert doc["value"]["createdAt"] and doc["nameSort"]
+
+        client = make_client(database_routes.router)
+
+        response = client.put(f"/api/histories/{history_id}/name", json={"name": "Renamed"})
+        assert response.status_code == 200
+        assert doc["value"]["name"] == "Renamed"
+
+        assert client.delete(f"/api/histories/{history_id}").status_code == 200
+        assert histories.docs == []
+
+    print("✅ Imported history rename/delete tests passed")
+
+
+def test_convert_job_palette_registry():
+    """/jobs/convert nhận palette_id/palette_override như /image/convert/batch"""
+    print("\n🧪 Test /jobs/convert palette_id + palette_override")
+
+    files = [("files", ("a.png", make_solid_image(4, 4, RED), "image/png"))]
+
+    docs = {"p1": {"_id": "p1", "colors": {"4": "#ff0000", "5": "#00ff00"}}}
+    submitted = []
+
+    async def fake_submit(kind, source, items, runner, metadata=None):
+        submitted.append(items)
+        return {"_id": "job-1"}
+
+    jobs_service.job_manager.submit = fake_submit
+    try:
+        with fake_palettes(docs):
+            client = make_client(jobs_routes.router)
+
+            response = client.post("/jobs/convert", files=files,
+                                   data={"palette_id": "p1", "palette_override": "5"})
+            assert response.status_code == 202, response.text
+            assert submitted[-1][0]["palette"] == {5: "#00ff00"}
+
+            response = client.post("/jobs/convert", files=files, data={"palette_id": "p1"})
+            assert submitted[-1][0]["palette"] == {4: "#ff0000", 5: "#00ff00"}
+
+            assert client.post("/jobs/convert", files=files,
+                               data={"palette_id": "missing"}).status_code == 404
+            assert client.post("/jobs/convert", files=files,
+                               data={"palette_id": "p1", "palette": '{"1": "#ffffff"}'}
+                               ).status_code == 400
+    finally:
+        del jobs_service.job_manager.submit
+
+    print("✅ /jobs/convert palette registry tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Jobs\n")
+    print("=" * 60)
+
+    test_job_progress_batched_and_results_stored()
+    test_job_queue_limit_and_shutdown()
+    test_job_queued_bytes_limit()
+    test_convert_job_rejected_when_bytes_full()
+    test_imported_history_editable_by_api()
+    test_convert_job_palette_registry()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
@@ -0,0 +1,115 @@
+"""
+Test Keyset Pagination
+Kiểm tra cursor token (khóa sort + _id) và filter range cho trang sau
+"""
+from bson import ObjectId
+
+from app.modules.database import routes
+from app.modules.database.pagination import (
+    decode_cursor,
+    encode_cursor,
+    merge_filters,
+    next_cursor,
+    sort_spec,
+)
+
+from conftest import FakeCollection, make_client, matches, sort_docs, use_collection
+
+
+def run_query(docs, query, sort, limit):
+    return sort_docs([doc for doc in docs if matches(doc, query)], sort)[:limit]
+
+
+def test_cursor_round_trip():
+    """Token là base64url, decode ra range query trên (field, _id)"""
+    print("🧪 Test cursor round trip")
+
+    sort = sort_spec("updatedAt", -1)
+    last = {"_id": ObjectId(), "updatedAt": "2025-09-25T04:59:57"}
+    token = encode_cursor({**last, "_id": str(last["_id"])}, sort)
+    assert all(c.isalnum() or c in "-_" for c in token)
+
+    query = decode_cursor(token, sort)
+    assert query == {"$or": [
+        {"updatedAt": {"$lt": last["updatedAt"]}},
+        {"updatedAt": last["updatedAt"], "_id": {"$lt": last["_id"]}},
+        {"updatedAt": None},
+    ]}
+    assert merge_filters({"value.name": "x"}, query) == {"$and": [{"value.name": "x"}, query]}
+
+    for bad_token, bad_sort in (
+        ("not-a-cursor", sort),
+        (token, sort_spec("updatedAt", 1)),
+        (token, sort_spec("nameSort", -1)),
+    ):
+        try:
+            decode_cursor(bad_token, bad_sort)
+            raise AssertionError("Expected ValueError")
+        except ValueError:
+            pass
+
+    print("✅ Cursor round trip tests passed")
+
+
+def test_pages_cover_everything_once():
+    """Đi hết các trang bằng cursor = đúng thứ tự sort, kể cả khóa trùng và null"""
+    print("\n🧪 Test keyset pages")
+
+    names = ["b", "a", None, "c", "a", "b", None, "d", "a", "e", "c"]
+    docs = [{"_id": ObjectId(), "nameSort": name} for name in names]
+
+    for direction in (1, -1):
+        sort = sort_spec("nameSort", direction)
+        expected = run_query(docs, {}, sort, len(docs))
+
+        pages, token = [], None
+        while True:
+            query = decode_cursor(token, sort) if token else {}
+            page = run_query(docs, query, sort, 3)
+            pages.extend(page)
+            token = next_cursor(page, 3, sort)
+            if token is None:
+                break
+        assert [d["_id"] for d in pages] == [d["_id"] for d in expected], direction
+
+    assert next_cursor([], 3, sort_spec("nameSort", 1)) is None
+
+    print("✅ Keyset page tests passed")
+
+
+def test_imports_route_has_more():
+    """/api/imports: trang cuối vừa đủ limit không báo has_more"""
+    print("\n🧪 Test /api/imports has_more")
+
+    docs = [{"_id": ObjectId(), "started_at": f"2024-01-0{i}"} for i in range(1, 5)]
+    with use_collection("imports", FakeCollection(docs)):
+        client = make_client(routes.router)
+
+        first = client.get("/api/imports?limit=2").json()["data"]
+        assert [d["started_at"] for d in first["items"]] == ["2024-01-04", "2024-01-03"]
+        assert first["pagination"]["has_more"] is True
+        token = first["pagination"]["next_cursor"]
+        assert token
+
+        last = client.get(f"/api/imports?limit=2&cursor={token}").json()["data"]
+        assert [d["started_at"] for d in last["items"]] == ["2024-01-02", "2024-01-01"]
+        assert last["pagination"]["has_more"] is False
+        assert last["pagination"]["next_cursor"] is None
+
+        exact = client.get("/api/imports?limit=4").json()["data"]["pagination"]
+        assert exact["has_more"] is False and exact["next_cursor"] is None
+
+    print("✅ /api/imports has_more tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Keyset Pagination\n")
+    print("=" * 60)
+
+    test_cursor_round_trip()
+    test_pages_cover_everything_once()
+    test_imports_route_has_more()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
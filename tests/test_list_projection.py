@@ -0,0 +1,164 @@
+"""
+Test List Projection
+Kiểm tra view=summary / fields của list_images và list_histories
+"""
+import asyncio
+
+from bson import ObjectId
+
+from app.modules.database import routes
+from app.modules.database.pagination import next_cursor, sort_spec
+from app.modules.database.projection import list_projection, parse_fields
+from app.modules.database.service import database_service
+
+from conftest import FakeCollection, make_client, use_collection
+
+
+def make_history(name: str) -> dict:
+    board = [[{"type": "block", "color": "1", "element": None}] * 40 for _ in range(40)]
+    return {
+        "_id": ObjectId(),
+        "key": "history",
+        "value": {
+            "id": f"id-{name}",
+            "name": name,
+            "createdAt": "2024-01-01",
+            "level": {
+                "board": board,
+                "containers": [{"id": "c1", "slots": 3}],
+                "config": {"name": name, "width": 40, "height": 40, "difficulty": "Easy"},
+                "difficultyScore": 12,
+                "solvable": True,
+            },
+        },
+        "updatedAt": "2024-01-02",
+        "nameSort": "1" + name,
+    }
+
+
+def test_list_projection():
+    """fields ưu tiên hơn view, luôn giữ field sort, không trùng path cha/con"""
+    print("\n🧪 Test list_projection")
+
+    sort = sort_spec("nameSort", 1)
+    assert list_projection("full", None, ("name",), sort) is None
+    assert list_projection("summary", None, ("name",), sort) == {"name": 1, "nameSort": 1}
+    assert list_projection("summary", ["cols"], ("name",), sort) == {"cols": 1, "nameSort": 1}
+    assert list_projection("full", ["value", "value.name"], (), sort) == {
+        "nameSort": 1,
+        "value": 1,
+    }
+
+    for view in ("compact", ""):
+        try:
+            list_projection(view, None, (), sort)
+            raise AssertionError(f"view {view!r} phải bị từ chối")
+        except ValueError:
+            pass
+
+    assert parse_fields(None) is None
+    assert parse_fields(" ") is None
+    assert parse_fields("name, value.level.config,") == ["name", "value.level.config"]
+    for bad in ("$where", "value..name", "name;drop", "a.$"):
+        try:
+            parse_fields(bad)
+            raise AssertionError(f"fields {bad!r} phải bị từ chối")
+        except ValueError:
+            pass
+
+    print("✅ list_projection tests passed")
+
+
+def test_list_histories_summary():
+    """view=summary bỏ board/containers nhưng vẫn tạo được next_cursor"""
+    print("\n🧪 Test list_histories view=summary")
+
+    collection = FakeCollection([make_history(name) for name in ("a", "b", "c")])
+    with use_collection("histories", collection):
+        docs = asyncio.run(
+            database_service.list_histories(limit=2, sort_by="name", sort_order="asc",
+                                            view="summary")
+        )
+        level = docs[0]["value"]["level"]
+        assert "board" not in level and "containers" not in level
+        assert level["config"]["width"] == 40 and level["difficultyScore"] == 12
+        assert docs[0]["value"]["name"] == "a" and docs[0]["nameSort"] == "1a"
+        assert next_cursor(docs, 2, database_service.history_sort("name", "asc"))
+
+        docs = asyncio.run(database_service.list_histories(fields=["value.name"]))
+        assert set(docs[0]) == {"_id", "value", "updatedAt"}
+        # Mặc định sort updatedAt rồi _id giảm dần: history thêm sau đứng trước
+        assert [doc["value"] for doc in docs] == [{"name": "c"}, {"name": "b"}, {"name": "a"}]
+        assert collection.projections[-1] == {"updatedAt": 1, "value.name": 1}
+
+        docs = asyncio.run(database_service.list_histories())
+        assert collection.projections[-1] is None
+        assert "board" in docs[0]["value"]["level"]
+
+    print("✅ list_histories summary tests passed")
+
+
+def test_get_history_route_uses_value_id():
+    """GET /histories/{id} nhận value.id như PUT/DELETE, _id là dự phòng"""
+    print("\n🧪 Test GET /api/histories/{history_id}")
+
+    docs = [make_history(name) for name in ("a", "b")]
+    with use_collection("histories", FakeCollection(docs)):
+        client = make_client(routes.router)
+
+        response = client.get("/api/histories/id-b")
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert data["value"]["name"] == "b" and "board" in data["value"]["level"]
+
+        response = client.get(f"/api/histories/{docs[0]['_id']}")
+        assert response.status_code == 200
+        assert response.json()["data"]["value"]["id"] == "id-a"
+
+        assert client.get("/api/histories/id-missing").status_code == 404
+        assert client.get(f"/api/histories/{ObjectId()}").status_code == 404
+
+    print("✅ GET /api/histories/{history_id} tests passed")
+
+
+def test_list_images_summary_route():
+    """Route images: summary không có matrix, view/fields sai trả về 400"""
+    print("\n🧪 Test /api/images view=summary")
+
+    image = {
+        "_id": ObjectId(),
+        "name": "cat",
+        "cols": 30,
+        "rows": 30,
+        "matrix": [[1] * 30 for _ in range(30)],
+        "created_at": "2024-01-01",
+    }
+    with use_collection("images", FakeCollection([image])):
+        client = make_client(routes.router)
+
+        response = client.get("/api/images?view=summary")
+        assert response.status_code == 200
+        item = response.json()["data"]["items"][0]
+        assert "matrix" not in item and item["cols"] == 30 and item["name"] == "cat"
+
+        response = client.get("/api/images?fields=name")
+        assert set(response.json()["data"]["items"][0]) == {"_id", "name", "created_at"}
+
+        assert client.get("/api/images?view=tiny").status_code == 400
+        assert client.get("/api/images?fields=$where").status_code == 400
+
+    print("✅ /api/images summary tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing List Projection\n")
+    print("=" * 60)
+
+    test_list_projection()
+    test_list_histories_summary()
+    test_get_history_route_uses_value_id()
+    test_list_images_summary_route()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
@@ -0,0 +1,162 @@
+"""
+Test List Totals
+Kiểm tra trang + total trong một aggregate ($facet), estimated count khi không
+filter và include_total=false cho infinite scroll
+"""
+import asyncio
+
+from bson import ObjectId
+
+from app.modules.database import routes
+from app.modules.database.pagination import facet_pipeline, sort_spec
+from app.modules.database.service import database_service
+
+from conftest import FakeCollection, make_client, matches, use_collection
+
+
+def make_docs() -> list[dict]:
+    names = ["alpha", "beta", "gamma", "alps", "delta", "alto"]
+    return [
+        {
+            "_id": ObjectId(),
+            "key": "history",
+            "collection": "levels" if i % 2 else "drafts",
+            "document_id": f"doc-{i % 3}",
+            "value": {"name": name, "level": {"board": [[{}]], "config": {"name": name}}},
+            "nameSort": "1" + name,
+            "updatedAt": f"2024-01-0{i + 1}",
+        }
+        for i, name in enumerate(names)
+    ]
+
+
+def test_facet_pipeline():
+    """$match đứng đầu (dùng index), $project trước $facet để sort document nhỏ"""
+    print("\n🧪 Test facet_pipeline")
+
+    sort = sort_spec("nameSort", 1)
+    pipeline = facet_pipeline({"value.name": "a"}, sort, 0, 11,
+                              {"value.name": 1, "nameSort": 1}, {"nameSort": {"$gt": "1a"}})
+    assert pipeline[0] == {"$match": {"value.name": "a"}}
+    assert pipeline[1] == {"$project": {"value.name": 1, "nameSort": 1}}
+    facet = pipeline[2]["$facet"]
+    assert facet["total"] == [{"$count": "count"}]
+    assert facet["items"] == [
+        {"$match": {"nameSort": {"$gt": "1a"}}},
+        {"$sort": {"nameSort": 1, "_id": 1}},
+        {"$limit": 11},
+    ]
+    pipeline = facet_pipeline({}, sort, 20, 10)
+    assert len(pipeline) == 2
+    assert {"$skip": 20} in pipeline[1]["$facet"]["items"]
+
+    print("✅ facet_pipeline tests passed")
+
+
+def test_list_histories_page_paths():
+    """Có filter + projection: một aggregate; không filter: estimated; không total: chỉ find"""
+    print("\n🧪 Test list_histories_page")
+
+    with use_collection("histories", FakeCollection(make_docs())) as collection:
+        page = asyncio.run(database_service.list_histories_page(
+            limit=2, sort_by="name", sort_order="asc", search="al", view="summary"
+        ))
+        assert collection.calls == ["aggregate"]
+        assert [d["value"]["name"] for d in page["items"]] == ["alpha", "alps"]
+        assert page["total"] == 3 and page["has_more"] and not page["estimated"]
+        assert all(isinstance(d["_id"], str) for d in page["items"])
+
+        collection.calls.clear()
+        page = asyncio.run(database_service.list_histories_page(
+            limit=2, sort_by="name", sort_order="asc", search="al"
+        ))
+        assert sorted(collection.calls) == ["count", "find"]
+        assert page["total"] == 3
+
+        collection.calls.clear()
+        page = asyncio.run(database_service.list_histories_page(limit=4))
+        assert sorted(collection.calls) == ["estimated", "find"]
+        assert page["total"] == 6 and page["estimated"] and page["has_more"]
+
+        collection.calls.clear()
+        page = asyncio.run(database_service.list_histories_page(
+            skip=4, limit=2, search="", include_total=False
+        ))
+        assert collection.calls == ["find"]
+        assert page["total"] is None and not page["has_more"] and len(page["items"]) == 2
+
+    print("✅ list_histories_page tests passed")
+
+
+def test_list_histories_page_path_per_filter():
+    """Chỉ regex search (kèm projection) dùng $facet; filter có index dùng find + count"""
+    print("\n🧪 Test list_histories_page path per filter shape")
+
+    cases = [
+        ({}, ["estimated", "find"]),
+        ({"collection": "levels"}, ["count", "find"]),
+        ({"document_id": "doc-1"}, ["count", "find"]),
+        ({"collection": "levels", "document_id": "doc-1"}, ["count", "find"]),
+        ({"search": "al"}, ["aggregate"]),
+        ({"search": "al", "collection": "drafts"}, ["aggregate"]),
+        ({"search": "al", "document_id": "doc-0"}, ["aggregate"]),
+    ]
+
+    with use_collection("histories", FakeCollection(make_docs())) as collection:
+        for filters, expected in cases:
+            for view, fields in (("summary", None), ("full", ["value.name"])):
+                collection.calls.clear()
+                page = asyncio.run(database_service.list_histories_page(
+                    limit=2, view=view, fields=fields, **filters
+                ))
+                assert sorted(collection.calls) == expected, (filters, view, collection.calls)
+                query = database_service.history_filter(**filters)
+                assert page["total"] == sum(matches(doc, query) for doc in collection.docs)
+
+            collection.calls.clear()
+            asyncio.run(database_service.list_histories_page(limit=2, **filters))
+            if filters:
+                assert sorted(collection.calls) == ["count", "find"], filters
+
+            collection.calls.clear()
+            asyncio.run(database_service.list_histories_page(
+                limit=2, view="summary", include_total=False, **filters
+            ))
+            assert collection.calls == ["find"], filters
+
+    print("✅ list_histories_page path tests passed")
+
+
+def test_histories_route_pagination():
+    """Route: has_more/next_cursor theo document thừa, include_total=false bỏ total"""
+    print("\n🧪 Test /api/histories pagination block")
+
+    with use_collection("histories", FakeCollection(make_docs())):
+        client = make_client(routes.router)
+
+        pagination = client.get("/api/histories?limit=3&search=al&view=summary").json()[
+            "data"]["pagination"]
+        assert pagination["total"] == 3 and pagination["total_estimated"] is False
+        assert pagination["has_more"] is False and pagination["next_cursor"] is None
+
+        pagination = client.get(
+            "/api/histories?limit=5&sort_by=name&sort_order=asc&include_total=false"
+        ).json()["data"]["pagination"]
+        assert pagination["total"] is None
+        assert pagination["has_more"] is True and pagination["next_cursor"]
+
+    print("✅ /api/histories pagination tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing List Totals\n")
+    print("=" * 60)
+
+    test_facet_pipeline()
+    test_list_histories_page_paths()
+    test_list_histories_page_path_per_filter()
+    test_histories_route_pagination()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
@@ -0,0 +1,91 @@
+"""
+Test Matrix Packing
+Kiểm tra định dạng packed (base64, 4/8/16-bit, RLE) của matrix
+"""
+import json
+
+import numpy as np
+
+from app.modules.image_converter.packing import pack_matrix, unpack_matrix
+from app.modules.image_converter.service import image_converter_service
+
+from conftest import make_png
+
+
+def roundtrip(matrix: np.ndarray, rle: bool) -> dict:
+    """Pack rồi unpack, kiểm tra khớp matrix gốc"""
+    rows, cols = matrix.shape
+    encoding, data = pack_matrix(matrix, rle)
+    restored = unpack_matrix(data, encoding, cols, rows)
+    assert np.array_equal(restored, matrix), (encoding, matrix, restored)
+    return encoding
+
+
+def test_pack_roundtrip_bit_widths():
+    """Chọn đúng số bit theo index lớn nhất và giải mã lại chính xác"""
+    print("🧪 Test pack bit widths")
+
+    rng = np.random.default_rng(0)
+    for high, expected_bits in ((12, 4), (16, 4), (17, 8), (256, 8), (257, 16), (65536, 16)):
+        # Số ô lẻ để kiểm tra nibble đệm của định dạng 4-bit
+        matrix = rng.integers(0, high, size=(7, 9))
+        matrix[3, 4] = high - 1
+        for rle in (False, True):
+            encoding = roundtrip(matrix, rle)
+            assert encoding["bits"] == expected_bits
+            assert encoding["rle"] is rle
+        print(f"   max<{high}: {expected_bits}-bit ✓")
+
+    print("✅ Bit width tests passed")
+
+
+def test_rle_long_runs():
+    """Run dài hơn 127 dùng nhiều byte ULEB128"""
+    print("\n🧪 Test RLE long runs")
+
+    matrix = np.zeros((100, 100), dtype=np.int64)
+    matrix[40:, :] = 3
+    matrix[99, 99] = 5
+    encoding = roundtrip(matrix, True)
+    assert encoding["length"] == "uleb128"
+
+    _, data = pack_matrix(matrix, rle=True)
+    # 3 run: (0 x 4000), (3 x 5999), (5 x 1) -> 1+2, 1+2, 1+1 bytes
+    assert len(data) == len("AAAAAAAAAA==")
+
+    print("✅ RLE tests passed")
+
+
+def test_convert_image_packed_matches_json():
+    """convert_image với format packed cho cùng matrix như JSON"""
+    print("\n🧪 Test convert_image packed")
+
+    image_data = make_png(80, 64, seed=1)
+
+    plain = image_converter_service.convert_image(image_data, 40, 30)
+    for rle in (False, True):
+        packed = image_converter_service.convert_image(
+            image_data, 40, 30, matrix_format="packed", rle=rle
+        )
+        assert "matrix" not in packed
+        encoding = packed["meta"]["encoding"]
+        assert encoding["bits"] == 4  # palette mặc định 12 màu
+        restored = unpack_matrix(packed["data"], encoding, 40, 30)
+        assert restored.tolist() == plain["matrix"]
+
+        json_size = len(json.dumps(plain["matrix"]))
+        print(f"   rle={rle}: {len(packed['data'])} bytes vs JSON {json_size} bytes")
+
+    try:
+        image_converter_service.convert_image(image_data, 4, 4, matrix_format="xml")
+        assert False, "format không hợp lệ phải lỗi"
+    except ValueError:
+        pass
+
+    print("✅ convert_image packed tests passed")
+
+
+if __name__ == "__main__":
+    test_pack_roundtrip_bit_widths()
+    test_rle_long_runs()
+    test_convert_image_packed_matches_json()
@@ -0,0 +1,113 @@
+"""
+Test Palette Registry
+Kiểm tra palette_override, palette theo id (cache + invalidation) và /image/convert
+"""
+import asyncio
+
+from app.config import settings
+from app.modules.image_converter import routes
+from app.modules.image_converter.palette import palette_hash
+from app.modules.image_converter.registry import PaletteNotFoundError, PaletteRegistry
+from app.modules.image_converter.utils import parse_palette_override
+
+from conftest import BLUE, GREEN, RED, fake_palettes, make_client, make_stripes_png, thread_executor
+
+
+def test_parse_palette_override():
+    """Hỗ trợ "1,3" và "[1,3]", giữ thứ tự palette gốc, báo lỗi index lạ"""
+    print("🧪 Test parse_palette_override")
+
+    base = settings.default_palette
+    assert parse_palette_override("3,1", base) == {1: base[1], 3: base[3]}
+    assert parse_palette_override("[1, 5, 7]", base) == {1: base[1], 5: base[5], 7: base[7]}
+    assert parse_palette_override(" ", base) is None
+
+    for bad in ("1,99", "abc,def", "[]", '{"1": 2}'):
+        try:
+            parse_palette_override(bad, base)
+            raise AssertionError(f"Expected ValueError for {bad}")
+        except ValueError:
+            pass
+
+    print("✅ parse_palette_override tests passed")
+
+
+def test_registry_cache_and_invalidation():
+    """Palette theo id đọc MongoDB một lần, đọc lại sau invalidate hoặc hết ttl"""
+    print("\n🧪 Test PaletteRegistry")
+
+    docs = {"p1": {"_id": "p1", "colors": {"2": "#000000", "1": "#ffffff"}}}
+    with fake_palettes(docs) as reads:
+        registry = PaletteRegistry(ttl=60)
+
+        async def run():
+            palette, key = await registry.resolve("p1")
+            assert list(palette.items()) == [(2, "#000000"), (1, "#ffffff")]
+            assert key == palette_hash(palette)
+            await registry.resolve("p1")
+            assert reads == ["p1"]
+
+            subset, subset_key = await registry.resolve("p1", "1")
+            assert subset == {1: "#ffffff"} and subset_key != key
+
+            docs["p1"]["colors"] = {"1": "#ff0000"}
+            registry.invalidate("p1")
+            palette, _ = await registry.resolve("p1")
+            assert palette == {1: "#ff0000"} and reads == ["p1", "p1"]
+
+            default, default_key = await registry.resolve()
+            assert default is settings.default_palette
+            assert default_key == palette_hash(settings.default_palette)
+
+            try:
+                await registry.resolve("missing")
+                raise AssertionError("Expected PaletteNotFoundError")
+            except PaletteNotFoundError:
+                pass
+
+        asyncio.run(run())
+
+    print("✅ PaletteRegistry tests passed")
+
+
+def test_convert_with_palette_override():
+    """/image/convert chỉ dùng các màu trong palette_override"""
+    print("\n🧪 Test /image/convert palette_override")
+
+    data = make_stripes_png([RED, GREEN, BLUE])
+
+    with thread_executor():
+        client = make_client(routes.router)
+
+        response = client.post(
+            "/image/convert?cols=9&rows=3",
+            files={"file": ("a.png", data, "image/png")},
+            data={"palette_override": "1,3"},
+        )
+        assert response.status_code == 200
+        body = response.json()
+        # Xanh dương cách đều đỏ và xanh lá -> lấy màu đứng trước (1)
+        assert body["matrix"][0] == [1, 1, 1, 3, 3, 3, 1, 1, 1]
+        assert set(body["meta"]["palette"]) == {"1", "3"}
+
+        bad = client.post(
+            "/image/convert",
+            files={"file": ("a.png", data, "image/png")},
+            data={"palette_override": "1,99"},
+        )
+        assert bad.status_code == 400
+
+    print("✅ palette_override route tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Palette Registry\n")
+    print("=" * 60)
+
+    test_parse_palette_override()
+    test_registry_cache_and_invalidation()
+    test_convert_with_palette_override()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
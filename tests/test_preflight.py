@@ -0,0 +1,128 @@
+"""
+Test Preflight
+Kiểm tra nhận dạng magic bytes, ngân sách pixel đọc từ header và giới hạn lưới
+"""
+from io import BytesIO
+
+from app.config import settings
+from app.modules.image_converter import routes
+from app.modules.image_converter.preflight import (
+    ImageTooLargeError,
+    check_grid,
+    preflight_image,
+    sniff_image_type,
+)
+
+from conftest import make_client, make_solid_image, thread_executor
+
+
+def test_sniff_image_type():
+    """Nhận dạng PNG/JPEG/WebP theo nội dung, bỏ qua dữ liệu lạ"""
+    print("🧪 Test sniff_image_type")
+
+    assert sniff_image_type(make_solid_image(4, 4, format="PNG")[:16]) == "image/png"
+    assert sniff_image_type(make_solid_image(4, 4, format="JPEG")[:16]) == "image/jpeg"
+    assert sniff_image_type(make_solid_image(4, 4, format="WEBP")[:16]) == "image/webp"
+    assert sniff_image_type(b"RIFF\x00\x00\x00\x00WAVEfmt ") is None
+    assert sniff_image_type(b"<svg xmlns=...") is None
+
+    print("✅ sniff_image_type tests passed")
+
+
+def test_preflight_pixel_budget():
+    """Ảnh vượt ngân sách pixel bị chặn chỉ từ header, không decode"""
+    print("\n🧪 Test preflight pixel budget")
+
+    info = preflight_image(BytesIO(make_solid_image(40, 30)))
+    assert info == {"content_type": "image/png", "width": 40, "height": 30}
+
+    original = settings.max_image_pixels
+    settings.max_image_pixels = 100
+    try:
+        source = BytesIO(make_solid_image(40, 30))
+        try:
+            preflight_image(source)
+            raise AssertionError("Expected ImageTooLargeError")
+        except ImageTooLargeError:
+            pass
+        assert source.tell() == 0
+    finally:
+        settings.max_image_pixels = original
+
+    try:
+        preflight_image(BytesIO(b"\x89PNG\r\n\x1a\n" + b"\x00" * 20))
+        raise AssertionError("Expected ValueError")
+    except ValueError:
+        pass
+
+    print("✅ Pixel budget tests passed")
+
+
+def test_check_grid():
+    """cols/rows phải >= 1 và cols x rows không vượt max_grid_cells"""
+    print("\n🧪 Test check_grid")
+
+    check_grid(30, 30)
+    for cols, rows in ((0, 10), (10, -1), (settings.max_grid_cells, 2)):
+        try:
+            check_grid(cols, rows)
+            raise AssertionError(f"Expected ValueError for {cols}x{rows}")
+        except ValueError:
+            pass
+
+    print("✅ check_grid tests passed")
+
+
+def test_convert_route_preflight():
+    """/image/convert tin nội dung file hơn content_type, trả 413/400 khi vượt ngân sách"""
+    print("\n🧪 Test /image/convert preflight")
+
+    with thread_executor():
+        client = make_client(routes.router)
+        image = make_solid_image(20, 20)
+
+        # PNG gửi kèm content_type sai vẫn được nhận theo magic bytes
+        response = client.post(
+            "/image/convert?cols=10&rows=10",
+            files={"file": ("a.bin", image, "application/octet-stream")},
+        )
+        assert response.status_code == 200
+
+        fake = client.post(
+            "/image/convert",
+            files={"file": ("a.png", b"not an image at all", "image/png")},
+        )
+        assert fake.status_code == 400
+
+        too_many_cells = client.post(
+            f"/image/convert?cols={settings.max_grid_cells}&rows=2",
+            files={"file": ("a.png", image, "image/png")},
+        )
+        assert too_many_cells.status_code == 400
+
+        original_pixels = settings.max_image_pixels
+        settings.max_image_pixels = 100
+        try:
+            too_large = client.post(
+                "/image/convert",
+                files={"file": ("a.png", image, "image/png")},
+            )
+            assert too_large.status_code == 413
+        finally:
+            settings.max_image_pixels = original_pixels
+
+    print("✅ Preflight route tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Preflight\n")
+    print("=" * 60)
+
+    test_sniff_image_type()
+    test_preflight_pixel_budget()
+    test_check_grid()
+    test_convert_route_preflight()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
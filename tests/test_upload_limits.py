@@ -0,0 +1,100 @@
+"""
+Test Upload Limits
+Kiểm tra đọc upload theo chunk và middleware giới hạn body
+"""
+import asyncio
+import hashlib
+import io
+
+from fastapi import HTTPException, UploadFile
+
+from app.modules.image_converter.upload import (
+    BodySizeLimitMiddleware,
+    UploadTooLargeError,
+    read_upload,
+)
+
+
+def test_read_upload_within_limit():
+    """File nhỏ hơn giới hạn trả về file object ở vị trí đầu"""
+    print("🧪 Test read_upload within limit")
+
+    upload = UploadFile(io.BytesIO(b"x" * 1000))
+    source, size, digest = asyncio.run(read_upload(upload, 1000))
+    assert size == 1000
+    assert source.read() == b"x" * 1000
+    assert digest == hashlib.sha256(b"x" * 1000).hexdigest()
+
+    print("✅ Within limit tests passed")
+
+
+def test_read_upload_aborts_over_limit():
+    """File vượt giới hạn bị từ chối (kể cả khi không biết trước kích thước)"""
+    print("\n🧪 Test read_upload over limit")
+
+    for size in (1001, None):
+        upload = UploadFile(io.BytesIO(b"x" * 1001), size=size)
+        try:
+            asyncio.run(read_upload(upload, 1000))
+            raise AssertionError("Expected UploadTooLargeError")
+        except UploadTooLargeError:
+            pass
+
+    print("✅ Over limit tests passed")
+
+
+def run_middleware(headers: list, chunks: list[bytes]) -> list:
+    """Gọi BodySizeLimitMiddleware với app đọc hết body, trả về messages đã gửi"""
+    sent = []
+
+    async def app(scope, receive, send):
+        more = True
+        while more:
+            message = await receive()
+            more = message.get("more_body", False)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def receive():
+        body = chunks.pop(0)
+        return {"type": "http.request", "body": body, "more_body": bool(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = BodySizeLimitMiddleware(app, limits={"/upload": 10})
+    scope = {"type": "http", "path": "/upload", "headers": headers}
+    asyncio.run(middleware(scope, receive, send))
+    return sent
+
+
+def test_middleware_limits():
+    """Middleware từ chối theo Content-Length và khi đếm body vượt giới hạn"""
+    print("\n🧪 Test BodySizeLimitMiddleware")
+
+    sent = run_middleware([(b"content-length", b"11")], [b"x" * 11])
+    assert sent[0]["status"] == 413
+
+    sent = run_middleware([], [b"x" * 5, b"x" * 5])
+    assert sent[0]["status"] == 200
+
+    try:
+        run_middleware([], [b"x" * 6, b"x" * 6])
+        raise AssertionError("Expected HTTPException")
+    except HTTPException as e:
+        assert e.status_code == 413
+
+    print("✅ Middleware tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Upload Limits\n")
+    print("=" * 60)
+
+    test_read_upload_within_limit()
+    test_read_upload_aborts_over_limit()
+    test_middleware_limits()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)
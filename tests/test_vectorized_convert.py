@@ -0,0 +1,69 @@
+"""
+Test Vectorized Conversion
+Đối chiếu convert_image (vectorized) với bản tham chiếu duyệt từng pixel
+"""
+from app.modules.image_converter.service import image_converter_service
+
+from conftest import make_png, make_solid_image
+
+
+def test_random_images_match_reference():
+    """Ảnh ngẫu nhiên với palette mặc định cho kết quả giống hệt bản tham chiếu"""
+    print("🧪 Test vectorized vs reference (random images)")
+
+    for seed, (cols, rows) in enumerate([(30, 30), (17, 5), (1, 1), (64, 48)]):
+        data = make_png(80, 60, seed)
+        fast = image_converter_service.convert_image(data, cols, rows)
+        slow = image_converter_service.convert_image_reference(data, cols, rows)
+        assert fast == slow, f"Mismatch at seed={seed} size={cols}x{rows}"
+
+    print("✅ Random image tests passed")
+
+
+def test_tie_breaking_follows_palette_order():
+    """Khi hai màu cách đều, chọn màu đứng trước trong palette"""
+    print("\n🧪 Test tie-breaking order")
+
+    # (1, 1, 1) cách đều #000000 và #020202
+    data = make_solid_image(4, 4, (1, 1, 1))
+
+    palette = {5: "#000000", 3: "#020202"}
+    fast = image_converter_service.convert_image(data, 2, 2, palette)
+    slow = image_converter_service.convert_image_reference(data, 2, 2, palette)
+    assert fast == slow
+    assert fast["matrix"] == [[5, 5], [5, 5]]
+
+    reversed_palette = {3: "#020202", 5: "#000000"}
+    fast = image_converter_service.convert_image(data, 2, 2, reversed_palette)
+    slow = image_converter_service.convert_image_reference(data, 2, 2, reversed_palette)
+    assert fast == slow
+    assert fast["matrix"] == [[3, 3], [3, 3]]
+
+    print("✅ Tie-breaking tests passed")
+
+
+def test_custom_palette_with_string_keys():
+    """Palette tùy chỉnh dạng JSON (key string) vẫn trả về index int"""
+    print("\n🧪 Test custom palette with string keys")
+
+    data = make_png(20, 20, 42)
+    palette = {"1": "#ff0000", "2": "#00ff00", "3": "#0000ff", "4": "#ffffff"}
+    fast = image_converter_service.convert_image(data, 10, 10, palette)
+    slow = image_converter_service.convert_image_reference(data, 10, 10, palette)
+    assert fast == slow
+    assert set(fast["meta"]["palette"]) <= {1, 2, 3, 4}
+
+    print("✅ Custom palette tests passed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Vectorized Conversion\n")
+    print("=" * 60)
+
+    test_random_images_match_reference()
+    test_tie_breaking_follows_palette_order()
+    test_custom_palette_with_string_keys()
+
+    print("\n" + "=" * 60)
+    print("🎉 All tests passed!")
+    print("=" * 60)